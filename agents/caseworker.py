@@ -4,18 +4,31 @@ Processes layoff posts, determines eligibility, fills forms, and drafts emails
 """
 import os
 import sys
-import zipfile
+import shutil
 import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 from tools.eligibility_engine import eligibility_engine_tool
-from tools.drive_tool import drive_download_adk_tool
-from tools.form_filler import form_filler_adk_tool, extract_info_from_post
-from tools.gmail_tool import gmail_draft_adk_tool
+from tools.drive_tool import cached_drive_download_tool
+from tools.llm_extraction import extract_info, extract_info_batch
+from tools.gmail_tool import (
+    GMAIL_STREAMING_THRESHOLD, create_gmail_draft, create_gmail_draft_from_file, create_gmail_drafts_batch
+)
+from tools.packet_builder import build_packet
 from utils.shared_state import read_shared_state, append_to_shared_state
+from utils.checkpoints import (
+    CHECKPOINT_DIR, case_key, clear_checkpoints, lookup_stage, record_stage, run_stage
+)
+from utils.outbox import drain, enqueue, get_bucket, queued, start_workers
+from utils.step_graph import format_timings, run_step_graph
+from utils import metrics
 
 load_dotenv()
 
+STAGE_SECONDS = metrics.histogram("caseworker_stage_seconds", "Duration of each caseworker stage", ["stage"])
+CASE_SECONDS = metrics.histogram("caseworker_case_seconds", "Time from starting a case to its queued or created draft")
+CASES = metrics.counter("caseworker_cases_total", "Cases by outcome (queued: draft waiting in the outbox)", ["outcome"])
+
 
 def create_email_body(name: str, programs: list, amount: float, state: str) -> str:
     """
@@ -80,13 +93,23 @@ To opt out of future communications, reply with "OPT OUT"
     return body
 
 
-def process_case(linkedin_url: str = None, entry: dict = None):
+def process_case(linkedin_url: str = None, entry: dict = None, defer_draft: bool = False):
     """
     Processes a single case - determines eligibility, fills forms, drafts email.
     
+    With PERSIST_PACKETS=false the packet stays in memory and the draft is
+    created from it right away when Gmail's quota allows. Otherwise, and for
+    persisted packets, the draft is queued in the outbox; the case is marked
+    processed once an outbox worker has created it (see deliver_queued_drafts).
+    
     Args:
         linkedin_url: LinkedIn URL (optional if entry provided)
         entry: Entry dictionary from shared_state (optional)
+        defer_draft: Stop before drafting and return the pending case so the
+            caller can batch drafts (see process_pending_cases)
+    
+    Returns:
+        The pending case when defer_draft is set and the draft is not yet created
     """
     # Get entry from shared_state if not provided
     if not entry:
@@ -107,67 +130,122 @@ def process_case(linkedin_url: str = None, entry: dict = None):
     post_text = entry.get("post_text", entry.get("summary", ""))
     linkedin_url = entry.get("linkedin_url")
     
-    # Step 1: Determine eligibility
-    print(f"[Caseworker] Determining eligibility for {state}...")
-    eligibility_result = eligibility_engine_tool(state, post_text)
-    programs = eligibility_result["programs"]
-    amount = eligibility_result["amount"]
+    # Every stage is checkpointed, so a rerun after a crash resumes at the first incomplete one
+    case = case_key(linkedin_url)
+    folder_id = os.getenv("GOOGLE_DRIVE_FOLDER_ID", "")
+    persist_packets = os.getenv("PERSIST_PACKETS", "true").lower() == "true"
     
-    print(f"[Caseworker] Eligible programs: {programs}")
-    print(f"[Caseworker] Estimated amount: ${amount:,.2f}")
+    # Step 1: Determine eligibility
+    def determine_eligibility(inputs):
+        print(f"[Caseworker] Determining eligibility for {state}...")
+        result = run_stage(
+            case, "eligibility", [state, post_text],
+            lambda: eligibility_engine_tool(state, post_text)
+        )
+        print(f"[Caseworker] Eligible programs: {result['programs']}")
+        print(f"[Caseworker] Estimated amount: ${result['amount']:,.2f}")
+        return result
     
     # Step 2: Extract information from post
-    print(f"[Caseworker] Extracting information from post...")
-    info = extract_info_from_post(post_text, linkedin_url)
+    def extract_information(inputs):
+        print(f"[Caseworker] Extracting information from post...")
+        return run_stage(
+            case, "extraction", [post_text, linkedin_url],
+            lambda: extract_info(post_text, linkedin_url)
+        )
     
     # Step 3: Download PDFs from Google Drive
-    print(f"[Caseworker] Downloading PDF forms for {state}...")
-    drive_result = drive_download_adk_tool.func(
-        folder_id=os.getenv("GOOGLE_DRIVE_FOLDER_ID", ""),
-        state=state,
-        output_dir=f"forms/{state}"
-    )
-    
-    if drive_result["status"] != "success" or not drive_result.get("files"):
-        print(f"[Caseworker] Warning: No PDFs downloaded. Using placeholder.")
-        # Create a placeholder PDF directory structure
-        os.makedirs(f"forms/{state}", exist_ok=True)
-        pdf_files = []
-    else:
-        pdf_files = drive_result["files"]
-    
-    # Step 4: Fill PDF forms
-    print(f"[Caseworker] Filling PDF forms...")
-    filled_pdfs = []
-    
-    for pdf_path in pdf_files:
-        output_path = pdf_path.replace(".pdf", "_filled.pdf")
-        fill_result = form_filler_adk_tool.func(
-            pdf_path=pdf_path,
-            output_path=output_path,
-            name=info["name"],
-            address=info["address"],
-            employer=info["last_employer"],
-            wage=info["last_wage"],
-            email=info.get("email"),
-            phone=info.get("phone")
+    def download_templates():
+        drive_result = cached_drive_download_tool(
+            folder_id=folder_id,
+            state=state,
+            output_dir=f"forms/{state}"
         )
-        
-        if fill_result["status"] == "success":
-            filled_pdfs.append(output_path)
+        if drive_result["status"] != "success" or not drive_result.get("files"):
+            # Failed downloads raise so they are retried rather than checkpointed
+            raise RuntimeError(drive_result.get("message", "No PDFs downloaded"))
+        return drive_result["files"]
+    
+    def fetch_templates(inputs):
+        print(f"[Caseworker] Downloading PDF forms for {state}...")
+        try:
+            return run_stage(
+                case, "templates", [folder_id, state], download_templates,
+                is_valid=lambda files: all(os.path.exists(f) for f in files)
+            )
+        except RuntimeError as e:
+            print(f"[Caseworker] Warning: No PDFs downloaded ({e}). Using placeholder.")
+            # Create a placeholder PDF directory structure
+            os.makedirs(f"forms/{state}", exist_ok=True)
+            return []
     
-    # Step 5: Create zip file
-    print(f"[Caseworker] Creating zip file...")
-    zip_filename = f"benefits_{state}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-    zip_path = f"output/{zip_filename}"
-    os.makedirs("output", exist_ok=True)
+    # Step 4-5: Fill PDF forms straight into a zip packet
+    def build_case_packet(inputs):
+        print(f"[Caseworker] Filling PDF forms and building packet...")
+        info, pdf_files = inputs["extraction"], inputs["templates"]
+        form_data = {
+            "name": info["name"],
+            "address": info["address"],
+            "employer": info["last_employer"],
+            "wage": info["last_wage"],
+            "email": info.get("email"),
+            "phone": info.get("phone")
+        }
+        
+        def fill_packet():
+            zip_filename = f"benefits_{state}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+            zip_path = f"output/{zip_filename}" if persist_packets else None
+            packet = build_packet(pdf_files, form_data, persist_path=zip_path)
+            for error in packet["errors"]:
+                print(f"[Caseworker] Warning: could not fill {error}")
+            result = {
+                "zip_path": zip_path,
+                "zip_filename": zip_filename,
+                "filled": packet["filled"],
+                "size": packet["size"]
+            }
+            if persist_packets:
+                packet["buffer"].close()
+            else:
+                result["buffer"] = packet["buffer"]
+            return result
+        
+        if persist_packets:
+            packet = run_stage(
+                case, "packet", [pdf_files, form_data, persist_packets], fill_packet,
+                is_valid=lambda result: os.path.exists(result["zip_path"])
+            )
+        else:
+            # In-memory packets are not checkpointed: rebuilding one from the checkpointed
+            # extraction and templates is cheap, and it only touches disk if the draft
+            # has to wait in the outbox (see queue_case_draft)
+            packet = fill_packet()
+        print(f"[Caseworker] Built packet: {len(packet['filled'])} form(s), {packet['size']:,} bytes"
+              + (f", saved to {packet['zip_path']}" if packet["zip_path"] else ""))
+        return packet
     
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for pdf_path in filled_pdfs:
-            if os.path.exists(pdf_path):
-                zipf.write(pdf_path, os.path.basename(pdf_path))
+    # Steps 1-3 are independent and run concurrently; the packet waits for 2 and 3
+    report = run_step_graph({
+        "eligibility": ([], determine_eligibility),
+        "extraction": ([], extract_information),
+        "templates": ([], fetch_templates),
+        "packet": (["extraction", "templates"], build_case_packet)
+    })
+    print(f"[Caseworker] Step timings: {format_timings(report)}")
+    for stage, timing in report["timings"].items():
+        STAGE_SECONDS.observe(timing["duration"], stage=stage)
+    CASE_SECONDS.observe(report["elapsed"])
     
-    print(f"[Caseworker] Created zip: {zip_path}")
+    programs = report["results"]["eligibility"]["programs"]
+    amount = report["results"]["eligibility"]["amount"]
+    program_amounts = report["results"]["eligibility"].get("program_amounts", {})
+    info = report["results"]["extraction"]
+    packet = report["results"]["packet"]
+    attachment = packet.pop("buffer", None)
+    if attachment is not None and not packet["filled"]:
+        # Nothing was filled, so there is nothing to attach
+        attachment.close()
+        attachment = None
     
     # Step 6: Draft email
     print(f"[Caseworker] Drafting email...")
@@ -192,31 +270,193 @@ def process_case(linkedin_url: str = None, entry: dict = None):
         state=state
     )
     
-    email_result = gmail_draft_adk_tool.func(
-        to_email=email_address,
-        subject="Your unemployment & benefit forms (auto-generated)",
-        body=email_body,
-        zip_file_path=zip_path if os.path.exists(zip_path) else None
-    )
+    pending = {
+        "entry": entry,
+        "case": case,
+        "amount": amount,
+        "programs": programs,
+        "program_amounts": program_amounts,
+        "packet": packet,
+        "persist_packets": persist_packets,
+        # Stable across reruns (the case key is part of the checkpoint key); the packet's
+        # file name is not, since a packet that was not persisted is rebuilt every run
+        "draft_inputs": [email_address, email_body, packet["filled"]],
+        "draft": {
+            "to_email": email_address,
+            "subject": "Your unemployment & benefit forms (auto-generated)",
+            "body": email_body,
+            "zip_file_path": packet["zip_path"] if packet["filled"] else None,
+            "attachment_name": packet["zip_filename"]
+        },
+        # In-memory packet (PERSIST_PACKETS=false); never written to the outbox
+        "attachment": attachment
+    }
+    
+    checkpoint = lookup_stage(case, "draft", pending["draft_inputs"])
+    if checkpoint:
+        close_attachment(pending)
+        finish_case(pending, checkpoint["result"])
+        return
+    
+    if defer_draft:
+        # The caller creates the draft as part of a batch, then calls finish_case
+        return pending
+    
+    if attachment is not None and packet["size"] <= GMAIL_STREAMING_THRESHOLD and get_bucket("gmail").reserve() == 0:
+        # Hand the in-memory packet straight to Gmail; only a retryable failure touches disk
+        email_result = create_gmail_draft(
+            pending["draft"]["to_email"], pending["draft"]["subject"], pending["draft"]["body"],
+            attachment=attachment, attachment_name=pending["draft"]["attachment_name"]
+        )
+        if not email_result.get("retryable"):
+            close_attachment(pending)
+            finish_case(pending, email_result)
+            return
+        print(f"[Caseworker] Draft deferred to outbox: {email_result.get('message')}")
+    
+    # The outbox sends the draft within Gmail's quota and finishes the case once it exists
+    queue_case_draft(pending)
+    CASES.inc(outcome="queued")
+    print(f"[Caseworker] Email draft queued for delivery")
+
+
+def close_attachment(pending: dict):
+    """Releases a case's in-memory packet"""
+    attachment = pending.pop("attachment", None)
+    if attachment is not None:
+        attachment.close()
+
+
+def queue_case_draft(pending: dict):
+    """
+    Queues a case's draft in the outbox.
+    
+    An in-memory packet is first written next to the case's checkpoints,
+    since the queued draft may be sent by another process or after a
+    restart; finish_case removes it once the draft exists.
     
+    Args:
+        pending: Case state built by process_case
+    """
+    attachment = pending.get("attachment")
+    if attachment is not None:
+        zip_path = os.path.join(CHECKPOINT_DIR, f"{pending['case']}.zip")
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        attachment.seek(0)
+        with open(f"{zip_path}.tmp", 'wb') as f:
+            shutil.copyfileobj(attachment, f)
+        os.replace(f"{zip_path}.tmp", zip_path)
+        pending["draft"]["zip_file_path"] = zip_path
+        close_attachment(pending)
+    enqueue("gmail", {"draft": pending["draft"], "pending": pending}, key=f"{pending['case']}:draft")
+
+
+def send_case_draft(draft: dict, pending: dict) -> dict:
+    """
+    Outbox sender for case drafts: creates the Gmail draft and finishes the case.
+    
+    Args:
+        draft: Draft fields (to_email, subject, body, zip_file_path, attachment_name)
+        pending: Case state built by process_case
+    
+    Returns:
+        Result of creating the draft
+    """
+    email_result = create_gmail_draft_from_file(**draft)
     if email_result["status"] == "success":
-        print(f"[Caseworker] Email draft created: {email_result.get('draft_id')}")
-    else:
+        finish_case(pending, email_result)
+    return email_result
+
+
+def finish_case(pending: dict, email_result: dict):
+    """
+    Records a case's draft result and marks the case processed.
+    
+    Args:
+        pending: Case state returned by process_case(defer_draft=True)
+        email_result: Result of creating the case's Gmail draft
+    """
+    entry = pending["entry"]
+    case = pending["case"]
+    packet = pending["packet"]
+    
+    if email_result["status"] != "success":
+        CASES.inc(outcome="draft_failed")
         print(f"[Caseworker] Email draft error: {email_result.get('message')}")
+        print(f"[Caseworker] Case left pending; the next run resumes at the draft stage.")
+        return
+    
+    if not lookup_stage(case, "draft", pending["draft_inputs"]):
+        record_stage(case, "draft", pending["draft_inputs"], email_result)
+    print(f"[Caseworker] Email draft created: {email_result.get('draft_id')}")
     
     # Update shared state
     entry["status"] = "processed"
-    entry["amount_unlocked"] = amount
-    entry["programs"] = programs
+    entry["amount_unlocked"] = pending["amount"]
+    entry["programs"] = pending["programs"]
+    entry["program_amounts"] = pending.get("program_amounts", {})
     entry["processed_at"] = datetime.utcnow().isoformat()
-    entry["zip_path"] = zip_path
+    entry["zip_path"] = packet["zip_path"] if pending["persist_packets"] else None
+    entry["draft_id"] = email_result.get("draft_id")
     
     # Append updated entry (in production, would update in place)
-    append_to_shared_state(entry)
+    if append_to_shared_state(entry):
+        spilled_path = pending["draft"].get("zip_file_path")
+        if not pending["persist_packets"] and spilled_path and os.path.exists(spilled_path):
+            os.remove(spilled_path)
+        clear_checkpoints(case)
     
+    CASES.inc(outcome="processed")
     print(f"[Caseworker] Case processed successfully!")
 
 
+def process_pending_cases(entries: list):
+    """
+    Processes many cases, creating their Gmail drafts in HTTP batches.
+    
+    Args:
+        entries: Pending entries from shared_state
+    """
+    # One batched model pass warms the extraction cache for every case
+    extract_info_batch([
+        (entry.get("post_text", entry.get("summary", "")), entry.get("linkedin_url"))
+        for entry in entries
+    ])
+    
+    pendings = []
+    for entry in entries:
+        pending = process_case(entry=entry, defer_draft=True)
+        if pending:
+            pendings.append(pending)
+    
+    if not pendings:
+        return
+    
+    print(f"[Caseworker] Creating {len(pendings)} email draft(s) in batches...")
+    results = create_gmail_drafts_batch([
+        dict(pending["draft"], attachment=pending["attachment"]) if pending.get("attachment") else pending["draft"]
+        for pending in pendings
+    ])
+    for pending, email_result in zip(pendings, results):
+        if email_result.get("retryable"):
+            # Quota or server errors: let the outbox retry with backoff
+            print(f"[Caseworker] Draft deferred to outbox: {email_result.get('message')}")
+            queue_case_draft(pending)
+            continue
+        close_attachment(pending)
+        print(f"[Caseworker] Finishing case: {pending['entry'].get('linkedin_url')}")
+        finish_case(pending, email_result)
+
+
+def deliver_queued_drafts():
+    """Sends queued drafts on outbox workers and waits for them, up to OUTBOX_DRAIN_TIMEOUT"""
+    if not queued(["gmail"]):
+        return
+    start_workers(["gmail"])
+    if not drain(["gmail"]):
+        print(f"[Caseworker] Some drafts are still queued; they are sent on the next run")
+
+
 def run_caseworker():
     """Main function to run Caseworker agent"""
     parser = argparse.ArgumentParser(description="Caseworker Agent - Process benefit applications")
@@ -227,18 +467,20 @@ def run_caseworker():
     
     if args.url:
         process_case(linkedin_url=args.url)
+        deliver_queued_drafts()
     elif args.all_pending:
         entries = read_shared_state()
         pending = [e for e in entries if e.get("status") != "processed"]
         print(f"[Caseworker] Processing {len(pending)} pending entries...")
-        for entry in pending:
-            process_case(entry=entry)
+        process_pending_cases(pending)
+        deliver_queued_drafts()
     else:
         # Process most recent pending entry
         entries = read_shared_state()
         pending = [e for e in entries if e.get("status") != "processed"]
         if pending:
             process_case(entry=pending[-1])
+            deliver_queued_drafts()
         else:
             print("[Caseworker] No pending entries to process")
 
@@ -8,12 +8,18 @@ import time
 import feedparser
 import schedule
 from datetime import datetime
+from typing import Callable, Optional
 from dotenv import load_dotenv
 from utils.shared_state import append_to_shared_state
+from utils import metrics
 import subprocess
 
 load_dotenv()
 
+POSTS_FETCHED = metrics.counter("scout_posts_fetched_total", "Posts returned by the news feed")
+POSTS_DEDUPED = metrics.counter("scout_posts_deduped_total", "Fetched posts skipped as already known")
+POSTS_ENQUEUED = metrics.counter("scout_posts_enqueued_total", "New posts added to shared state and handed to a caseworker")
+
 
 def extract_state_from_text(text: str) -> str:
     """
@@ -79,7 +85,8 @@ def fetch_linkedin_layoff_posts() -> list:
     rss_url = "https://news.google.com/rss/search?q=site:linkedin.com/posts+%22laid+off%22&hl=en-US&gl=US&ceid=US:en"
     
     try:
-        feed = feedparser.parse(rss_url)
+        with metrics.api_call("google_news", "rss"):
+            feed = feedparser.parse(rss_url)
         posts = []
         
         for entry in feed.entries[:10]:  # Limit to 10 most recent
@@ -117,9 +124,30 @@ def fetch_linkedin_layoff_posts() -> list:
         return []
 
 
-def process_new_posts():
+def start_caseworker_process(linkedin_url: str):
+    """Starts a caseworker subprocess for one post (used when the scout runs on its own)"""
+    try:
+        # Run caseworker agent
+        subprocess.Popen(
+            ["python", "agents/caseworker.py", "--url", linkedin_url],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+        print(f"[Scout] Triggered Caseworker for {linkedin_url}")
+    except Exception as e:
+        print(f"[Scout] Error triggering Caseworker: {e}")
+
+
+def process_new_posts(on_new_post: Optional[Callable[[dict], None]] = None) -> list:
     """
-    Processes new LinkedIn layoff posts and triggers Agent 2 (Caseworker)
+    Processes new LinkedIn layoff posts and hands them to Agent 2 (Caseworker)
+    
+    Args:
+        on_new_post: Called with each new shared state entry, e.g. to queue it
+            for an in-process caseworker (see agents/supervisor.py); by default
+            a caseworker subprocess is started per post
+    
+    Returns:
+        List of the new entries
     """
     print(f"[Scout] Running at {datetime.utcnow().isoformat()}")
     
@@ -132,7 +160,10 @@ def process_new_posts():
     
     new_posts = [p for p in posts if p["linkedin_url"] not in existing_urls]
     print(f"[Scout] {len(new_posts)} new posts to process")
+    POSTS_FETCHED.inc(len(posts))
+    POSTS_DEDUPED.inc(len(posts) - len(new_posts))
     
+    new_entries = []
     for post in new_posts:
         # Append to shared state
         entry = {
@@ -147,23 +178,23 @@ def process_new_posts():
         
         if append_to_shared_state(entry):
             print(f"[Scout] Added entry for {post['state']}: {post['linkedin_url']}")
+            new_entries.append(entry)
+            POSTS_ENQUEUED.inc()
             
             # Trigger Agent 2 (Caseworker)
-            try:
-                # Run caseworker agent
-                subprocess.Popen(
-                    ["python", "agents/caseworker.py", "--url", post["linkedin_url"]],
-                    cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                )
-                print(f"[Scout] Triggered Caseworker for {post['linkedin_url']}")
-            except Exception as e:
-                print(f"[Scout] Error triggering Caseworker: {e}")
+            if on_new_post:
+                on_new_post(entry)
+            else:
+                start_caseworker_process(post["linkedin_url"])
+    
+    return new_entries
 
 
 def run_scout():
     """Main function to run Scout agent"""
     print("Starting Scout Agent...")
     print("Monitoring LinkedIn layoff posts every 30 minutes")
+    metrics.start_exporters("scout")
     
     # Schedule to run every 30 minutes
     schedule.every(30).minutes.do(process_new_posts)
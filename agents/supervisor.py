@@ -0,0 +1,198 @@
+"""
+Supervisor - Runs Scout, a Caseworker pool and Watchdog in one process
+
+One scheduler drives the scout (every SCOUT_INTERVAL_MINUTES) and the
+watchdog (daily at WATCHDOG_TIME UTC). New posts go from the scout straight
+onto an in-memory case queue served by SUPERVISOR_CASEWORKERS threads, and
+drafts and social posts are delivered by the outbox workers of the same
+process, so tool caches, template caches and API clients are shared by all
+agents instead of being rebuilt per process.
+
+On SIGINT/SIGTERM the supervisor stops scheduling, lets the caseworkers
+finish the queued cases and the outbox deliver what is queued (up to
+SUPERVISOR_DRAIN_TIMEOUT), then exits. Cases still queued at the deadline
+stay pending in shared_state.jsonl and are queued again on the next start.
+"""
+import os
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import schedule
+from dotenv import load_dotenv
+
+from agents.caseworker import process_case
+from agents.scout import process_new_posts
+from agents.watchdog import daily_stats_job
+from utils import metrics
+from utils.outbox import drain, start_workers, stop_workers
+from utils.shared_state import read_shared_state
+
+load_dotenv()
+
+SUPERVISOR_CASEWORKERS = int(os.getenv("SUPERVISOR_CASEWORKERS", "2"))
+SCOUT_INTERVAL_MINUTES = int(os.getenv("SCOUT_INTERVAL_MINUTES", "30"))
+WATCHDOG_TIME = os.getenv("WATCHDOG_TIME", "08:00")
+SUPERVISOR_DRAIN_TIMEOUT = float(os.getenv("SUPERVISOR_DRAIN_TIMEOUT", "300"))
+
+OUTBOX_DESTINATIONS = ["gmail", "twitter", "linkedin"]
+
+
+def pending_entries() -> list:
+    """Returns the latest row of every case in shared_state.jsonl that is not yet processed"""
+    latest: Dict[str, Dict[str, Any]] = {}
+    processed = set()
+    for entry in read_shared_state():
+        url = entry.get("linkedin_url")
+        if entry.get("status") == "processed":
+            processed.add(url)
+        else:
+            latest[url] = entry
+    return [entry for url, entry in latest.items() if url not in processed]
+
+
+class Supervisor:
+    """Hosts the scout, the caseworker pool and the watchdog on one scheduler"""
+
+    def __init__(
+        self,
+        caseworkers: Optional[int] = None,
+        process: Callable[..., Any] = process_case,
+        outbox_destinations: Optional[list] = None
+    ):
+        self.caseworkers = caseworkers or SUPERVISOR_CASEWORKERS
+        self.process = process
+        self.outbox_destinations = OUTBOX_DESTINATIONS if outbox_destinations is None else outbox_destinations
+        self.cases: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self.scheduler = schedule.Scheduler()
+        self.stopping = threading.Event()
+        self.stats = {"queued": 0, "processed": 0, "failed": 0}
+        self._queued_urls = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        metrics.gauge(
+            "supervisor_case_queue_depth", "Cases waiting for a supervisor caseworker",
+            function=self.cases.qsize
+        )
+
+    def submit(self, entry: Dict[str, Any]) -> bool:
+        """Queues a case for the caseworker pool; returns False if it is already queued or stopping"""
+        url = entry.get("linkedin_url")
+        with self._lock:
+            if self.stopping.is_set() or url in self._queued_urls:
+                return False
+            self._queued_urls.add(url)
+            self.stats["queued"] += 1
+        self.cases.put(entry)
+        return True
+
+    def _caseworker(self) -> None:
+        while True:
+            try:
+                entry = self.cases.get(timeout=0.2)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return
+                continue
+            try:
+                self.process(entry=entry)
+                outcome = "processed"
+            except Exception as e:
+                print(f"[Supervisor] Case failed, left pending: {entry.get('linkedin_url')}: {e}")
+                outcome = "failed"
+            with self._lock:
+                self._queued_urls.discard(entry.get("linkedin_url"))
+                self.stats[outcome] += 1
+            self.cases.task_done()
+
+    def scout_job(self) -> None:
+        try:
+            process_new_posts(on_new_post=self.submit)
+        except Exception as e:
+            print(f"[Supervisor] Scout run failed: {e}")
+
+    def watchdog_job(self) -> None:
+        try:
+            daily_stats_job()
+        except Exception as e:
+            print(f"[Supervisor] Watchdog run failed: {e}")
+
+    def start(self, schedule_jobs: bool = True) -> None:
+        """Starts the outbox and caseworker threads, queues the backlog and schedules the jobs"""
+        if self.outbox_destinations:
+            start_workers(self.outbox_destinations)
+        for n in range(self.caseworkers):
+            thread = threading.Thread(target=self._caseworker, name=f"caseworker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        backlog = pending_entries()
+        for entry in backlog:
+            self.submit(entry)
+        print(f"[Supervisor] {self.caseworkers} caseworker(s) started, {len(backlog)} pending case(s) queued")
+
+        if schedule_jobs:
+            self.scheduler.every(SCOUT_INTERVAL_MINUTES).minutes.do(self.scout_job)
+            self.scheduler.every().day.at(WATCHDOG_TIME).do(self.watchdog_job)
+
+    def stop(self, *_) -> None:
+        """Asks the supervisor to shut down (usable as a signal handler)"""
+        if not self.stopping.is_set():
+            print("[Supervisor] Shutting down: finishing queued cases and deliveries...")
+        self.stopping.set()
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stops accepting cases, drains the case queue and the outbox, and stops the workers.
+
+        Args:
+            timeout: Seconds to wait for both queues (defaults to SUPERVISOR_DRAIN_TIMEOUT)
+
+        Returns:
+            True if everything queued was handled before the deadline
+        """
+        self.stopping.set()
+        deadline = time.monotonic() + (SUPERVISOR_DRAIN_TIMEOUT if timeout is None else timeout)
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        drained = not any(thread.is_alive() for thread in self._threads)
+
+        if self.outbox_destinations:
+            drained = drain(self.outbox_destinations, timeout=max(deadline - time.monotonic(), 0)) and drained
+            stop_workers()
+        self.scheduler.clear()
+        if not drained:
+            print("[Supervisor] Drain timed out; unfinished work resumes on the next start")
+        print(f"[Supervisor] Stopped: {self.stats}")
+        return drained
+
+    def run(self) -> None:
+        """Runs until SIGINT/SIGTERM, then shuts down gracefully"""
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        metrics.start_exporters("supervisor")
+        self.start()
+
+        # Run the scout immediately on start, like the standalone agent
+        self.scout_job()
+        while not self.stopping.is_set():
+            self.scheduler.run_pending()
+            self.stopping.wait(1)
+
+        self.shutdown()
+
+
+def run_all():
+    """Main function to run all agents in one process"""
+    print("Starting Second-Chance Agent supervisor...")
+    print(f"Scout every {SCOUT_INTERVAL_MINUTES} minutes, Watchdog daily at {WATCHDOG_TIME} UTC, "
+          f"{SUPERVISOR_CASEWORKERS} caseworker(s)")
+    print(f"[Supervisor] Started at {datetime.utcnow().isoformat()}")
+    Supervisor().run()
+
+
+if __name__ == "__main__":
+    run_all()
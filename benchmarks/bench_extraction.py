@@ -0,0 +1,135 @@
+"""
+Benchmark: single-pass post scanner vs. the previous per-pattern re.search extractor
+
+Runs both over a corpus of LinkedIn-length posts (roughly 600-2,500 characters)
+and over adversarial inputs of growing size, where the previous patterns go
+quadratic and the scanner stays linear.
+
+Usage:
+    python benchmarks/bench_extraction.py [posts]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.form_filler import _scan_post, extract_info_from_post, extract_info_from_posts
+
+
+OPENERS = [
+    "After 7 incredible years, today was my last day.",
+    "Some personal news: I was laid off this morning along with 40% of my team.",
+    "It's been a tough week. My role was eliminated as part of a restructuring.",
+]
+BODIES = [
+    "I worked at {employer} as a senior data analyst, building dashboards that the "
+    "operations team relied on every single day.",
+    "Formerly {employer}, I led a team of six engineers shipping payments infrastructure.",
+    "I was employed by {employer} where I managed vendor relationships across three regions.",
+]
+FILLER = (
+    "I'm grateful for the mentors who pushed me, the teammates who had my back, and the "
+    "customers who trusted us with their hardest problems. I learned more than I can fit "
+    "in a post, and I'm proud of what we built together. "
+)
+CLOSERS = [
+    "My last salary was ${wage}k and I'm open to hybrid roles. Reach me at {email}.",
+    "I was making {wage},000 per year. Call me at (415) 555-{phone} if you're hiring.",
+    "Open to work! DMs are open, or email {email}. #OpenToWork #Layoffs",
+]
+EMPLOYERS = ["Tech Corp", "Acme & Sons", "Globex", "Initech", "Umbrella Health"]
+
+
+def legacy_extract(post_text: str) -> dict:
+    """The extractor as it was before the scanner: one re.search per pattern, per call"""
+    info = {"last_employer": "Previous Employer", "last_wage": "50000"}
+    for pattern in [
+        r"(?:worked at|employed by|at)\s+([A-Z][a-zA-Z\s&]+?)(?:\s|,|\.|$)",
+        r"(?:formerly|ex-)\s*([A-Z][a-zA-Z\s&]+)",
+    ]:
+        match = re.search(pattern, post_text, re.IGNORECASE)
+        if match:
+            info["last_employer"] = match.group(1).strip()
+            break
+    for pattern in [
+        r"\$(\d{1,3}(?:,\d{3})*(?:k|K)?)",
+        r"(\d{1,3}(?:,\d{3})*)\s*(?:per year|annually|salary)",
+    ]:
+        match = re.search(pattern, post_text, re.IGNORECASE)
+        if match:
+            wage_str = match.group(1).replace(',', '')
+            if 'k' in wage_str.lower():
+                info["last_wage"] = str(int(float(wage_str.lower().replace('k', '')) * 1000))
+            else:
+                info["last_wage"] = wage_str
+            break
+    return info
+
+
+def make_corpus(count: int) -> list:
+    rng = random.Random(7)
+    corpus = []
+    for i in range(count):
+        post = " ".join([
+            rng.choice(OPENERS),
+            rng.choice(BODIES).format(employer=rng.choice(EMPLOYERS)),
+            FILLER * rng.randint(2, 10),
+            rng.choice(CLOSERS).format(
+                wage=rng.randint(45, 180), email=f"worker{i}@example.com", phone=f"{rng.randint(0, 9999):04d}"
+            )
+        ])
+        corpus.append((post, f"https://www.linkedin.com/posts/worker{i}"))
+    return corpus
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    corpus = make_corpus(count)
+    average = sum(len(post) for post, _ in corpus) / count
+
+    start = time.perf_counter()
+    for post, _ in corpus:
+        legacy_extract(post)
+    legacy = time.perf_counter() - start
+
+    _scan_post.cache_clear()
+    start = time.perf_counter()
+    for post, url in corpus:
+        extract_info_from_post(post, url)
+    single = time.perf_counter() - start
+
+    _scan_post.cache_clear()
+    start = time.perf_counter()
+    extract_info_from_posts(corpus)
+    batch = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extract_info_from_posts(corpus)
+    cached = time.perf_counter() - start
+
+    print(f"Posts: {count}, average length {average:,.0f} chars")
+    print(f"legacy re.search patterns: {count / legacy:10,.0f} posts/s")
+    print(f"scanner per post:          {count / single:10,.0f} posts/s (also extracts email and phone)")
+    print(f"scanner batch:             {count / batch:10,.0f} posts/s")
+    print(f"scanner batch, cached:     {count / cached:10,.0f} posts/s")
+
+    # A long comma-grouped number with no "per year" after it: the old wage pattern
+    # re-scans it from every digit
+    print("\nAdversarial input '1' + ',000' * n (seconds at 5k / 10k / 20k chars):")
+    timings = {"legacy": [], "scanner": []}
+    for size in (5000, 10000, 20000):
+        text = "1" + ",000" * (size // 4)
+        start = time.perf_counter()
+        legacy_extract(text)
+        timings["legacy"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        _scan_post(text)
+        timings["scanner"].append(time.perf_counter() - start)
+    for label, values in timings.items():
+        print(f"  {label:8} " + " / ".join(f"{value:.4f}" for value in values))
+
+if __name__ == "__main__":
+    main()
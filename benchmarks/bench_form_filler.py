@@ -0,0 +1,56 @@
+"""
+Benchmark: batch PDF filling vs. one form_filler_tool call per case
+
+Usage:
+    python benchmarks/bench_form_filler.py [records]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.form_filler import fill_batch, form_filler_tool
+from utils import form_templates
+from utils.sample_forms import make_sample_form
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        form_templates.FORM_FIELD_CACHE_DIR = os.path.join(tmp, "fields")
+        blank = make_sample_form(
+            os.path.join(tmp, "CA_UI.pdf"),
+            [["name", "address", "employer", "wage", "email", "phone"]] * 4
+        )
+        records = [
+            {"name": f"Worker {i}", "address": "123 Main St", "employer": "Acme",
+             "wage": "50000", "email": f"w{i}@example.com", "phone": "555-0100"}
+            for i in range(count)
+        ]
+        
+        # Current path: one tool call per case, each parsing the template afresh
+        start = time.perf_counter()
+        for i, record in enumerate(records):
+            form_templates._templates.clear()
+            form_filler_tool(blank, os.path.join(tmp, f"single_{i}.pdf"), **record)
+        single = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        fill_batch(blank, records, [os.path.join(tmp, f"batch_{i}.pdf") for i in range(count)])
+        batch = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        fill_batch(blank, records)
+        in_memory = time.perf_counter() - start
+    
+    print(f"Records: {count}, cores: {os.cpu_count()}")
+    print(f"form_filler_tool per case: {count / single:8.1f} forms/s")
+    print(f"fill_batch to files:       {count / batch:8.1f} forms/s")
+    print(f"fill_batch in memory:      {count / in_memory:8.1f} forms/s")
+
+
+if __name__ == "__main__":
+    main()
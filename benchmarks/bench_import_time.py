@@ -0,0 +1,79 @@
+"""
+Benchmark: CLI startup import time, checked against a budget
+
+Imports each entry point in a fresh interpreter with -X importtime, takes the
+best cumulative time of a few runs, and checks that heavy libraries a
+command does not use are not imported. Exits with status 1 when an entry
+point is over budget or imports a library it should not.
+
+Usage:
+    python benchmarks/bench_import_time.py [runs]
+
+Budgets are in milliseconds and can be scaled for slow machines with
+IMPORT_BUDGET_SCALE (e.g. IMPORT_BUDGET_SCALE=2).
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("google.adk", "googleapiclient", "pypdf", "tweepy", "feedparser")
+
+# Entry point -> (budget in ms, heavy modules it may import)
+BUDGETS = {
+    "main": (50, ()),
+    "agents.scout": (150, ("feedparser",)),
+    "agents.watchdog": (200, ()),
+    "agents.caseworker": (800, ("googleapiclient", "pypdf")),
+}
+
+
+def measure(module):
+    """Returns (cumulative import time in ms, set of imported module names)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    cumulative, imported = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, name = line.split("|")
+        name = name.strip()
+        imported.add(name)
+        if name == module:
+            cumulative = int(total) / 1000
+    return cumulative, imported
+
+
+def check(runs=3, scale=1.0):
+    """Returns a list of (module, best ms, budget ms, unexpected heavy modules)"""
+    results = []
+    for module, (budget, allowed) in BUDGETS.items():
+        timings = []
+        for _ in range(runs):
+            elapsed, imported = measure(module)
+            timings.append(elapsed)
+        unexpected = sorted(
+            heavy for heavy in HEAVY_MODULES
+            if heavy not in allowed and any(name == heavy or name.startswith(heavy + ".") for name in imported)
+        )
+        results.append((module, min(timings), budget * scale, unexpected))
+    return results
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    scale = float(os.getenv("IMPORT_BUDGET_SCALE", "1"))
+    failed = False
+    for module, elapsed, budget, unexpected in check(runs, scale):
+        ok = elapsed <= budget and not unexpected
+        failed = failed or not ok
+        extra = f"  imports {', '.join(unexpected)}" if unexpected else ""
+        print(f"{module:20} {elapsed:8.1f} ms  budget {budget:6.0f} ms  {'ok' if ok else 'OVER'}{extra}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark: batched, cached LLM extraction vs. one model request per post
+
+Uses the stub generateContent server from test_agents with a fixed per-request
+latency standing in for model time.
+
+Usage:
+    python benchmarks/bench_llm_extraction.py [posts] [latency_seconds]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test_agents import FakeGeminiHandler, _start_local_server
+from tools import llm_extraction
+
+
+def run(posts, batch_size, workers):
+    FakeGeminiHandler.requests = []
+    llm_extraction.LLM_BATCH_SIZE = batch_size
+    llm_extraction.LLM_WORKERS = workers
+    start = time.perf_counter()
+    llm_extraction.extract_info_batch(posts)
+    return time.perf_counter() - start, len(FakeGeminiHandler.requests)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    FakeGeminiHandler.latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    server, root_url = _start_local_server(FakeGeminiHandler)
+    llm_extraction.GEMINI_API_BASE = root_url + "v1beta"
+    llm_extraction.EXTRACTION_BACKEND = "gemini"
+    posts = [(f"I was laid off from Initech after 4 years, post {i}", f"url{i}") for i in range(count)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, batch_size, workers in [
+            ("one request per post", 1, 1),
+            ("batches of 20", 20, 1),
+            ("batches of 20, 4 parallel", 20, 4),
+        ]:
+            llm_extraction.LLM_CACHE_DIR = os.path.join(tmp, label.replace(" ", "_"))
+            results.append((label, *run(posts, batch_size, workers)))
+        results.append(("cached", *run(posts, 20, 4)))
+    server.shutdown()
+
+    print(f"Posts: {count}, model latency: {FakeGeminiHandler.latency * 1000:.0f} ms/request")
+    for label, elapsed, requests in results:
+        print(f"{label:28} {elapsed:7.2f}s {requests:5} requests {count / elapsed:10,.1f} posts/s")
+
+
+if __name__ == "__main__":
+    main()
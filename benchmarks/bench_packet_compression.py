@@ -0,0 +1,65 @@
+"""
+Benchmark: packet zip size vs. CPU time per compression setting
+
+Usage:
+    python benchmarks/bench_packet_compression.py [forms_per_packet] [blank_form.pdf ...]
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import packet_builder
+from tools.form_filler import fill_pdf_writer
+from utils import form_templates
+from utils.sample_forms import make_sample_form
+
+
+SETTINGS = [
+    ("stored", 0),
+    ("deflate", 1),
+    ("deflate", 6),
+    ("deflate", 9),
+    ("bzip2", 9),
+    ("lzma", 0),
+]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        form_templates.FORM_FIELD_CACHE_DIR = os.path.join(tmp, "fields")
+        blanks = sys.argv[2:] or [make_sample_form(
+            os.path.join(tmp, "sample.pdf"),
+            [["name", "address", "employer", "wage", "email", "phone"]] * 6
+        )]
+        
+        # Render the filled PDFs once so only compression is measured
+        members = []
+        for i in range(count):
+            buffer = io.BytesIO()
+            fill_pdf_writer(blanks[i % len(blanks)], {"name": f"Worker {i}", "employer": "Acme"}).write(buffer)
+            members.append((f"form_{i}_filled.pdf", buffer.getvalue()))
+        raw_size = sum(len(data) for _, data in members)
+        
+        print(f"{count} member(s), {raw_size:,} bytes uncompressed, "
+              f"{packet_builder.PACKET_COMPRESSION_WORKERS} compression workers")
+        print(f"{'setting':<12}{'zip bytes':>12}{'ratio':>8}{'cpu ms':>10}{'wall ms':>10}")
+        for compression, level in SETTINGS:
+            buffer = io.BytesIO()
+            cpu, wall = time.process_time(), time.perf_counter()
+            with zipfile.ZipFile(buffer, 'w') as zipf:
+                packet_builder.write_members(zipf, members, compression, level)
+            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+            size = len(buffer.getvalue())
+            print(f"{compression + ('-' + str(level) if level else ''):<12}{size:>12,}"
+                  f"{size / raw_size:>8.2f}{cpu * 1000:>10.1f}{wall * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Benchmark: filled PDF size per output mode
+
+Usage:
+    python benchmarks/bench_pdf_output_size.py [blank_form.pdf ...]
+
+Without arguments a multi-page sample form is generated.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.form_filler import OUTPUT_MODES, fill_pdf_form
+from utils import form_templates
+from utils.sample_forms import make_sample_form
+
+
+FORM_DATA = {
+    "name": "Jane Doe",
+    "address": "123 Main St, Sacramento, CA 95814",
+    "employer": "Acme Corp",
+    "wage": "85000",
+    "email": "jane@example.com",
+    "phone": "555-0100"
+}
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        form_templates.FORM_FIELD_CACHE_DIR = os.path.join(tmp, "fields")
+        forms = sys.argv[1:] or [make_sample_form(
+            os.path.join(tmp, "sample.pdf"),
+            [["name", "address", "employer", "wage", "email", "phone"]] * 6
+        )]
+        
+        print(f"{'form':<30}{'blank':>10}" + "".join(f"{mode:>14}" for mode in OUTPUT_MODES))
+        for pdf_path in forms:
+            sizes = []
+            for mode in OUTPUT_MODES:
+                output_path = os.path.join(tmp, f"filled_{mode}.pdf")
+                result = fill_pdf_form(pdf_path, output_path, FORM_DATA, output_mode=mode)
+                sizes.append(os.path.getsize(output_path) if result["status"] == "success" else 0)
+            print(f"{os.path.basename(pdf_path):<30}{os.path.getsize(pdf_path):>10}"
+                  + "".join(f"{size:>14}" for size in sizes))
+
+
+if __name__ == "__main__":
+    main()
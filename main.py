@@ -1,11 +1,12 @@
 """
 Main entry point for Second-Chance Agent system
+
+Agents are imported only for the subcommand that runs them, so each command
+(and every caseworker process the scout starts) loads just the libraries it
+uses. benchmarks/bench_import_time.py keeps startup within a budget.
 """
 import argparse
 import sys
-from agents.scout import run_scout
-from agents.caseworker import run_caseworker
-from agents.watchdog import run_watchdog
 
 
 def main():
@@ -14,8 +15,8 @@ def main():
     )
     parser.add_argument(
         "agent",
-        choices=["scout", "caseworker", "watchdog"],
-        help="Which agent to run"
+        choices=["scout", "caseworker", "watchdog", "all", "drive-sync", "export"],
+        help="Which agent to run (\"all\" runs every agent in one process)"
     )
     parser.add_argument(
         "--url",
@@ -26,24 +27,50 @@ def main():
         action="store_true",
         help="Process all pending entries (for caseworker agent)"
     )
+    parser.add_argument(
+        "--format",
+        choices=["auto", "npy", "parquet"],
+        help="Columnar format (for export; defaults to EXPORT_FORMAT or auto)"
+    )
+    parser.add_argument(
+        "--out",
+        help="Export directory (for export; defaults to EXPORT_DIR)"
+    )
     
     args = parser.parse_args()
     
     if args.agent == "scout":
         print("Starting Scout Agent...")
+        from agents.scout import run_scout
         run_scout()
     elif args.agent == "caseworker":
         print("Starting Caseworker Agent...")
+        from agents.caseworker import run_caseworker
         if args.url:
-            from agents.caseworker import process_case
+            from agents.caseworker import deliver_queued_drafts, process_case
             process_case(linkedin_url=args.url)
+            deliver_queued_drafts()
         elif args.all_pending:
             run_caseworker()
         else:
             run_caseworker()
     elif args.agent == "watchdog":
         print("Starting Watchdog Agent...")
+        from agents.watchdog import run_watchdog
         run_watchdog()
+    elif args.agent == "all":
+        from agents.supervisor import run_all
+        run_all()
+    elif args.agent == "drive-sync":
+        print("Starting Drive mirror sync...")
+        from tools.drive_tool import run_drive_sync
+        run_drive_sync()
+    elif args.agent == "export":
+        from utils.columnar import export_shared_state
+        result = export_shared_state(export_dir=args.out, fmt=args.format)
+        print(result["message"])
+        if result["status"] != "success":
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,256 @@
 """
 Test script for Second-Chance Agent components
 """
+import io
 import os
+import json
+import hashlib
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
 from tools.eligibility_engine import eligibility_engine_tool
+from utils.sample_forms import make_sample_form
 from utils.shared_state import append_to_shared_state, get_statistics, read_shared_state
 
 load_dotenv()
 
 
+def _start_local_server(handler_class):
+    """Starts a local HTTP server on a free port, returns (server, root_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def _local_google_service(api: str, version: str, root_url: str):
+    """Builds a googleapiclient service that talks to a local fake server"""
+    from googleapiclient import discovery_cache
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import build_http
+    
+    doc = json.loads(discovery_cache.get_static_doc(api, version))
+    doc["rootUrl"] = root_url
+    doc["baseUrl"] = root_url + doc["servicePath"]
+    # build_http stops httplib2 from treating the upload protocol's 308 as a redirect
+    return build_from_document(doc, http=build_http())
+
+
+class FakeSocialHandler(BaseHTTPRequestHandler):
+    """Minimal Twitter v2 create-tweet and LinkedIn ugcPosts endpoints with keep-alive"""
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    linkedin_status = 201
+    posts = []
+    connections = set()
+    
+    def do_POST(self):
+        import time
+        cls = type(self)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        cls.connections.add(self.client_address)
+        time.sleep(cls.latency)
+        if self.path == "/2/tweets":
+            cls.posts.append(("twitter", body["text"]))
+            status, payload, headers = 201, {"data": {"id": "1001", "text": body["text"]}}, {}
+        else:
+            text = body["specificContent"]["com.linkedin.ugc.ShareContent"]["shareCommentary"]["text"]
+            cls.posts.append(("linkedin", text))
+            status, payload = cls.linkedin_status, {}
+            headers = {"X-LinkedIn-Id": "urn:li:share:2002"} if status == 201 else {"Retry-After": "60"}
+        response = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+    
+    def log_message(self, *args):
+        pass
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    """Minimal Drive v3 server: files.list, files.get_media and the changes feed"""
+    files = {}
+    changes = []
+    downloads = 0
+    
+    @classmethod
+    def put_file(cls, file_id, name, content, parent="folder", trashed=False):
+        cls.files[file_id] = {
+            "id": file_id, "name": name, "mimeType": "application/pdf",
+            "parents": [parent], "trashed": trashed, "content": content,
+            "md5Checksum": hashlib.md5(content).hexdigest(),
+            "modifiedTime": f"2024-01-01T00:00:{len(cls.changes):02d}Z"
+        }
+        cls.changes.append(file_id)
+    
+    def _resource(self, file_id):
+        return {k: v for k, v in self.files[file_id].items() if k != "content"}
+    
+    def _send(self, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == "/drive/v3/changes/startPageToken":
+            self._send({"startPageToken": str(len(self.changes))})
+        elif url.path == "/drive/v3/changes":
+            start = int(params["pageToken"][0])
+            self._send({
+                "changes": [{"fileId": fid, "removed": False, "file": self._resource(fid)}
+                            for fid in self.changes[start:]],
+                "newStartPageToken": str(len(self.changes))
+            })
+        elif url.path == "/drive/v3/files":
+            self._send({"files": [self._resource(fid) for fid, f in self.files.items()
+                                  if not f["trashed"]]})
+        elif url.path.startswith("/drive/v3/files/"):
+            type(self).downloads += 1
+            self._send(self.files[url.path.rsplit("/", 1)[1]]["content"], "application/pdf")
+        else:
+            self.send_error(404)
+    
+    def log_message(self, *args):
+        pass
+
+
+class FakeGmailBatchHandler(BaseHTTPRequestHandler):
+    """Minimal Gmail batch endpoint: every second drafts.create in a batch fails"""
+    batches = []
+    
+    def do_POST(self):
+        import re
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        content_ids = re.findall(r"Content-ID: <([^>]+)>", body)
+        type(self).batches.append(len(content_ids))
+        
+        boundary = "fake_batch_boundary"
+        parts = []
+        for i, content_id in enumerate(content_ids):
+            if i % 2:
+                status, payload = "400 Bad Request", {"error": {"code": 400, "message": "Invalid To header"}}
+            else:
+                status, payload = "200 OK", {"id": f"draft-{len(self.batches)}-{i}", "message": {}}
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        response = ("".join(parts) + f"--{boundary}--\r\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+    
+    def log_message(self, *args):
+        pass
+
+
+class FakeGmailUploadHandler(BaseHTTPRequestHandler):
+    """Minimal Gmail resumable upload endpoint that can fail a chunk or forget a session"""
+    received = b""
+    chunks = 0
+    fail_at_chunk = None
+    fail_status = 503
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Location", f"http://{self.headers['Host']}/upload-session/1")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+    
+    def do_PUT(self):
+        import re
+        cls = type(self)
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        total = int(self.headers["Content-Range"].rsplit("/", 1)[1])
+        if self.path != "/upload-session/1":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        
+        if not self.headers["Content-Range"].startswith("bytes */"):
+            cls.chunks += 1
+            if cls.chunks == cls.fail_at_chunk:
+                self.send_response(cls.fail_status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start = int(re.match(r"bytes (\d+)-", self.headers["Content-Range"]).group(1))
+            cls.received = cls.received[:start] + data
+        
+        if len(cls.received) < total:
+            self.send_response(308)
+            if cls.received:
+                self.send_header("Range", f"bytes=0-{len(cls.received) - 1}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        
+        response = json.dumps({"id": "draft-streamed", "message": {}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+    
+    def log_message(self, *args):
+        pass
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    """Minimal generateContent endpoint answering extraction prompts"""
+    requests = []
+    latency = 0.0
+    fail = False
+    
+    def do_POST(self):
+        import time
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["contents"][0]["parts"][0]["text"]
+        posts = json.loads(prompt.split("Posts:\n", 1)[1])
+        type(self).requests.append(len(posts))
+        time.sleep(self.latency)
+        
+        if self.fail:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        
+        items = [
+            {"index": post["index"], "name": f"Worker {post['text'].split()[-1]}",
+             "last_employer": "Stub Employer", "last_wage": None, "email": None, "phone": None}
+            for post in posts
+        ]
+        response = json.dumps({
+            "candidates": [{"content": {"parts": [{"text": json.dumps(items)}], "role": "model"}}]
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+    
+    def log_message(self, *args):
+        pass
+
+
 def test_eligibility_engine():
     """Test the eligibility engine tool"""
     print("Testing Eligibility Engine...")
@@ -31,6 +273,8 @@ def test_shared_state():
     """Test shared state management"""
     print("\n\nTesting Shared State Management...")
     
+    from utils import shared_state
+    
     # Add test entry
     test_entry = {
         "linkedin_url": "https://www.linkedin.com/posts/test123",
@@ -40,17 +284,26 @@ def test_shared_state():
         "status": "pending"
     }
     
-    if append_to_shared_state(test_entry):
-        print("✓ Successfully appended test entry")
+    original = shared_state.SHARED_STATE_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the state file and its rollups out of the working directory
+        shared_state.SHARED_STATE_FILE = os.path.join(tmp, "shared_state.jsonl")
+        try:
+            if append_to_shared_state(test_entry):
+                print("✓ Successfully appended test entry")
+            
+            # Read entries
+            entries = read_shared_state()
+            print(f"✓ Total entries: {len(entries)}")
+            
+            # Get statistics
+            stats = get_statistics()
+            print(f"✓ Total amount unlocked: ${stats['total_amount_unlocked']:,.2f}")
+            print(f"✓ Total rows: {stats['total_rows']}")
+        finally:
+            shared_state.SHARED_STATE_FILE = original
     
-    # Read entries
-    entries = read_shared_state()
-    print(f"✓ Total entries: {len(entries)}")
-    
-    # Get statistics
-    stats = get_statistics()
-    print(f"✓ Total amount unlocked: ${stats['total_amount_unlocked']:,.2f}")
-    print(f"✓ Total rows: {stats['total_rows']}")
+    assert len(entries) == 1 and stats["total_rows"] == 1
 
 
 def test_state_extraction():
@@ -72,6 +325,1470 @@ def test_state_extraction():
         print(f"Extracted State: {state}\n")
 
 
+def test_post_extraction():
+    """Test the single-pass post scanner, its batch API and its linear worst case"""
+    print("\n\nTesting Post Extraction...")
+    
+    import time
+    from tools.form_filler import extract_info_from_post, extract_info_from_posts
+    
+    post = (
+        "After 6 great years I worked at Acme & Sons Inc. My salary was $85k. "
+        "Formerly Globex. Reach me at jane.doe@gmail.com or (415) 555-0134."
+    )
+    info = extract_info_from_post(post, "https://www.linkedin.com/posts/jane")
+    print(f"✓ Extracted: {info['last_employer']}, {info['last_wage']}, {info['email']}, {info['phone']}")
+    assert info["last_employer"] == "Acme & Sons Inc"
+    assert info["last_wage"] == "85000"
+    assert info["email"] == "jane.doe@gmail.com"
+    assert info["phone"] == "(415) 555-0134"
+    
+    fallback = extract_info_from_post("ex-Googler, was making 72,000 per year. Meet at 9am", None)
+    assert (fallback["last_employer"], fallback["last_wage"], fallback["email"]) == ("Googler", "72000", None)
+    
+    posts = [(post, "a"), ("Laid off today.", "b")]
+    assert extract_info_from_posts(posts) == [extract_info_from_post(p, url) for p, url in posts]
+    assert extract_info_from_posts(posts)[1]["last_employer"] == "Previous Employer"
+    
+    # Quadratic for a backtracking wage pattern; the scanner handles it in milliseconds
+    start = time.perf_counter()
+    extract_info_from_post("1" + ",000" * 50000, None)
+    extract_info_from_post("a" * 100000 + "@", None)
+    elapsed = time.perf_counter() - start
+    print(f"✓ 350k adversarial characters scanned in {elapsed:.3f}s")
+    assert elapsed < 1.0
+
+
+def test_llm_extraction():
+    """Test batched LLM extraction, its response cache and regex fallback against a stub model"""
+    print("\n\nTesting LLM Extraction...")
+    
+    from tools import llm_extraction
+    
+    server, root_url = _start_local_server(FakeGeminiHandler)
+    original = (llm_extraction.GEMINI_API_BASE, llm_extraction.EXTRACTION_BACKEND,
+                llm_extraction.LLM_BATCH_SIZE, llm_extraction.LLM_CACHE_DIR, llm_extraction.LLM_CACHE_TTL)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        llm_extraction.GEMINI_API_BASE = root_url + "v1beta"
+        llm_extraction.EXTRACTION_BACKEND = "gemini"
+        llm_extraction.LLM_BATCH_SIZE = 2
+        llm_extraction.LLM_CACHE_DIR = tmp
+        
+        posts = [(f"Laid off, my salary was $9{i}k. I am post{i}", f"url{i}") for i in range(5)]
+        infos = llm_extraction.extract_info_batch(posts)
+        first_requests = sorted(FakeGeminiHandler.requests)
+        
+        # Cached: no model calls on the second run
+        FakeGeminiHandler.requests = []
+        assert llm_extraction.extract_info_batch(posts) == infos
+        cached_requests = list(FakeGeminiHandler.requests)
+        
+        # Expired entries and failed requests fall back to the regex extractor
+        llm_extraction.LLM_CACHE_TTL = -1
+        FakeGeminiHandler.fail = True
+        fallback = llm_extraction.extract_info(*posts[0])
+        FakeGeminiHandler.fail = False
+        stats = llm_extraction.get_extraction_stats()
+        
+        (llm_extraction.GEMINI_API_BASE, llm_extraction.EXTRACTION_BACKEND,
+         llm_extraction.LLM_BATCH_SIZE, llm_extraction.LLM_CACHE_DIR, llm_extraction.LLM_CACHE_TTL) = original
+    server.shutdown()
+    
+    print(f"✓ 5 posts extracted in requests of {first_requests}, then {len(cached_requests)} requests when cached")
+    assert first_requests == [1, 2, 2]
+    assert cached_requests == []
+    assert infos[3]["name"] == "Worker post3"
+    assert infos[3]["last_employer"] == "Stub Employer"
+    # The model left last_wage null, so the regex value is kept
+    assert infos[3]["last_wage"] == "93000"
+    assert fallback["name"] == "Worker" and fallback["last_wage"] == "90000"
+    assert stats["failed_requests"] >= 1 and stats["cache_hits"] >= 5
+
+
+def test_tool_cache():
+    """Test the memoizing FunctionTool wrapper's policies, eviction and counters"""
+    print("\n\nTesting Tool Cache...")
+    
+    import time
+    from tools.tool_cache import get_tool_cache_stats, memoize_tool
+    from tools.eligibility_engine import eligibility_engine_adk_tool
+    
+    calls = []
+    
+    @memoize_tool("pure", max_entries=2)
+    def square(x: int) -> dict:
+        calls.append(x)
+        return {"value": x * x}
+    
+    assert square(2) == {"value": 4} and square(x=2) == {"value": 4}
+    square(3)
+    square(4)  # Evicts 2, the least recently used
+    square(2)
+    assert calls == [2, 3, 4, 2]
+    square(2)["value"] = 0  # Callers get copies, so the cache is not affected
+    assert square(2) == {"value": 4}
+    
+    @memoize_tool("pure", max_bytes=40)
+    def blob(n: int) -> str:
+        return "x" * n
+    
+    blob(30)
+    blob(30)
+    blob(100)  # Larger than the whole cache: not stored
+    assert blob.cache_stats()["entries"] == 1 and blob.cache_stats()["hits"] == 1
+    
+    fetches = []
+    
+    @memoize_tool("ttl", ttl=0.05, validate=lambda result: result["status"] == "success")
+    def fetch(folder: str) -> dict:
+        fetches.append(folder)
+        return {"status": "error"} if folder == "bad" else {"status": "success"}
+    
+    fetch("a"), fetch("a"), fetch("bad"), fetch("bad")
+    time.sleep(0.06)
+    fetch("a")
+    assert fetches == ["a", "bad", "bad", "a"]
+    
+    @memoize_tool("never")
+    def send(to: str) -> dict:
+        return {"status": "success"}
+    
+    send("x"), send("x")
+    
+    eligibility_engine_adk_tool.func("CA", "I was laid off")
+    eligibility_engine_adk_tool.func(state="CA", post_text="I was laid off")
+    stats = get_tool_cache_stats()
+    print(f"✓ Tool cache stats: {stats['eligibility_engine_tool']}")
+    assert stats["square"]["evictions"] == 2 and stats["square"]["hit_ratio"] == round(3 / 7, 4)
+    assert stats["fetch"]["expirations"] == 1
+    assert stats["send"]["bypassed"] == 2 and stats["send"]["hits"] == 0
+    assert stats["eligibility_engine_tool"]["policy"] == "pure"
+    assert stats["eligibility_engine_tool"]["hits"] >= 1
+
+
+def test_step_graph():
+    """Test that independent steps overlap and dependent steps get their inputs"""
+    print("\n\nTesting Step Graph...")
+    
+    import time
+    from utils.step_graph import format_timings, run_step_graph
+    
+    def wait_then(value):
+        def step(inputs):
+            time.sleep(0.1)
+            return value(inputs)
+        return step
+    
+    report = run_step_graph({
+        "eligibility": ([], wait_then(lambda inputs: 1)),
+        "extraction": ([], wait_then(lambda inputs: 2)),
+        "templates": ([], wait_then(lambda inputs: 3)),
+        "packet": (["extraction", "templates"], wait_then(lambda inputs: inputs["extraction"] + inputs["templates"]))
+    })
+    print(f"✓ {format_timings(report)}")
+    assert report["results"]["packet"] == 5
+    # Critical path is two steps long, not four
+    assert report["elapsed"] < 0.35
+    assert report["critical_path"][-1] == "packet" and len(report["critical_path"]) == 2
+    assert report["timings"]["packet"]["start"] >= report["timings"]["templates"]["end"]
+    
+    def fail(inputs):
+        raise RuntimeError("download failed")
+    
+    ran = []
+    try:
+        run_step_graph({"templates": ([], fail), "packet": (["templates"], ran.append)})
+        assert False, "expected the step's exception"
+    except RuntimeError as e:
+        assert str(e) == "download failed"
+    assert ran == []
+    
+    try:
+        run_step_graph({"a": (["b"], ran.append), "b": (["a"], ran.append)})
+        assert False, "expected a cycle error"
+    except ValueError:
+        pass
+
+
+def test_template_cache():
+    """Test the content-addressed template cache"""
+    print("\n\nTesting Template Cache...")
+    
+    from utils import template_cache
+    
+    original_dir = template_cache.TEMPLATE_CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        template_cache.TEMPLATE_CACHE_DIR = os.path.join(tmp, "cache")
+        download = os.path.join(tmp, "download.part")
+        with open(download, 'wb') as f:
+            f.write(b"%PDF-1.4 blank CA form")
+        
+        file_meta = {"id": "file1", "name": "CA_UI.pdf", "modifiedTime": "2024-01-01T00:00:00Z"}
+        record = template_cache.store(file_meta, download)
+        template_cache.record_listing("folder", "CA", ["file1"])
+        template_cache.record_usage(hits=[], misses=[record])
+        
+        # Same checksum -> hit, changed checksum -> miss
+        assert template_cache.lookup(dict(file_meta, md5Checksum=record["md5"]))
+        assert template_cache.lookup(dict(file_meta, md5Checksum="0" * 32)) is None
+        
+        cached = template_cache.get_fresh_listing("folder", "CA")
+        template_cache.record_usage(hits=cached, misses=[])
+        path = template_cache.materialize(cached[0], os.path.join(tmp, "forms", "CA"))
+        assert os.path.basename(path) == "CA_UI.pdf"
+        
+        # The materialized form is a copy: writing to it leaves the blob intact
+        with open(path, 'wb') as f:
+            f.write(b"%PDF-1.4 filled")
+        assert template_cache.file_md5(template_cache.blob_path(record["md5"])) == record["md5"]
+        template_cache.materialize(cached[0], os.path.join(tmp, "forms", "CA"))
+        assert template_cache.file_md5(path) == record["md5"]
+        print("✓ Materialized copy is independent of the cached blob")
+        
+        stats = template_cache.get_cache_stats()
+        print(f"✓ Hit ratio: {stats['hit_ratio']}, bytes saved: {stats['bytes_saved']}")
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        
+        # A listing is looked up with one read of the index
+        loads = []
+        original_load = template_cache._load_index
+        template_cache._load_index = lambda: loads.append(1) or original_load()
+        metas = [dict(file_meta, md5Checksum=record["md5"]), {"id": "file2", "name": "CA_DE.pdf"}]
+        try:
+            found = template_cache.lookup_many(metas)
+        finally:
+            template_cache._load_index = original_load
+        assert list(found) == ["file1"] and len(loads) == 1
+        print("✓ Listing looked up with a single index read")
+        
+        # Processes storing at the same time keep each other's entries
+        import multiprocessing
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=_store_templates, args=(template_cache.TEMPLATE_CACHE_DIR, f"p{n}"))
+            for n in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        files = template_cache._load_index()["files"]
+        assert len([file_id for file_id in files if file_id.startswith("p")]) == 4 * 10
+        print(f"✓ {len(files) - 1} index entries stored by 4 concurrent processes, none lost")
+    template_cache.TEMPLATE_CACHE_DIR = original_dir
+
+
+def _store_templates(cache_dir, prefix):
+    """Stores ten templates from a separate process (for test_template_cache)"""
+    from utils import template_cache
+    template_cache.TEMPLATE_CACHE_DIR = cache_dir
+    for n in range(10):
+        path = os.path.join(template_cache.staging_dir(), f"{prefix}-{n}.part")
+        with open(path, 'wb') as f:
+            f.write(f"%PDF {prefix} {n}".encode())
+        template_cache.store({"id": f"{prefix}-{n}", "name": f"{prefix}-{n}.pdf"}, path)
+
+
+def test_drive_mirror_sync():
+    """Test incremental Drive mirroring against a local fake Drive server"""
+    print("\n\nTesting Drive Mirror Sync...")
+    
+    from tools import drive_tool
+    from tools.drive_tool import sync_drive_folder
+    
+    FakeDriveHandler.put_file("f1", "CA_UI.pdf", b"%PDF ca ui")
+    FakeDriveHandler.put_file("f2", "NY_UI.pdf", b"%PDF ny ui")
+    server, root_url = _start_local_server(FakeDriveHandler)
+    service = _local_google_service("drive", "v3", root_url)
+    
+    with tempfile.TemporaryDirectory() as mirror:
+        result = sync_drive_folder("folder", mirror, service=service)
+        print(f"✓ Initial sync: {result['message']}")
+        assert result["downloaded"] == 2
+        
+        # Only the changed and the trashed file are touched on the next sync
+        FakeDriveHandler.put_file("f1", "CA_UI.pdf", b"%PDF ca ui v2")
+        FakeDriveHandler.put_file("f2", "NY_UI.pdf", b"%PDF ny ui", trashed=True)
+        downloads_before = FakeDriveHandler.downloads
+        result = sync_drive_folder("folder", mirror, service=service)
+        print(f"✓ Incremental sync: {result['message']}")
+        assert FakeDriveHandler.downloads - downloads_before == 1
+        assert result["removed"] == 1
+        with open(os.path.join(mirror, "CA_UI.pdf"), 'rb') as f:
+            assert f.read() == b"%PDF ca ui v2"
+        assert not os.path.exists(os.path.join(mirror, "NY_UI.pdf"))
+        
+        # A file gone from the mirror is fetched from Drive and restored by the next sync
+        os.remove(os.path.join(mirror, "CA_UI.pdf"))
+        original = (drive_tool.DRIVE_MIRROR_DIR, drive_tool.authenticate_drive)
+        drive_tool.DRIVE_MIRROR_DIR = mirror
+        drive_tool.authenticate_drive = lambda: service
+        try:
+            with tempfile.TemporaryDirectory() as output_dir:
+                paths = drive_tool.download_pdfs_from_drive("folder", "CA", output_dir)
+                assert paths == [os.path.join(output_dir, "CA_UI.pdf")]
+                with open(paths[0], 'rb') as f:
+                    assert f.read() == b"%PDF ca ui v2"
+        finally:
+            drive_tool.DRIVE_MIRROR_DIR, drive_tool.authenticate_drive = original
+        assert drive_tool._load_mirror_state(mirror)["files"] == {}
+        result = sync_drive_folder("folder", mirror, service=service)
+        assert result["downloaded"] == 1
+        assert os.path.exists(os.path.join(mirror, "CA_UI.pdf"))
+        print("✓ Missing mirror file fetched from Drive and restored by the next sync")
+        
+        # Forms served from the mirror are copies, so filling them in leaves the mirror alone
+        drive_tool.DRIVE_MIRROR_DIR = mirror
+        try:
+            with tempfile.TemporaryDirectory() as output_dir:
+                paths, missing = drive_tool._mirror_paths("folder", "CA", output_dir)
+                with open(paths[0], 'wb') as f:
+                    f.write(b"%PDF filled")
+                paths_again, _ = drive_tool._mirror_paths("folder", "CA", output_dir)
+                with open(paths_again[0], 'rb') as f:
+                    refreshed = f.read()
+        finally:
+            drive_tool.DRIVE_MIRROR_DIR = original[0]
+        with open(os.path.join(mirror, "CA_UI.pdf"), 'rb') as f:
+            assert f.read() == b"%PDF ca ui v2"
+        assert not missing and refreshed == b"%PDF ca ui v2"
+        print("✓ Mirror forms copied out, not linked")
+    
+    server.shutdown()
+
+
+def test_drive_parallel_download():
+    """Test that downloads run in parallel on the shared pool and land atomically"""
+    print("\n\nTesting Drive Parallel Download...")
+    
+    from tools import drive_tool
+    
+    service = _local_google_service("drive", "v3", "http://127.0.0.1:9/")
+    http = object()
+    barrier = threading.Barrier(3, timeout=5)
+    threads = set()
+    
+    class FakeDownload:
+        """Writes the file id in two chunks; "broken" fails after its first chunk"""
+        def __init__(self, fh, request, chunksize):
+            assert request.http is http
+            self.fh = fh
+            self.file_id = request.uri.split("/files/")[1].split("?")[0]
+            self.chunks = 0
+        
+        def next_chunk(self, num_retries=0):
+            if self.chunks == 0:
+                threads.add(threading.current_thread().name)
+                barrier.wait()
+            elif self.file_id == "broken":
+                raise IOError("connection reset")
+            self.fh.write(f"{self.file_id}:{self.chunks};".encode())
+            self.chunks += 1
+            return None, self.chunks == 2
+    
+    original = drive_tool.MediaIoBaseDownload
+    drive_tool.MediaIoBaseDownload = FakeDownload
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = [(f"f{i}", os.path.join(tmp, f"f{i}.pdf")) for i in range(3)]
+            paths = drive_tool.download_files(service, jobs, http=http)
+            assert paths == [path for _, path in jobs]
+            for file_id, path in jobs:
+                with open(path, 'rb') as f:
+                    assert f.read() == f"{file_id}:0;{file_id}:1;".encode()
+            assert len(threads) == 3
+            print(f"✓ 3 downloads overlapped on {sorted(threads)}")
+            
+            pool = drive_tool._get_download_pool()
+            drive_tool.download_files(service, jobs, http=http)
+            assert drive_tool._get_download_pool() is pool
+            print("✓ Download pool reused across calls")
+            
+            # A failed download leaves the existing file untouched and no partial file
+            target = os.path.join(tmp, "broken.pdf")
+            with open(target, 'wb') as f:
+                f.write(b"previous version")
+            try:
+                drive_tool.download_files(service, [("broken", target), ("f0", jobs[0][1]), ("f1", jobs[1][1])], http=http)
+                raise AssertionError("Expected the broken download to raise")
+            except IOError:
+                pass
+            with open(target, 'rb') as f:
+                assert f.read() == b"previous version"
+            assert not [name for name in os.listdir(tmp) if name.endswith(".part")]
+            print("✓ Failed download kept the previous file and removed its partial file")
+    finally:
+        drive_tool.MediaIoBaseDownload = original
+
+
+def test_google_clients():
+    """Test shared credentials, discovery caching, one client per process and pooled transports"""
+    print("\n\nTesting Google Client Manager...")
+    
+    from concurrent.futures import ThreadPoolExecutor
+    from google.oauth2.credentials import Credentials
+    from utils import google_clients
+    
+    scopes = ['https://www.googleapis.com/auth/drive.readonly']
+    original = (google_clients.DISCOVERY_CACHE_DIR, google_clients.CLIENT_SECRETS_FILE)
+    with tempfile.TemporaryDirectory() as tmp:
+        google_clients.DISCOVERY_CACHE_DIR = tmp
+        google_clients.CLIENT_SECRETS_FILE = os.path.join(tmp, "missing_credentials.json")
+        google_clients._discovery_docs.clear()
+        google_clients._credentials["token_test.json"] = Credentials(token="test-token", scopes=scopes)
+        
+        service = google_clients.get_service('drive', 'v3', scopes, 'token_test.json')
+        assert service is google_clients.get_service('drive', 'v3', scopes, 'token_test.json')
+        assert os.path.exists(os.path.join(tmp, "drive.v3.json"))
+        print("✓ Discovery document cached on disk, client reused")
+        
+        # Short-lived threads share the client, and the transports outlive them
+        for _ in range(3):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                clients = list(pool.map(
+                    lambda _: google_clients.get_service('drive', 'v3', scopes, 'token_test.json'), range(4)
+                ))
+            assert all(client is service for client in clients)
+        pool_http = google_clients.get_http(service)
+        barrier = threading.Barrier(4)
+        
+        def borrow(_):
+            http = pool_http.acquire()
+            barrier.wait()
+            pool_http.release(http)
+            return http
+        
+        for _ in range(3):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                borrowed = list(pool.map(borrow, range(4)))
+            assert len(set(map(id, borrowed))) == 4
+        assert pool_http.created == 4
+        assert borrowed[0].credentials is google_clients._credentials["token_test.json"]
+        print(f"✓ 3 rounds of 4 short-lived threads reused {pool_http.created} pooled transports")
+        
+        # A token without the requested scopes is not handed out
+        google_clients._credentials["token_test.json"] = Credentials(token="test-token", scopes=scopes)
+        try:
+            google_clients.get_credentials('token_test.json', ['https://www.googleapis.com/auth/gmail.compose'])
+            raise AssertionError("Expected PermissionError for missing scopes")
+        except PermissionError as e:
+            print(f"✓ Missing scopes refused: {e}")
+        
+        del google_clients._credentials["token_test.json"]
+    google_clients.DISCOVERY_CACHE_DIR, google_clients.CLIENT_SECRETS_FILE = original
+
+
+def test_form_filler():
+    """Test template parsing, field mapping and filling"""
+    print("\n\nTesting Form Filler...")
+    
+    from pypdf import PdfReader
+    from tools.form_filler import fill_batch, fill_pdf_form
+    from utils import form_templates
+    
+    original_dir = form_templates.FORM_FIELD_CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        form_templates.FORM_FIELD_CACHE_DIR = os.path.join(tmp, "fields")
+        blank = make_sample_form(os.path.join(tmp, "CA_UI.pdf"), [["Applicant_Name", "employer"], [], ["annual_wage"]])
+        
+        template = form_templates.get_template(blank)
+        assert template["field_map"] == {
+            "name": "Applicant_Name", "employer": "employer", "wage": "annual_wage"
+        }
+        assert form_templates.get_template(blank) is template
+        assert template["field_pages"]["annual_wage"] == [2]
+        # A field cache from the old [page, annotation] index is rebuilt
+        with open(os.path.join(form_templates.FORM_FIELD_CACHE_DIR, f"{template['md5']}.json")) as f:
+            cached = json.load(f)
+        cached["field_pages"] = {name: [[page, 0] for page in pages] for name, pages in cached["field_pages"].items()}
+        with open(os.path.join(form_templates.FORM_FIELD_CACHE_DIR, f"{template['md5']}.json"), 'w') as f:
+            json.dump(cached, f)
+        assert form_templates._load_cached_fields(template["md5"]) is None
+        print(f"✓ Compiled field map: {template['field_map']}")
+        
+        # Exact aliases win over logical names they merely contain
+        mapped = form_templates.map_form_data(
+            {"field_map": {"address": "Mailing_Address", "email": "Email", "employer": "Employer"}},
+            {"email_address": "jane@example.com", "address": "1 Main St", "current_employer": "Acme"}
+        )
+        assert mapped == {"Email": "jane@example.com", "Mailing_Address": "1 Main St", "Employer": "Acme"}
+        
+        output = os.path.join(tmp, "CA_UI_filled.pdf")
+        result = fill_pdf_form(blank, output, {"name": "Jane Doe", "employer": "Acme", "wage": "50000"})
+        assert result["status"] == "success", result
+        values = {k: v.get("/V") for k, v in PdfReader(output).get_fields().items()}
+        print(f"✓ Filled values: {values}")
+        assert values["Applicant_Name"] == "Jane Doe" and values["annual_wage"] == "50000"
+        
+        records = [{"name": f"Worker {i}", "employer": "Acme"} for i in range(8)]
+        results = fill_batch(blank, records, max_workers=2)
+        assert all(r["status"] == "success" for r in results)
+        filled = PdfReader(io.BytesIO(results[5]["data"])).get_fields()
+        assert filled["Applicant_Name"]["/V"] == "Worker 5"
+        print(f"✓ Batch filled {len(results)} copies in memory")
+        
+        flat = os.path.join(tmp, "CA_UI_flat.pdf")
+        fill_pdf_form(blank, flat, {"name": "Jane Doe", "wage": "50000"}, output_mode="flattened")
+        flat_reader = PdfReader(flat)
+        assert not flat_reader.get_fields()
+        assert "50000" in flat_reader.pages[2].extract_text()
+        print(f"✓ Flattened copy: {os.path.getsize(flat)} bytes vs {os.path.getsize(output)} bytes")
+    form_templates.FORM_FIELD_CACHE_DIR = original_dir
+
+
+def test_packet_builder():
+    """Test in-memory packet assembly"""
+    print("\n\nTesting Packet Builder...")
+    
+    import zipfile
+    from tools.packet_builder import build_packet
+    from utils import form_templates
+    
+    original_dir = form_templates.FORM_FIELD_CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        form_templates.FORM_FIELD_CACHE_DIR = os.path.join(tmp, "fields")
+        forms = [
+            make_sample_form(os.path.join(tmp, "CA_UI.pdf"), [["name", "employer"]]),
+            make_sample_form(os.path.join(tmp, "CA_SNAP.pdf"), [["full_name", "phone"]])
+        ]
+        packet = build_packet(forms, {"name": "Jane Doe", "employer": "Acme"})
+        with zipfile.ZipFile(packet["buffer"]) as zipf:
+            assert zipf.namelist() == ["CA_UI_filled.pdf", "CA_SNAP_filled.pdf"]
+            assert zipf.testzip() is None
+            assert all(i.compress_type == zipfile.ZIP_DEFLATED for i in zipf.infolist())
+        packet["buffer"].seek(0)
+        assert packet["zip_path"] is None
+        print(f"✓ Built {packet['size']:,} byte packet in memory: {packet['filled']}")
+        
+        persisted = build_packet(forms, {"name": "Jane Doe"}, persist_path=os.path.join(tmp, "out", "p.zip"))
+        assert os.path.getsize(persisted["zip_path"]) == persisted["size"]
+        print("✓ Optional persistence writes the same bytes to disk")
+    form_templates.FORM_FIELD_CACHE_DIR = original_dir
+    
+    # Members compressed on the pool and appended raw reopen with matching CRCs
+    import sys
+    import zlib
+    from tools import packet_builder
+    members = [(f"form_{i}.pdf", os.urandom(2048) + b"%PDF field " * (500 * (i + 1))) for i in range(4)]
+    for compression in ("deflate", "bzip2"):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zipf:
+            assert packet_builder._can_append_raw(zipf) == (sys.version_info[:2] <= (3, 13))
+            packet_builder.write_members(zipf, members, compression=compression)
+        with zipfile.ZipFile(io.BytesIO(buffer.getvalue())) as zipf:
+            assert zipf.testzip() is None
+            for (name, data), info in zip(members, zipf.infolist()):
+                assert info.filename == name
+                assert info.CRC == zlib.crc32(data) and info.file_size == len(data)
+                assert info.compress_type == packet_builder.COMPRESSION_METHODS[compression]
+                assert zipf.read(name) == data
+    print("✓ Parallel-compressed members reopen with zipfile and every CRC matches")
+    
+    # On an unchecked Python version the members go through writestr() instead
+    original_versions = packet_builder.RAW_APPEND_VERSIONS
+    packet_builder.RAW_APPEND_VERSIONS = ((3, 0), (3, 0))
+    try:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zipf:
+            assert not packet_builder._can_append_raw(zipf)
+            packet_builder.write_members(zipf, members, compression="deflate")
+        with zipfile.ZipFile(buffer) as zipf:
+            assert zipf.testzip() is None and [zipf.read(name) for name, _ in members] == [data for _, data in members]
+    finally:
+        packet_builder.RAW_APPEND_VERSIONS = original_versions
+    print("✓ Falls back to writestr() where zipfile internals are unchecked")
+
+
+def test_checkpoints():
+    """Test that stages resume from checkpoints and rerun when inputs change"""
+    print("\n\nTesting Case Checkpoints...")
+    
+    from utils import checkpoints
+    
+    original_dir = checkpoints.CHECKPOINT_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoints.CHECKPOINT_DIR = tmp
+        case = checkpoints.case_key("https://www.linkedin.com/posts/test123")
+        calls = []
+        
+        def stage():
+            calls.append(1)
+            return {"value": len(calls)}
+        
+        assert checkpoints.run_stage(case, "eligibility", ["CA"], stage) == {"value": 1}
+        assert checkpoints.run_stage(case, "eligibility", ["CA"], stage) == {"value": 1}
+        assert checkpoints.run_stage(case, "eligibility", ["NY"], stage) == {"value": 2}
+        assert checkpoints.run_stage(case, "eligibility", ["NY"], stage, is_valid=lambda r: False) == {"value": 3}
+        print(f"✓ Stage ran {len(calls)} times for 4 calls")
+        
+        checkpoints.clear_checkpoints(case)
+        assert checkpoints.load_checkpoints(case) == {}
+    checkpoints.CHECKPOINT_DIR = original_dir
+
+
+def test_caseworker_packet_handoff():
+    """Test that unpersisted packets go to Gmail from memory and only touch disk when queued"""
+    print("\n\nTesting Caseworker Packet Hand-off...")
+    
+    import zipfile
+    from unittest import mock
+    from agents import caseworker
+    from utils import checkpoints, form_templates, outbox, shared_state
+    
+    info = {"name": "Jane Doe", "address": "1 Main St", "last_employer": "Acme", "last_wage": 1000,
+            "email": "jane@example.com"}
+    sent, queued = [], []
+    
+    def fake_draft(to_email, subject, body, attachment=None, attachment_name=None):
+        with zipfile.ZipFile(attachment) as zipf:
+            sent.append(zipf.namelist())
+        return {"status": "error", "message": "quota", "retryable": True} if len(sent) > 1 else \
+            {"status": "success", "draft_id": "d1", "message": "ok"}
+    
+    originals = (shared_state.SHARED_STATE_FILE, checkpoints.CHECKPOINT_DIR,
+                 caseworker.CHECKPOINT_DIR, form_templates.FORM_FIELD_CACHE_DIR, outbox.OUTBOX_DIR)
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_state.SHARED_STATE_FILE = os.path.join(tmp, "shared_state.jsonl")
+        checkpoints.CHECKPOINT_DIR = caseworker.CHECKPOINT_DIR = os.path.join(tmp, "checkpoints")
+        form_templates.FORM_FIELD_CACHE_DIR = os.path.join(tmp, "form_fields")
+        # The Gmail token bucket is kept on disk under the outbox
+        outbox.OUTBOX_DIR = os.path.join(tmp, "outbox")
+        form = make_sample_form(os.path.join(tmp, "CA_UI.pdf"), [["name", "employer"]])
+        try:
+            with mock.patch.dict(os.environ, {"PERSIST_PACKETS": "false"}), \
+                    mock.patch.object(caseworker, "eligibility_engine_tool",
+                                      return_value={"programs": ["UI"], "amount": 100.0}), \
+                    mock.patch.object(caseworker, "extract_info", return_value=info), \
+                    mock.patch.object(caseworker, "cached_drive_download_tool",
+                                      return_value={"status": "success", "files": [form]}), \
+                    mock.patch.object(caseworker, "create_gmail_draft", side_effect=fake_draft), \
+                    mock.patch.object(caseworker, "enqueue",
+                                      side_effect=lambda destination, payload, key: queued.append(payload)):
+                for n in range(2):
+                    caseworker.process_case(entry={"linkedin_url": f"https://www.linkedin.com/posts/handoff-{n}",
+                                                   "state": "CA", "status": "pending"})
+                    if n == 0:
+                        written_after_first = os.listdir(checkpoints.CHECKPOINT_DIR) \
+                            if os.path.exists(checkpoints.CHECKPOINT_DIR) else []
+            processed = [e for e in read_shared_state() if e.get("status") == "processed"]
+        finally:
+            (shared_state.SHARED_STATE_FILE, checkpoints.CHECKPOINT_DIR,
+             caseworker.CHECKPOINT_DIR, form_templates.FORM_FIELD_CACHE_DIR, outbox.OUTBOX_DIR) = originals
+    
+    print(f"✓ First draft sent from memory; second deferred to the outbox with a spilled packet")
+    assert sent == [["CA_UI_filled.pdf"], ["CA_UI_filled.pdf"]]
+    assert not any(name.endswith(".zip") for name in written_after_first)
+    assert len(processed) == 1 and processed[0]["draft_id"] == "d1"
+    assert len(queued) == 1
+    spilled = queued[0]["draft"]["zip_file_path"]
+    assert spilled.endswith(".zip") and "attachment" not in queued[0]["pending"]
+    json.dumps(queued[0])
+
+
+def test_caseworker_rerun_reuses_draft():
+    """Test that a rerun with an unpersisted packet finds the draft made by the failed run"""
+    print("\n\nTesting Caseworker Rerun Without Persisted Packets...")
+    
+    from datetime import datetime
+    from unittest import mock
+    from agents import caseworker
+    from utils import checkpoints, form_templates, outbox, shared_state
+    
+    info = {"name": "Jane Doe", "address": "1 Main St", "last_employer": "Acme", "last_wage": 1000,
+            "email": "jane@example.com"}
+    entry = {"linkedin_url": "https://www.linkedin.com/posts/rerun", "state": "CA", "status": "pending"}
+    runs = iter([datetime(2026, 1, 1, 9, 0, 0), datetime(2026, 1, 1, 9, 5, 0)])
+    
+    class Clock(datetime):
+        """Moves on between runs, so each rebuilt packet gets a new file name"""
+        current = None
+        
+        @classmethod
+        def now(cls, tz=None):
+            return cls.current
+    
+    originals = (shared_state.SHARED_STATE_FILE, checkpoints.CHECKPOINT_DIR,
+                 caseworker.CHECKPOINT_DIR, form_templates.FORM_FIELD_CACHE_DIR, outbox.OUTBOX_DIR)
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_state.SHARED_STATE_FILE = os.path.join(tmp, "shared_state.jsonl")
+        checkpoints.CHECKPOINT_DIR = caseworker.CHECKPOINT_DIR = os.path.join(tmp, "checkpoints")
+        form_templates.FORM_FIELD_CACHE_DIR = os.path.join(tmp, "form_fields")
+        outbox.OUTBOX_DIR = os.path.join(tmp, "outbox")
+        form = make_sample_form(os.path.join(tmp, "CA_UI.pdf"), [["name", "employer"]])
+        try:
+            with mock.patch.dict(os.environ, {"PERSIST_PACKETS": "false"}), \
+                    mock.patch.object(caseworker, "datetime", Clock), \
+                    mock.patch.object(caseworker, "eligibility_engine_tool",
+                                      return_value={"programs": ["UI"], "amount": 100.0}), \
+                    mock.patch.object(caseworker, "extract_info", return_value=info), \
+                    mock.patch.object(caseworker, "cached_drive_download_tool",
+                                      return_value={"status": "success", "files": [form]}), \
+                    mock.patch.object(caseworker, "create_gmail_draft",
+                                      return_value={"status": "success", "draft_id": "d1", "message": "ok"}) as draft, \
+                    mock.patch.object(caseworker, "append_to_shared_state",
+                                      side_effect=[False, True]) as append:
+                names = []
+                for _ in range(2):
+                    Clock.current = next(runs)
+                    caseworker.process_case(entry=dict(entry))
+                    names.append(append.call_args[0][0]["draft_id"])
+        finally:
+            (shared_state.SHARED_STATE_FILE, checkpoints.CHECKPOINT_DIR,
+             caseworker.CHECKPOINT_DIR, form_templates.FORM_FIELD_CACHE_DIR, outbox.OUTBOX_DIR) = originals
+    
+    print(f"✓ Rerun finished the case from the draft checkpoint: {names}")
+    assert draft.call_count == 1
+    assert append.call_count == 2 and names == ["d1", "d1"]
+
+
+def test_gmail_batch_drafts():
+    """Test batched draft creation against a local fake Gmail batch endpoint"""
+    print("\n\nTesting Gmail Batch Drafts...")
+    
+    from tools import gmail_tool
+    
+    server, root_url = _start_local_server(FakeGmailBatchHandler)
+    service = _local_google_service("gmail", "v1", root_url)
+    original_size = gmail_tool.GMAIL_BATCH_SIZE
+    gmail_tool.GMAIL_BATCH_SIZE = 3
+    
+    drafts = [
+        {"to_email": f"worker{i}@example.com", "subject": "Your forms", "body": "Hello"}
+        for i in range(5)
+    ]
+    results = gmail_tool.create_gmail_drafts_batch(drafts, service=service)
+    gmail_tool.GMAIL_BATCH_SIZE = original_size
+    server.shutdown()
+    
+    print(f"✓ {len(drafts)} drafts sent in batches of {FakeGmailBatchHandler.batches}")
+    assert FakeGmailBatchHandler.batches == [3, 2]
+    assert [r["status"] for r in results] == ["success", "error", "success", "success", "error"]
+    assert results[3]["draft_id"] == "draft-2-0"
+    
+    # Attachments above the streaming threshold skip the in-memory batch
+    streamed = []
+    original = (gmail_tool.create_gmail_draft_resumable, gmail_tool.build_raw_message, gmail_tool.GMAIL_STREAMING_THRESHOLD)
+    gmail_tool.create_gmail_draft_resumable = lambda *args, **kwargs: streamed.append(kwargs["attachment"].read()) or {
+        "status": "success", "draft_id": "draft-streamed"
+    }
+    gmail_tool.build_raw_message = lambda *args, **kwargs: "cmF3"
+    gmail_tool.GMAIL_STREAMING_THRESHOLD = 1024
+    batch_calls = []
+    
+    class RecordingBatch:
+        def __init__(self, callback):
+            self.callback = callback
+            self.ids = []
+        
+        def add(self, request, request_id):
+            self.ids.append(request_id)
+        
+        def execute(self):
+            batch_calls.append(self.ids)
+            for request_id in self.ids:
+                self.callback(request_id, {"id": f"draft-{request_id}"}, None)
+    
+    original_batch = service.new_batch_http_request
+    service.new_batch_http_request = lambda callback: RecordingBatch(callback)
+    try:
+        drafts = [
+            {"to_email": "small@example.com", "subject": "Forms", "body": "Hi", "attachment": io.BytesIO(b"z" * 100)},
+            {"to_email": "large@example.com", "subject": "Forms", "body": "Hi", "attachment": io.BytesIO(b"z" * 4096)},
+        ]
+        results = gmail_tool.create_gmail_drafts_batch(drafts, service=service)
+    finally:
+        service.new_batch_http_request = original_batch
+        (gmail_tool.create_gmail_draft_resumable, gmail_tool.build_raw_message,
+         gmail_tool.GMAIL_STREAMING_THRESHOLD) = original
+    assert batch_calls == [["0"]]
+    assert streamed == [b"z" * 4096]
+    assert [r["draft_id"] for r in results] == ["draft-0", "draft-streamed"]
+    print("✓ Attachment above the streaming threshold sent through the resumable upload")
+
+
+def test_gmail_resumable_upload():
+    """Test streaming a large attachment through the resumable upload endpoint, with a resume"""
+    print("\n\nTesting Gmail Resumable Upload...")
+    
+    import email
+    import tempfile
+    from tools import gmail_tool
+    
+    server, root_url = _start_local_server(FakeGmailUploadHandler)
+    service = _local_google_service("gmail", "v1", root_url)
+    original = (gmail_tool.GMAIL_UPLOAD_DIR, gmail_tool.GMAIL_UPLOAD_CHUNK_SIZE, gmail_tool.GMAIL_UPLOAD_RETRIES)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        gmail_tool.GMAIL_UPLOAD_DIR = os.path.join(tmp, "uploads")
+        gmail_tool.GMAIL_UPLOAD_CHUNK_SIZE = 256 * 1024
+        gmail_tool.GMAIL_UPLOAD_RETRIES = 0
+        
+        attachment = os.urandom(700 * 1024)
+        zip_path = os.path.join(tmp, "benefits.zip")
+        with open(zip_path, 'wb') as f:
+            f.write(attachment)
+        
+        args = ("worker@example.com", "Your forms", "Hello", zip_path)
+        FakeGmailUploadHandler.fail_at_chunk = 3
+        first = gmail_tool.create_gmail_draft_resumable(*args, service=service)
+        assert first["status"] == "error"
+        assert len(os.listdir(gmail_tool.GMAIL_UPLOAD_DIR)) == 2
+        
+        second = gmail_tool.create_gmail_draft_resumable(*args, service=service)
+        received, chunks = FakeGmailUploadHandler.received, FakeGmailUploadHandler.chunks
+        assert os.listdir(gmail_tool.GMAIL_UPLOAD_DIR) == []
+        
+        # A session the server has forgotten is started over
+        FakeGmailUploadHandler.received, FakeGmailUploadHandler.chunks = b"", 0
+        FakeGmailUploadHandler.fail_at_chunk = 2
+        assert gmail_tool.create_gmail_draft_resumable(*args, service=service)["status"] == "error"
+        session_file = [name for name in os.listdir(gmail_tool.GMAIL_UPLOAD_DIR) if name.endswith(".json")][0]
+        with open(os.path.join(gmail_tool.GMAIL_UPLOAD_DIR, session_file), 'w') as f:
+            json.dump({"resumable_uri": f"{root_url}upload-session/expired"}, f)
+        FakeGmailUploadHandler.received = b""
+        restarted = gmail_tool.create_gmail_draft_resumable(*args, service=service)
+        assert restarted["status"] == "success"
+        restarted_part = email.message_from_bytes(FakeGmailUploadHandler.received).get_payload()[1]
+        assert restarted_part.get_payload(decode=True) == attachment
+        assert os.listdir(gmail_tool.GMAIL_UPLOAD_DIR) == []
+        print("✓ Expired upload session started over")
+        
+        # A failure not worth retrying discards the session
+        FakeGmailUploadHandler.received, FakeGmailUploadHandler.chunks = b"", 0
+        FakeGmailUploadHandler.fail_at_chunk, FakeGmailUploadHandler.fail_status = 2, 400
+        failed = gmail_tool.create_gmail_draft_resumable(*args, service=service)
+        assert failed["status"] == "error" and not failed.get("retryable")
+        assert not [name for name in os.listdir(gmail_tool.GMAIL_UPLOAD_DIR) if name.endswith(".json")]
+        FakeGmailUploadHandler.fail_at_chunk, FakeGmailUploadHandler.fail_status = None, 503
+        print("✓ Session file removed after a non-retryable failure")
+        
+        # In-memory attachments stream the same way
+        FakeGmailUploadHandler.received, FakeGmailUploadHandler.chunks = b"", 0
+        from_buffer = gmail_tool.create_gmail_draft_resumable(
+            "worker@example.com", "Your forms", "Hello", service=service, attachment=io.BytesIO(attachment)
+        )
+        assert from_buffer["status"] == "success"
+        buffer_part = email.message_from_bytes(FakeGmailUploadHandler.received).get_payload()[1]
+        assert buffer_part.get_payload(decode=True) == attachment
+        print("✓ In-memory attachment uploaded through the resumable endpoint")
+        
+        (gmail_tool.GMAIL_UPLOAD_DIR, gmail_tool.GMAIL_UPLOAD_CHUNK_SIZE,
+         gmail_tool.GMAIL_UPLOAD_RETRIES) = original
+        server.shutdown()
+        
+        message = email.message_from_bytes(received)
+        part = message.get_payload()[1]
+        print(f"✓ {len(received):,} byte message uploaded in "
+              f"{chunks} chunk requests, resumed after a failure")
+        assert second == {
+            "status": "success",
+            "draft_id": "draft-streamed",
+            "message": "Draft created successfully. Draft ID: draft-streamed"
+        }
+        assert message["to"] == "worker@example.com"
+        assert part.get_filename() == "benefits.zip"
+        assert part.get_payload(decode=True) == attachment
+        # 4 chunks plus the failed one; chunks sent before the failure were not re-sent
+        assert chunks == 5
+
+
+def test_outbox():
+    """Test outbox delivery: rate limiting, retries with backoff, and dead letters"""
+    print("\n\nTesting Outbox...")
+    
+    import time
+    from utils import outbox
+    
+    attempts = {}
+    
+    def flaky_sender(n):
+        attempts[n] = attempts.get(n, 0) + 1
+        if n == 0 and attempts[n] < 3:
+            return {"status": "error", "message": "503 Service Unavailable", "retryable": True}
+        if n == 1:
+            return {"status": "error", "message": "400 Invalid To header"}
+        return {"status": "success"}
+    
+    original = (outbox.OUTBOX_DIR, outbox.OUTBOX_BACKOFF_BASE, outbox.OUTBOX_POLL_INTERVAL, dict(outbox.SENDERS))
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox.OUTBOX_DIR = tmp
+        outbox.OUTBOX_BACKOFF_BASE = 0.01
+        outbox.OUTBOX_POLL_INTERVAL = 0.01
+        outbox.SENDERS["test"] = flaky_sender
+        outbox.RATE_LIMITS["test"] = (2, 0.1)
+        
+        for n in range(8):
+            outbox.enqueue("test", {"n": n}, key=f"message-{n}")
+        # Still queued, so the same key is not queued twice
+        outbox.enqueue("test", {"n": 7}, key="message-7")
+        assert outbox.queued(["test"]) == 8
+        
+        started = time.monotonic()
+        outbox.start_workers(["test"], workers=3)
+        assert outbox.drain(["test"], timeout=10)
+        elapsed = time.monotonic() - started
+        outbox.stop_workers()
+        
+        with open(os.path.join(tmp, "dead_letter.jsonl")) as f:
+            dead = [json.loads(line) for line in f]
+        stats = outbox.get_outbox_stats()
+        
+        (outbox.OUTBOX_DIR, outbox.OUTBOX_BACKOFF_BASE, outbox.OUTBOX_POLL_INTERVAL, outbox.SENDERS) = original
+        del outbox.RATE_LIMITS["test"]
+    
+    print(f"✓ 10 sends for 8 messages in {elapsed:.2f}s at 20/s, {len(dead)} dead letter(s)")
+    assert attempts[0] == 3 and attempts[1] == 1
+    assert sorted(attempts) == list(range(8))
+    # 10 sends at 20/s with a burst of 2 need at least 0.4s
+    assert elapsed >= 0.35
+    assert [message["payload"] for message in dead] == [{"n": 1}]
+    assert dead[0]["last_error"] == "400 Invalid To header"
+    assert stats["queued"]["test"] == 0 and stats["dead_letters"] == 1
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        # Buckets on the same file share one quota, as separate processes do
+        path = os.path.join(tmp, "test.json")
+        first, second = outbox.TokenBucket(1, 2, path), outbox.TokenBucket(1, 2, path)
+        assert first.reserve() == 0 and second.reserve() == 0
+        assert first.reserve() > 0 and second.reserve() > 0
+        second.pause(60)
+        assert first.reserve() > 50
+        print("✓ Token bucket state shared through its file")
+        
+        # Messages backing off past the deadline do not hold up drain
+        outbox.OUTBOX_DIR = tmp
+        message_id = outbox.enqueue("gmail", {"n": 0})
+        path = outbox._find("gmail", message_id)[0]
+        with open(path) as f:
+            message = json.load(f)
+        message["next_attempt_at"] = time.time() + 600
+        outbox._write_message(message)
+        os.remove(path)
+        started = time.monotonic()
+        assert not outbox.drain(["gmail"], timeout=30)
+        assert time.monotonic() - started < 1
+        outbox.OUTBOX_DIR = original[0]
+    print("✓ Drain returned at once for a message backing off past its deadline")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        # Messages waiting on an exhausted quota do not hold up drain either
+        outbox.OUTBOX_DIR = tmp
+        outbox.OUTBOX_POLL_INTERVAL = 0.01
+        outbox.SENDERS["test"] = flaky_sender
+        outbox.RATE_LIMITS["test"] = (1, 600)
+        attempts.clear()
+        assert outbox.get_bucket("test").reserve() == 0
+        outbox.enqueue("test", {"n": 2})
+        outbox.start_workers(["test"], workers=1)
+        started = time.monotonic()
+        assert not outbox.drain(["test"], timeout=30)
+        elapsed = time.monotonic() - started
+        outbox.stop_workers()
+        left = outbox.queued(["test"])
+        outbox.OUTBOX_DIR, outbox.OUTBOX_POLL_INTERVAL = original[0], original[2]
+        del outbox.SENDERS["test"], outbox.RATE_LIMITS["test"]
+    
+    print(f"✓ Drain returned after {elapsed:.2f}s with the quota exhausted")
+    assert elapsed < 5 and left == 1 and not attempts
+
+
+def test_rollups():
+    """Test daily rollups: incremental refresh and yesterday / 7-day / per-state queries"""
+    print("\n\nTesting Rollups...")
+    
+    from datetime import datetime, timedelta
+    from utils import shared_state
+    from utils import rollups as rollups_module
+    from utils.rollups import refresh_rollups, rollup_path
+    
+    today = datetime.utcnow().date()
+    
+    def processed(state, days_ago, amount, programs):
+        day = today - timedelta(days=days_ago)
+        return {
+            "linkedin_url": f"https://www.linkedin.com/in/{state}-{days_ago}-{amount}",
+            "state": state,
+            "status": "processed",
+            "processed_at": f"{day.isoformat()}T12:00:00",
+            "amount_unlocked": amount,
+            "programs": list(programs),
+            "program_amounts": programs
+        }
+    
+    original = shared_state.SHARED_STATE_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_state.SHARED_STATE_FILE = os.path.join(tmp, "shared_state.jsonl")
+        
+        append_to_shared_state({"linkedin_url": "pending-1", "state": "CA", "status": "pending"})
+        append_to_shared_state(processed("CA", 1, 1500.0, {"UI": 1200.0, "SNAP": 300.0}))
+        append_to_shared_state(processed("TX", 1, 900.0, {"UI": 900.0}))
+        append_to_shared_state(processed("CA", 3, 2000.0, {"UI": 2000.0}))
+        append_to_shared_state(processed("NY", 10, 5000.0, {"UI": 5000.0}))
+        
+        rollups = refresh_rollups(shared_state.SHARED_STATE_FILE)
+        assert rollups["offset"] == os.path.getsize(shared_state.SHARED_STATE_FILE)
+        
+        # A partial line is left for the next refresh
+        with open(shared_state.SHARED_STATE_FILE, 'a') as f:
+            f.write('{"status": "processed"')
+        assert refresh_rollups(shared_state.SHARED_STATE_FILE)["offset"] == rollups["offset"]
+        
+        # A refresh interrupted after writing the day files does not count lines twice
+        with open(rollup_path(shared_state.SHARED_STATE_FILE), 'w') as f:
+            json.dump(dict(rollups, offset=0), f)
+        rollups_module._loaded.clear()
+        rollups_module._days.clear()
+        assert refresh_rollups(shared_state.SHARED_STATE_FILE)["offset"] == rollups["offset"]
+        day_files = os.listdir(rollups_module.rollup_dir(shared_state.SHARED_STATE_FILE))
+        
+        yesterday_stats = shared_state.get_period_statistics()
+        week = shared_state.get_last_days_statistics(7)
+        california = shared_state.get_last_days_statistics(30)["by_state"]["CA"]
+        texas = shared_state.get_period_statistics(state="TX")
+        rollup_exists = os.path.exists(rollup_path(shared_state.SHARED_STATE_FILE))
+        
+        shared_state.SHARED_STATE_FILE = original
+    
+    print(f"✓ Yesterday: {yesterday_stats['cases']} cases, ${yesterday_stats['amount']:,.2f}")
+    print(f"✓ Last 7 days: {week['cases']} cases, ${week['amount']:,.2f}")
+    assert rollup_exists
+    assert len(day_files) == 4
+    assert yesterday_stats["cases"] == 2 and yesterday_stats["amount"] == 2400.0
+    assert yesterday_stats["by_program"]["UI"] == {"cases": 2, "amount": 2100.0}
+    assert yesterday_stats["by_program"]["SNAP"] == {"cases": 1, "amount": 300.0}
+    assert week["cases"] == 3 and week["amount"] == 4400.0
+    assert "NY" not in week["by_state"]
+    assert california == {"cases": 2, "amount": 3500.0}
+    assert texas["cases"] == 1 and texas["amount"] == 900.0
+
+
+def test_unique_workers():
+    """Test HyperLogLog unique-worker counts: canonical URLs, error bound and merging"""
+    print("\n\nTesting Unique Worker Sketches...")
+    
+    from datetime import datetime, timedelta
+    from utils import shared_state
+    from utils.hyperloglog import HyperLogLog, canonical_worker_id, standard_error
+    
+    assert canonical_worker_id("https://www.linkedin.com/in/Jane-Doe-123/?trk=feed") == "in/jane-doe-123"
+    assert canonical_worker_id(
+        "https://uk.linkedin.com/posts/jane-doe-123_laid-off-today-activity-7123456789-AbCd"
+    ) == "in/jane-doe-123"
+    assert canonical_worker_id("https://Example.com/story/42/?utm=x#top") == "example.com/story/42"
+    
+    # Estimates over 20k items stay within 3 standard errors
+    first, second = HyperLogLog(), HyperLogLog()
+    first.update(f"worker-{n}" for n in range(20000))
+    second.update(f"worker-{n}" for n in range(10000, 30000))
+    error = abs(first.count() - 20000) / 20000
+    restored = HyperLogLog.from_string(first.to_string())
+    restored.merge(second)
+    union_error = abs(restored.count() - 30000) / 30000
+    print(f"✓ 20k items: {error:.2%} error, union of 30k: {union_error:.2%} "
+          f"(standard error {standard_error():.2%}, {len(first.to_string())} bytes serialized)")
+    assert error < 3 * standard_error() and union_error < 3 * standard_error()
+    assert restored.registers == bytearray(map(max, first.registers, second.registers))
+    
+    day = (datetime.utcnow().date() - timedelta(days=1)).isoformat()
+    rows = []
+    for n in range(50):
+        post = f"https://www.linkedin.com/posts/worker-{n}_laid-off-activity-{n}"
+        rows.append({"linkedin_url": post, "state": "CA" if n % 2 else "TX", "status": "pending",
+                     "timestamp": f"{day}T08:00:00"})
+        rows.append({"linkedin_url": post, "state": "CA" if n % 2 else "TX", "status": "processed",
+                     "processed_at": f"{day}T09:00:00", "amount_unlocked": 100.0, "programs": []})
+    # Reposts by ten of the same workers
+    for n in range(10):
+        rows.append({"linkedin_url": f"https://www.linkedin.com/in/worker-{n}/", "state": "CA" if n % 2 else "TX",
+                     "status": "processed", "processed_at": f"{day}T10:00:00", "amount_unlocked": 100.0})
+    
+    original = shared_state.SHARED_STATE_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_state.SHARED_STATE_FILE = os.path.join(tmp, "shared_state.jsonl")
+        for row in rows:
+            append_to_shared_state(row)
+        yesterday_stats = shared_state.get_period_statistics()
+        all_time = shared_state.get_statistics()
+        shared_state.SHARED_STATE_FILE = original
+    
+    print(f"✓ {all_time['total_rows']} rows, {yesterday_stats['cases']} processed cases, "
+          f"{yesterday_stats['unique_workers']} unique workers")
+    assert all_time["total_rows"] == 110 and yesterday_stats["cases"] == 60
+    # Linear counting is off by at most a register collision or two at this size
+    assert abs(yesterday_stats["unique_workers"] - 50) <= 2
+    assert all(abs(n - 25) <= 2 for n in yesterday_stats["unique_workers_by_state"].values())
+    assert all_time["unique_workers"] == all_time["unique_workers_seen"] == yesterday_stats["unique_workers"]
+
+
+def test_publisher():
+    """Test concurrent publishing with reused clients, and rate-limited posts going to the outbox"""
+    print("\n\nTesting Publisher...")
+    
+    import time
+    from unittest import mock
+    from utils import outbox, publisher
+    from agents.watchdog import generate_daily_stats_message
+    
+    server, root_url = _start_local_server(FakeSocialHandler)
+    FakeSocialHandler.latency = 0.3
+    credentials = {
+        "TWITTER_API_KEY": "key", "TWITTER_API_SECRET": "secret",
+        "TWITTER_ACCESS_TOKEN": "token", "TWITTER_ACCESS_TOKEN_SECRET": "token-secret",
+        "LINKEDIN_ACCESS_TOKEN": "linkedin-token", "LINKEDIN_PERSON_URN": "urn:li:person:test"
+    }
+    snapshot = {
+        "yesterday": {"cases": 3, "amount": 4200.0, "unique_workers": 2, "by_state": {},
+                      "unique_workers_by_state": {}},
+        "week": {"cases": 3, "amount": 4200.0, "unique_workers": 2, "by_state": {"CA": {"cases": 3, "amount": 4200.0}},
+                 "unique_workers_by_state": {"CA": 2}}
+    }
+    messages = {platform: generate_daily_stats_message(platform, snapshot) for platform in ("twitter", "linkedin")}
+    
+    original = (publisher.TWITTER_API_BASE, publisher.LINKEDIN_API_BASE, outbox.OUTBOX_DIR)
+    with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, credentials):
+        publisher.reset_clients()
+        publisher.TWITTER_API_BASE = root_url.rstrip("/")
+        publisher.LINKEDIN_API_BASE = root_url + "v2"
+        outbox.OUTBOX_DIR = tmp
+        
+        started = time.monotonic()
+        first = publisher.publish(messages, key_prefix="test")
+        elapsed = time.monotonic() - started
+        second = publisher.publish(messages, key_prefix="test")
+        same_client = publisher.get_twitter_client() is publisher.get_twitter_client()
+        
+        # A rate-limited post is queued for the outbox instead of waiting
+        FakeSocialHandler.linkedin_status = 429
+        limited = publisher.publish({"linkedin": messages["linkedin"]}, key_prefix="limited")
+        queued = outbox.queued(["linkedin"])
+        
+        # With the platform's quota used up, the post is queued without being sent
+        bucket = outbox.get_bucket("twitter")
+        while bucket.reserve() == 0:
+            pass
+        posts_before = len(FakeSocialHandler.posts)
+        exhausted = publisher.publish({"twitter": messages["twitter"]}, key_prefix="exhausted")
+        with open(outbox._find("twitter", exhausted["twitter"]["queued_as"])[0]) as f:
+            deferred_by = json.load(f)["next_attempt_at"] - time.time()
+        posts_after = len(FakeSocialHandler.posts)
+        
+        FakeSocialHandler.linkedin_status = 201
+        FakeSocialHandler.latency = 0.0
+        publisher.reset_clients()
+        (publisher.TWITTER_API_BASE, publisher.LINKEDIN_API_BASE, outbox.OUTBOX_DIR) = original
+    server.shutdown()
+    
+    print(f"✓ Posted to both platforms in {elapsed:.2f}s with 0.3s per request")
+    print(f"✓ {len(FakeSocialHandler.posts)} posts over {len(FakeSocialHandler.connections)} connections")
+    print(f"✓ Post queued for {deferred_by / 3600:.1f}h with the X quota exhausted")
+    assert "helped 2 laid-off workers" in messages["twitter"] and "CA (2)" in messages["linkedin"]
+    assert all(result["status"] == "success" for result in list(first.values()) + list(second.values()))
+    assert first["twitter"]["tweet_id"] == "1001" and first["linkedin"]["post_id"] == "urn:li:share:2002"
+    assert elapsed < 0.55
+    assert same_client
+    # Two sequential publishes per platform reuse the pooled connections
+    assert len(FakeSocialHandler.connections) == 2
+    assert limited["linkedin"]["status"] == "queued" and limited["linkedin"]["retry_after"] == 60
+    assert queued == 1
+    assert exhausted["twitter"]["status"] == "queued" and posts_after == posts_before
+    # 17 posts a day: the next token is more than an hour away
+    assert deferred_by > 3600
+
+
+def test_columnar_export():
+    """Test incremental columnar export and vectorized per-state totals"""
+    print("\n\nTesting Columnar Export...")
+    
+    from datetime import datetime, timedelta
+    from utils import columnar
+    
+    day = datetime.utcnow().date() - timedelta(days=1)
+    
+    def row(n, status="processed"):
+        return {
+            "linkedin_url": f"https://www.linkedin.com/in/worker-{n % 5}/",
+            "state": ["CA", "TX", "NY"][n % 3],
+            "status": status,
+            "processed_at": f"{day.isoformat()}T12:00:00",
+            "amount_unlocked": 100.0 * (n + 1),
+            "programs": ["UI", "SNAP"],
+            "program_amounts": {"UI": 80.0 * (n + 1), "SNAP": 20.0 * (n + 1)}
+        }
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        state_file = os.path.join(tmp, "shared_state.jsonl")
+        export_dir = os.path.join(tmp, "export")
+        with open(state_file, 'w') as f:
+            f.writelines(json.dumps(row(n)) + "\n" for n in range(6))
+        
+        if columnar.np is None:
+            result = columnar.export_shared_state(state_file, export_dir, fmt="npy")
+            print(f"✓ numpy not installed, export reports: {result['message']}")
+            assert result["status"] == "error" and "numpy" in result["message"]
+            return
+        
+        formats = ["npy"] + (["parquet"] if columnar.pq is not None else [])
+        for fmt in formats:
+            first = columnar.export_shared_state(state_file, export_dir, fmt=fmt)
+            with open(state_file, 'a') as f:
+                f.writelines(json.dumps(row(n)) + "\n" for n in range(6, 9))
+                f.write(json.dumps({"linkedin_url": "https://www.linkedin.com/in/worker-0/", "state": "CA",
+                                    "status": "pending", "timestamp": f"{day.isoformat()}T08:00:00"}) + "\n")
+            second = columnar.export_shared_state(state_file, export_dir, fmt=fmt)
+            unchanged = columnar.export_shared_state(state_file, export_dir, fmt=fmt)
+            export = columnar.load_export(export_dir)
+            totals = columnar.totals_by_state(export, day, day)
+            
+            print(f"✓ {fmt}: exported {first['rows_added']} + {second['rows_added']} rows in {second['parts']} parts")
+            assert (first["rows_added"], second["rows_added"], unchanged["rows_added"]) == (6, 4, 0)
+            assert second["parts"] == 2 and export["rows"] == 10
+            assert export["dictionaries"]["status"] == ["processed", "pending"]
+            assert len(export["programs"]["row"]) == 18 and export["programs"]["row"].max() == 8
+            # Rows 0..8 processed: CA gets 0, 3, 6; TX 1, 4, 7; NY 2, 5, 8
+            assert totals["CA"] == {"cases": 3, "amount": 1200.0, "workers": 3}
+            assert totals["NY"]["amount"] == 1800.0
+            
+            # Start the log over for the next format
+            with open(state_file, 'w') as f:
+                f.writelines(json.dumps(row(n)) + "\n" for n in range(6))
+
+
+def test_columnar_roundtrip():
+    """Test that exported dictionary codes decode to the logged values across exports (needs numpy and pyarrow)"""
+    import pytest
+    pytest.importorskip("numpy")
+    pq = pytest.importorskip("pyarrow.parquet")
+    print("\n\nTesting Columnar Round Trip...")
+    
+    from utils import columnar
+    
+    first_rows = [
+        {"state": "CA", "status": "processed", "processed_at": "2024-03-01T10:00:00",
+         "amount_unlocked": 120.5, "programs": ["UI"], "program_amounts": {"UI": 120.5}},
+        {"state": "TX", "status": "pending", "timestamp": "2024-03-02T10:00:00"}
+    ]
+    # New values for every dictionary, plus ones already coded
+    second_rows = [
+        {"state": "WA", "status": "failed", "timestamp": "2024-03-03T10:00:00",
+         "programs": ["SNAP", "UI"], "program_amounts": {"SNAP": 30.0, "UI": 10.0}},
+        {"state": "CA", "status": "processed", "processed_at": "2024-03-04T10:00:00",
+         "amount_unlocked": 99.0, "programs": ["UI"], "program_amounts": {"UI": 99.0}}
+    ]
+    rows = first_rows + second_rows
+    
+    for fmt in ("npy", "parquet"):
+        with tempfile.TemporaryDirectory() as tmp:
+            state_file = os.path.join(tmp, "shared_state.jsonl")
+            export_dir = os.path.join(tmp, "export")
+            for batch in (first_rows, second_rows):
+                with open(state_file, 'a') as f:
+                    f.writelines(json.dumps(row) + "\n" for row in batch)
+                assert columnar.export_shared_state(state_file, export_dir, fmt=fmt)["rows_added"] == 2
+            
+            export = columnar.load_export(export_dir)
+            dictionaries = export["dictionaries"]
+            cases = export["cases"]
+            assert [dictionaries["state"][code] for code in cases["state"]] == [row["state"] for row in rows]
+            assert [dictionaries["status"][code] for code in cases["status"]] == [row["status"] for row in rows]
+            assert list(cases["day"]) == [19783, 19784, 19785, 19786]
+            assert [None if amount != amount else amount for amount in cases["amount"]] == [120.5, None, None, 99.0]
+            programs = export["programs"]
+            assert [(row, dictionaries["program"][code], amount) for row, code, amount in
+                    zip(programs["row"], programs["program"], programs["amount"])] == [
+                (0, "UI", 120.5), (2, "SNAP", 30.0), (2, "UI", 10.0), (3, "UI", 99.0)
+            ]
+            
+            if fmt == "parquet":
+                # Each part decodes on its own with the dictionary written into it
+                meta = columnar._load_meta(export_dir)
+                decoded = []
+                for part in meta["parts"]:
+                    decoded += pq.read_table(os.path.join(export_dir, part, "cases.parquet")).column("state").to_pylist()
+                assert decoded == [row["state"] for row in rows]
+            print(f"✓ {fmt}: two exports decode back to the logged states, statuses and programs")
+
+
+def test_lazy_imports():
+    """Test that entry points only import the heavy libraries their command uses"""
+    print("\n\nTesting Lazy Imports...")
+    
+    import subprocess
+    import sys
+    
+    script = (
+        "import sys, main, agents.watchdog, tools.eligibility_engine; "
+        "heavy = ('google.adk', 'googleapiclient', 'pypdf', 'tweepy', 'feedparser'); "
+        "print(sorted(h for h in heavy if any(m == h or m.startswith(h + '.') for m in sys.modules))); "
+        "tools.eligibility_engine.eligibility_engine_adk_tool; "
+        "print('google.adk' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    )
+    loaded, adk_after_access = result.stdout.strip().splitlines()[-2:]
+    print(f"✓ Heavy modules imported by main + watchdog + eligibility engine: {loaded}")
+    assert loaded == "[]"
+    # The ADK tool is still there, built on first access
+    assert adk_after_access == "True"
+    
+    from tools import eligibility_engine
+    assert eligibility_engine.eligibility_engine_adk_tool is eligibility_engine.eligibility_engine_adk_tool
+    assert eligibility_engine.eligibility_engine_adk_tool.func is eligibility_engine.cached_eligibility_engine_tool
+
+
+def test_supervisor():
+    """Test the single-process supervisor: scout hand-off, caseworker pool and graceful drain"""
+    print("\n\nTesting Supervisor...")
+    
+    import time
+    from unittest import mock
+    from utils import shared_state
+    from agents import scout, supervisor
+    
+    handled = []
+    
+    def fake_process_case(entry):
+        time.sleep(0.05)
+        if "broken" in entry["linkedin_url"]:
+            raise RuntimeError("template download failed")
+        handled.append(entry["linkedin_url"])
+    
+    posts = [
+        {"title": f"Post {n}", "linkedin_url": f"https://www.linkedin.com/posts/worker-{n}_laid-off",
+         "published": "", "summary": "", "state": "CA", "full_text": "I was laid off in California"}
+        for n in range(6)
+    ]
+    posts.append(dict(posts[0], linkedin_url="https://www.linkedin.com/posts/broken_laid-off"))
+    
+    original = shared_state.SHARED_STATE_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_state.SHARED_STATE_FILE = os.path.join(tmp, "shared_state.jsonl")
+        # One case left pending by an earlier run, one already processed
+        append_to_shared_state({"linkedin_url": "https://www.linkedin.com/posts/old_post", "status": "pending"})
+        append_to_shared_state({"linkedin_url": "https://www.linkedin.com/posts/done_post", "status": "pending"})
+        append_to_shared_state({"linkedin_url": "https://www.linkedin.com/posts/done_post", "status": "processed"})
+        
+        with mock.patch.object(scout, "fetch_linkedin_layoff_posts", return_value=posts), \
+                mock.patch.object(scout, "start_caseworker_process") as spawn:
+            pool = supervisor.Supervisor(caseworkers=3, process=fake_process_case, outbox_destinations=[])
+            pool.start(schedule_jobs=False)
+            pool.scout_job()
+            # A second scout run finds nothing new
+            pool.scout_job()
+            started = time.monotonic()
+            drained = pool.shutdown(timeout=10)
+            elapsed = time.monotonic() - started
+            refused = pool.submit({"linkedin_url": "https://www.linkedin.com/posts/late"})
+        
+        shared_state.SHARED_STATE_FILE = original
+    
+    print(f"✓ {len(handled)} cases handled by 3 caseworkers, drained in {elapsed:.2f}s: {pool.stats}")
+    assert drained and not refused
+    assert not spawn.called
+    assert sorted(handled) == sorted([post["linkedin_url"] for post in posts[:6]] +
+                                     ["https://www.linkedin.com/posts/old_post"])
+    assert pool.stats == {"queued": 8, "processed": 7, "failed": 1}
+
+
+def test_metrics():
+    """Test metrics: Prometheus text output, /metrics endpoint, textfile and instrumentation"""
+    print("\n\nTesting Metrics...")
+    
+    import socket
+    import time
+    import urllib.request
+    from unittest import mock
+    from utils import metrics, outbox, shared_state
+    from agents import scout
+    
+    requests_total = metrics.counter("test_requests_total", "Test requests", ["route"])
+    depth = metrics.gauge("test_queue_depth", "Test queue depth", function=lambda: 7)
+    latency = metrics.histogram("test_latency_seconds", "Test latency", buckets=(0.1, 1))
+    requests_total.inc(route="/a")
+    requests_total.inc(2, route='/b "quoted"')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    with metrics.api_call("test_api", "fail") as timer:
+        timer.outcome = "error"
+    
+    # Hot path cost
+    started = time.perf_counter()
+    for _ in range(100000):
+        requests_total.inc(route="/a")
+    per_inc = (time.perf_counter() - started) / 100000
+    
+    posts = [
+        {"title": "Post", "linkedin_url": f"https://www.linkedin.com/posts/metrics-{n}_x", "published": "",
+         "summary": "", "state": "TX", "full_text": "Laid off in Texas"}
+        for n in range(3)
+    ]
+    fetched_before = scout.POSTS_FETCHED.value()
+    original = shared_state.SHARED_STATE_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_state.SHARED_STATE_FILE = os.path.join(tmp, "shared_state.jsonl")
+        append_to_shared_state({"linkedin_url": posts[0]["linkedin_url"], "status": "pending"})
+        with mock.patch.object(scout, "fetch_linkedin_layoff_posts", return_value=posts):
+            scout.process_new_posts(on_new_post=lambda entry: None)
+        shared_state.SHARED_STATE_FILE = original
+        
+        server = metrics.start_http_server(0)
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            content_type = response.headers["Content-Type"]
+            scraped = response.read().decode()
+        server.shutdown()
+        textfile = metrics.write_textfile(os.path.join(tmp, "collector", "second_chance.prom"), agent="scout")
+        with open(textfile) as f:
+            written = f.read()
+        
+        # Rendering the outbox gauge must not create the outbox
+        original_outbox = outbox.OUTBOX_DIR
+        outbox.OUTBOX_DIR = os.path.join(tmp, "no_outbox")
+        metrics.render()
+        outbox_created = os.path.exists(outbox.OUTBOX_DIR)
+        outbox.OUTBOX_DIR = original_outbox
+    
+    # A port held by another process is logged, not raised
+    busy = socket.socket()
+    busy.bind(("127.0.0.1", 0))
+    busy.listen(1)
+    saved = (metrics.METRICS_PORT, metrics.METRICS_TEXTFILE, dict(metrics._exporters))
+    metrics.METRICS_PORT, metrics.METRICS_TEXTFILE = busy.getsockname()[1], ""
+    metrics._exporters.clear()
+    try:
+        metrics.start_exporters("caseworker")
+        http_exporter = metrics._exporters["http"]
+    finally:
+        busy.close()
+        metrics.METRICS_PORT, metrics.METRICS_TEXTFILE = saved[0], saved[1]
+        metrics._exporters.clear()
+        metrics._exporters.update(saved[2])
+    
+    print(f"✓ Scraped {len(scraped.splitlines())} lines; counter inc costs {per_inc * 1e6:.2f} µs")
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert "# TYPE second_chance_test_requests_total counter" in scraped
+    assert 'second_chance_test_requests_total{route="/a"} 100001' in scraped
+    assert 'second_chance_test_requests_total{route="/b \\"quoted\\""} 2' in scraped
+    assert "second_chance_test_queue_depth 7" in scraped
+    assert 'second_chance_test_latency_seconds_bucket{le="0.1"} 1' in scraped
+    assert 'second_chance_test_latency_seconds_bucket{le="1"} 2' in scraped
+    assert 'second_chance_test_latency_seconds_bucket{le="+Inf"} 3' in scraped
+    assert "second_chance_test_latency_seconds_count 3" in scraped
+    assert 'second_chance_api_call_seconds_count{api="test_api",call="fail",outcome="error"} 1' in scraped
+    assert "second_chance_outbox_queue_depth" in scraped
+    assert scout.POSTS_FETCHED.value() - fetched_before == 3
+    assert "second_chance_scout_posts_deduped_total" in scraped
+    assert written.startswith("# HELP")
+    assert textfile.endswith(os.path.join("collector", "second_chance.scout.prom"))
+    assert 'second_chance_test_queue_depth{agent="scout"} 7' in written
+    assert not outbox_created
+    assert http_exporter is None
+    assert per_inc < 50e-6
+    assert depth.function() == 7
+
+
 if __name__ == "__main__":
     print("=" * 60)
     print("Second-Chance Agent - Component Tests")
@@ -79,7 +1796,30 @@ if __name__ == "__main__":
     
     test_eligibility_engine()
     test_shared_state()
+    test_rollups()
+    test_unique_workers()
+    test_columnar_export()
     test_state_extraction()
+    test_post_extraction()
+    test_llm_extraction()
+    test_tool_cache()
+    test_lazy_imports()
+    test_template_cache()
+    test_drive_mirror_sync()
+    test_drive_parallel_download()
+    test_google_clients()
+    test_form_filler()
+    test_packet_builder()
+    test_caseworker_packet_handoff()
+    test_caseworker_rerun_reuses_draft()
+    test_checkpoints()
+    test_step_graph()
+    test_gmail_batch_drafts()
+    test_gmail_resumable_upload()
+    test_outbox()
+    test_publisher()
+    test_supervisor()
+    test_metrics()
     
     print("\n" + "=" * 60)
     print("Tests completed!")
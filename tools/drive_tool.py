@@ -3,41 +3,112 @@ Google Drive Tool - Downloads PDF forms from Google Drive
 """
 import os
 import io
-from typing import List, Dict, Any
-from google.adk.tools import FunctionTool
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import json
+import tempfile
+import threading
+import time
+import schedule
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from tools.tool_cache import lazy_adk_tools, memoize_tool
 from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.errors import HttpError
+from utils import google_clients, metrics, template_cache
 
 
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 
+# Local mirror of GOOGLE_DRIVE_FOLDER_ID maintained by sync_drive_folder()
+DRIVE_MIRROR_DIR = os.getenv("DRIVE_MIRROR_DIR", "forms/_mirror")
+DRIVE_MIRROR_MAX_AGE = int(os.getenv("DRIVE_MIRROR_MAX_AGE", "86400"))
+DRIVE_SYNC_INTERVAL_MINUTES = int(os.getenv("DRIVE_SYNC_INTERVAL_MINUTES", "15"))
+MIRROR_STATE_FILE = ".sync_state.json"
+
+# Download manager tuning
+DRIVE_DOWNLOAD_WORKERS = int(os.getenv("DRIVE_DOWNLOAD_WORKERS", "8"))
+DRIVE_DOWNLOAD_CHUNK_SIZE = int(os.getenv("DRIVE_DOWNLOAD_CHUNK_SIZE", str(16 * 1024 * 1024)))
+
+_download_pool: Optional[ThreadPoolExecutor] = None
+_download_pool_lock = threading.Lock()
+
 
 def authenticate_drive():
     """Authenticate and return Drive service"""
-    creds = None
+    return google_clients.get_service('drive', 'v3', SCOPES, 'token_drive.json')
+
+
+def _get_download_pool() -> ThreadPoolExecutor:
+    """Returns the process-wide download pool, started on first use"""
+    global _download_pool
+    with _download_pool_lock:
+        if _download_pool is None:
+            _download_pool = ThreadPoolExecutor(
+                max_workers=DRIVE_DOWNLOAD_WORKERS, thread_name_prefix="drive-download"
+            )
+        return _download_pool
+
+
+def _download_file(service, http, file_id: str, target_path: str, chunk_size: int) -> str:
+    """Downloads one Drive file to a temporary file and atomically renames it into place"""
+    request = service.files().get_media(fileId=file_id)
+    request.http = http
+    
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(target_path) or '.', prefix='.', suffix='.part'
+    )
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            downloader = MediaIoBaseDownload(fh, request, chunksize=chunk_size)
+            done = False
+            while not done:
+                with metrics.api_call("drive", "files.get_media"):
+                    status, done = downloader.next_chunk(num_retries=3)
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return target_path
+
+
+def download_files(
+    service,
+    jobs: List[Tuple[str, str]],
+    chunk_size: int = None,
+    http=None
+) -> List[str]:
+    """
+    Downloads several Drive files concurrently on the shared download pool.
     
-    if os.path.exists('token_drive.json'):
-        creds = Credentials.from_authorized_user_file('token_drive.json', SCOPES)
+    At most DRIVE_DOWNLOAD_WORKERS files download at once across the
+    process. Every chunk request borrows a keep-alive transport from the
+    client's PooledHttp (utils/google_clients.py), so connections are
+    reused across calls.
     
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists('credentials.json'):
-                print("Please download credentials.json from Google Cloud Console")
-                return None
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        with open('token_drive.json', 'w') as token:
-            token.write(creds.to_json())
+    Args:
+        service: Drive service
+        jobs: List of (file_id, target_path) pairs
+        chunk_size: Bytes per download request (defaults to DRIVE_DOWNLOAD_CHUNK_SIZE)
+        http: Transport for the downloads (defaults to the pool of a client
+            from get_service, or an unauthorized pool for other clients)
+    
+    Returns:
+        List of target paths, in the order of jobs
+    """
+    if not jobs:
+        return []
     
-    return build('drive', 'v3', credentials=creds)
+    chunk_size = chunk_size or DRIVE_DOWNLOAD_CHUNK_SIZE
+    http = http or google_clients.get_http(service) or google_clients.PooledHttp()
+    
+    futures = [
+        _get_download_pool().submit(_download_file, service, http, file_id, target_path, chunk_size)
+        for file_id, target_path in jobs
+    ]
+    # Let every download finish or clean up before reporting a failure
+    wait(futures)
+    return [future.result() for future in futures]
 
 
 def download_pdfs_from_drive(
@@ -48,6 +119,9 @@ def download_pdfs_from_drive(
     """
     Downloads PDF forms from a Google Drive folder for a specific state.
     
+    Forms are served from the local template cache (utils/template_cache.py)
+    and only re-downloaded when their Drive checksum changes.
+    
     Args:
         folder_id: Google Drive folder ID containing PDF forms
         state: Two-letter state abbreviation
@@ -57,6 +131,23 @@ def download_pdfs_from_drive(
         List of downloaded PDF file paths
     """
     try:
+        # Serve from the background mirror without touching Drive
+        mirrored = _mirror_paths(folder_id, state, output_dir)
+        if mirrored is not None:
+            paths, missing = mirrored
+            if missing:
+                service = authenticate_drive()
+                if not service:
+                    return paths
+                paths += download_files(service, missing)
+            return paths
+        
+        # Serve straight from the template cache while the listing is fresh
+        cached = template_cache.get_fresh_listing(folder_id, state)
+        if cached is not None:
+            template_cache.record_usage(hits=cached, misses=[])
+            return [template_cache.materialize(record, output_dir) for record in cached]
+        
         service = authenticate_drive()
         if not service:
             return []
@@ -66,30 +157,35 @@ def download_pdfs_from_drive(
         
         # Search for PDFs in the folder
         query = f"'{folder_id}' in parents and mimeType='application/pdf' and name contains '{state}'"
-        results = service.files().list(
-            q=query,
-            fields="files(id, name)"
-        ).execute()
+        with metrics.api_call("drive", "files.list"):
+            results = service.files().list(
+                q=query,
+                fields="files(id, name, md5Checksum, modifiedTime, size)"
+            ).execute()
         
         files = results.get('files', [])
-        downloaded_paths = []
+        records = template_cache.lookup_many(files)
+        missing = [file for file in files if file['id'] not in records]
+        hits = list(records.values())
         
-        for file in files:
-            file_id = file['id']
-            file_name = file['name']
-            
-            # Download file
-            request = service.files().get_media(fileId=file_id)
-            file_path = os.path.join(output_dir, file_name)
-            
-            with open(file_path, 'wb') as fh:
-                downloader = MediaIoBaseDownload(fh, request)
-                done = False
-                while not done:
-                    status, done = downloader.next_chunk()
-            
-            downloaded_paths.append(file_path)
-            print(f"Downloaded: {file_name}")
+        # Fetch all cache misses in parallel
+        staging_dir = template_cache.staging_dir()
+        staged = download_files(
+            service,
+            [(file['id'], os.path.join(staging_dir, f"{file['id']}.pdf")) for file in missing]
+        )
+        misses = []
+        for file, staged_path in zip(missing, staged):
+            records[file['id']] = template_cache.store(file, staged_path)
+            misses.append(records[file['id']])
+            print(f"Downloaded: {file['name']}")
+        
+        downloaded_paths = [
+            template_cache.materialize(records[file['id']], output_dir) for file in files
+        ]
+        
+        template_cache.record_listing(folder_id, state, [file['id'] for file in files])
+        template_cache.record_usage(hits=hits, misses=misses)
         
         return downloaded_paths
     
@@ -101,6 +197,230 @@ def download_pdfs_from_drive(
         return []
 
 
+def _load_mirror_state(mirror_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(mirror_dir, MIRROR_STATE_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_mirror_state(mirror_dir: str, sync_state: Dict[str, Any]) -> None:
+    path = os.path.join(mirror_dir, MIRROR_STATE_FILE)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(sync_state, f)
+    os.replace(path + ".tmp", path)
+
+
+def _mirror_paths(
+    folder_id: str,
+    state: str,
+    output_dir: str
+) -> Optional[Tuple[List[str], List[Tuple[str, str]]]]:
+    """
+    Returns local copies of a state's forms from the Drive mirror, or None
+    when there is no recent mirror of the folder.
+    
+    Files recorded in the mirror but gone from disk are returned as
+    (file_id, target_path) jobs to download from Drive instead. Their
+    records are dropped and the next sync lists the whole folder again,
+    which restores them.
+    """
+    sync_state = _load_mirror_state(DRIVE_MIRROR_DIR)
+    if sync_state.get("folder_id") != folder_id or not sync_state.get("page_token"):
+        return None
+    if time.time() - sync_state.get("synced_at", 0) > DRIVE_MIRROR_MAX_AGE:
+        return None
+    
+    os.makedirs(output_dir, exist_ok=True)
+    files = sync_state.get("files", {})
+    paths = []
+    missing = []
+    for file_id, meta in list(files.items()):
+        if state not in meta["name"]:
+            continue
+        source = os.path.join(DRIVE_MIRROR_DIR, meta["name"])
+        target = os.path.join(output_dir, meta["name"])
+        if not os.path.exists(source):
+            print(f"[DriveMirror] {meta['name']} is missing from the mirror, fetching from Drive")
+            del files[file_id]
+            missing.append((file_id, target))
+            continue
+        # A copy (reflinked where supported), so writing to the form cannot change the mirror
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            template_cache._clone_file(source, tmp_path)
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        paths.append(target)
+    
+    if missing:
+        sync_state["page_token"] = None
+        _save_mirror_state(DRIVE_MIRROR_DIR, sync_state)
+    return paths, missing
+
+
+def _mirror_remove(mirror_dir: str, files: Dict[str, Any], file_id: str) -> bool:
+    meta = files.pop(file_id, None)
+    if not meta:
+        return False
+    path = os.path.join(mirror_dir, meta["name"])
+    if os.path.exists(path):
+        os.remove(path)
+    return True
+
+
+def sync_drive_folder(
+    folder_id: str,
+    mirror_dir: str = None,
+    service=None
+) -> Dict[str, Any]:
+    """
+    Mirrors the PDFs in a Google Drive folder to local disk.
+    
+    The first sync lists the whole folder; later syncs read the Drive changes
+    feed from a persisted page token, so only files added, modified or removed
+    since the previous sync are transferred.
+    
+    Args:
+        folder_id: Google Drive folder ID to mirror
+        mirror_dir: Local mirror directory (defaults to DRIVE_MIRROR_DIR)
+        service: Drive service to use (authenticates if not provided)
+    
+    Returns:
+        Dictionary with status and counts of downloaded/removed files
+    """
+    mirror_dir = mirror_dir or DRIVE_MIRROR_DIR
+    try:
+        service = service or authenticate_drive()
+        if not service:
+            return {"status": "error", "message": "Drive authentication failed"}
+        
+        os.makedirs(mirror_dir, exist_ok=True)
+        sync_state = _load_mirror_state(mirror_dir)
+        if sync_state.get("folder_id") != folder_id:
+            sync_state = {"folder_id": folder_id, "page_token": None, "files": {}}
+        files = sync_state["files"]
+        pending = {}
+        downloaded = removed = 0
+        
+        def apply(file):
+            nonlocal removed
+            wanted = (
+                file.get('mimeType') == 'application/pdf'
+                and not file.get('trashed')
+                and folder_id in file.get('parents', [])
+            )
+            if not wanted:
+                removed += _mirror_remove(mirror_dir, files, file['id'])
+                return
+            
+            known = files.get(file['id'])
+            if known and known["md5"] == file.get('md5Checksum') \
+                    and known["modified_time"] == file.get('modifiedTime'):
+                return
+            if known and known["name"] != file['name']:
+                _mirror_remove(mirror_dir, files, file['id'])
+            pending[file['id']] = file
+        
+        def flush():
+            nonlocal downloaded
+            batch = list(pending.values())
+            pending.clear()
+            download_files(
+                service, [(file['id'], os.path.join(mirror_dir, file['name'])) for file in batch]
+            )
+            for file in batch:
+                files[file['id']] = {
+                    "name": file['name'],
+                    "md5": file.get('md5Checksum'),
+                    "modified_time": file.get('modifiedTime')
+                }
+            downloaded += len(batch)
+        
+        file_fields = "id, name, mimeType, md5Checksum, modifiedTime, parents, trashed"
+        
+        if not sync_state["page_token"]:
+            # Take the token before listing so changes made meanwhile are replayed
+            start_token = service.changes().getStartPageToken().execute()['startPageToken']
+            query = f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false"
+            listed_ids = set()
+            page_token = None
+            while True:
+                results = service.files().list(
+                    q=query,
+                    fields=f"nextPageToken, files({file_fields})",
+                    pageToken=page_token
+                ).execute()
+                for file in results.get('files', []):
+                    listed_ids.add(file['id'])
+                    apply(file)
+                flush()
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+            for file_id in set(files) - listed_ids:
+                removed += _mirror_remove(mirror_dir, files, file_id)
+            sync_state["page_token"] = start_token
+        else:
+            page_token = sync_state["page_token"]
+            while page_token:
+                results = service.changes().list(
+                    pageToken=page_token,
+                    spaces='drive',
+                    fields=f"nextPageToken, newStartPageToken, "
+                           f"changes(fileId, removed, file({file_fields}))"
+                ).execute()
+                for change in results.get('changes', []):
+                    if change.get('removed') or not change.get('file'):
+                        removed += _mirror_remove(mirror_dir, files, change['fileId'])
+                    else:
+                        apply(change['file'])
+                flush()
+                if results.get('newStartPageToken'):
+                    sync_state["page_token"] = results['newStartPageToken']
+                page_token = results.get('nextPageToken')
+        
+        sync_state["synced_at"] = time.time()
+        _save_mirror_state(mirror_dir, sync_state)
+        
+        return {
+            "status": "success",
+            "downloaded": downloaded,
+            "removed": removed,
+            "files": len(files),
+            "message": f"Mirror synced: {downloaded} downloaded, {removed} removed"
+        }
+    
+    except HttpError as error:
+        return {"status": "error", "message": f"Drive API error: {error}"}
+    except Exception as e:
+        return {"status": "error", "message": f"Error syncing Drive folder: {str(e)}"}
+
+
+def run_drive_sync():
+    """Keeps DRIVE_MIRROR_DIR in sync with GOOGLE_DRIVE_FOLDER_ID in the background"""
+    folder_id = os.getenv('GOOGLE_DRIVE_FOLDER_ID', '')
+    if not folder_id:
+        print("[DriveSync] GOOGLE_DRIVE_FOLDER_ID not set")
+        return
+    metrics.start_exporters("drive-sync")
+    
+    def sync_job():
+        result = sync_drive_folder(folder_id)
+        print(f"[DriveSync] {datetime.utcnow().isoformat()} {result['message']}")
+    
+    print(f"Mirroring Drive folder to {DRIVE_MIRROR_DIR} every {DRIVE_SYNC_INTERVAL_MINUTES} minutes")
+    schedule.every(DRIVE_SYNC_INTERVAL_MINUTES).minutes.do(sync_job)
+    sync_job()
+    
+    while True:
+        schedule.run_pending()
+        time.sleep(30)
+
+
 def drive_download_tool(
     folder_id: str,
     state: str,
@@ -136,7 +456,13 @@ def drive_download_tool(
     }
 
 
-# Create ADK Tool wrapper
+# I/O: a listing is reused for TOOL_CACHE_TTL seconds while its files are still on disk
+cached_drive_download_tool = memoize_tool(
+    "ttl",
+    validate=lambda result: all(os.path.exists(path) for path in result.get("files", []))
+)(drive_download_tool)
+
+# ADK Tool wrapper, built on first access (importing google.adk is slow)
 # FunctionTool automatically extracts name and description from the function docstring and signature
-drive_download_adk_tool = FunctionTool(drive_download_tool)
+__getattr__ = lazy_adk_tools(__name__, {"drive_download_adk_tool": cached_drive_download_tool})
 
@@ -3,7 +3,7 @@ Eligibility Engine Tool - Determines benefit eligibility based on state and post
 """
 import os
 from typing import Dict, List, Any
-from google.adk.tools import FunctionTool
+from tools.tool_cache import lazy_adk_tools, memoize_tool
 
 
 def eligibility_engine_tool(state: str, post_text: str) -> Dict[str, Any]:
@@ -15,7 +15,7 @@ def eligibility_engine_tool(state: str, post_text: str) -> Dict[str, Any]:
         post_text: The LinkedIn post text content
     
     Returns:
-        Dictionary with programs list and estimated total amount
+        Dictionary with programs list, estimated total amount and the amount per program
     """
     # State-specific benefit programs and average amounts
     # These are simplified estimates - real implementation would use state APIs
@@ -63,6 +63,7 @@ def eligibility_engine_tool(state: str, post_text: str) -> Dict[str, Any]:
     # Determine eligible programs based on post content analysis
     # In a real implementation, this would use LLM to analyze eligibility criteria
     eligible_programs = []
+    program_amounts = {}
     total_amount = 0
     
     # Basic eligibility logic (simplified)
@@ -73,25 +74,30 @@ def eligibility_engine_tool(state: str, post_text: str) -> Dict[str, Any]:
     if "laid off" in post_lower or "layoff" in post_lower or "terminated" in post_lower:
         eligible_programs.append("UI")
         ui_amount = benefits["UI"]["amount"] * benefits["UI"]["weeks"]
+        program_amounts["UI"] = ui_amount
         total_amount += ui_amount
     
     # SNAP - income-based, assume eligible if laid off
     eligible_programs.append("SNAP")
     snap_amount = benefits["SNAP"]["amount"] * benefits["SNAP"]["months"]
+    program_amounts["SNAP"] = snap_amount
     total_amount += snap_amount
     
     # ACA subsidies - most qualify when unemployed
     eligible_programs.append("ACA")
     aca_amount = benefits["ACA"]["amount"] * benefits["ACA"]["months"]
+    program_amounts["ACA"] = aca_amount
     total_amount += aca_amount
     
     # Retraining vouchers - available in most states
     eligible_programs.append("RETRAINING")
+    program_amounts["RETRAINING"] = benefits["RETRAINING"]["amount"]
     total_amount += benefits["RETRAINING"]["amount"]
     
     return {
         "programs": eligible_programs,
         "amount": round(total_amount, 2),
+        "program_amounts": program_amounts,
         "state": state_upper,
         "breakdown": {
             program: benefits[program] for program in eligible_programs
@@ -99,7 +105,10 @@ def eligibility_engine_tool(state: str, post_text: str) -> Dict[str, Any]:
     }
 
 
-# Create ADK Tool wrapper
+# Pure: the result depends only on the arguments
+cached_eligibility_engine_tool = memoize_tool("pure")(eligibility_engine_tool)
+
+# ADK Tool wrapper, built on first access (importing google.adk is slow)
 # FunctionTool automatically extracts name and description from the function docstring and signature
-eligibility_engine_adk_tool = FunctionTool(eligibility_engine_tool)
+__getattr__ = lazy_adk_tools(__name__, {"eligibility_engine_adk_tool": cached_eligibility_engine_tool})
 
@@ -1,65 +1,180 @@
 """
 Form Filler Tool - Fills PDF forms with extracted information
 """
+import io
 import os
 import re
-from typing import Dict, Any, Optional
-from google.adk.tools import FunctionTool
-from pypdf import PdfReader, PdfWriter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+from tools.tool_cache import lazy_adk_tools, memoize_tool
+from pypdf import PdfWriter
+from utils import form_templates
 import json
 
 
+# Below this many records, a process pool costs more than it saves
+FILL_BATCH_MIN_PARALLEL = int(os.getenv("FILL_BATCH_MIN_PARALLEL", "8"))
+
+# "interactive": keep the writer's default layout
+# "compressed":  keep fields editable, compress content streams and drop duplicate objects
+# "flattened":   also burn filled values into page content and remove the form
+OUTPUT_MODES = ("interactive", "compressed", "flattened")
+PDF_OUTPUT_MODE = os.getenv("PDF_OUTPUT_MODE", "compressed")
+
+
+# One scanner for every field a post can give us. Each field starts at one of the
+# characters in the leading look-ahead, so every other position is rejected in one step;
+# every repetition is unambiguous and look-behinds are fixed-width, so a failed attempt
+# never re-scans text and finditer runs in linear time, even on adversarial posts.
+_POST_SCANNER = re.compile(
+    r"(?=[A-Z0-9$@(+])(?:"
+    r"@(?P<domain>[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,})"
+    r"|(?P<phone>(?<![\d+])(?:\+?1[-. ]?)?(?:\(\d{3}\)|\d{3})[-. ]?\d{3}[-. ]?\d{4}(?!\d))"
+    r"|\$(?P<dollars>\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)(?P<thousands>[kK](?![a-zA-Z]))?"
+    r"|(?<![\w,.$])(?P<amount>\d{1,3}(?:,\d{3})+|\d+)[ \t]*(?i:per year|annually|salary)"
+    r"|(?:(?P<at>(?<=\b(?i:at)[ \t])|(?<=\b(?i:employed by)[ \t]))"
+    r"|(?P<former>(?<=\b(?i:formerly)[ \t])|(?<=\b(?i:ex)-)|(?<=\b(?i:ex)-[ \t])))"
+    r"(?P<employer>[A-Z][\w&'-]*(?:[ \t]+(?:&[ \t]+)?[A-Z][\w&'-]*)*)"
+    r")"
+)
+
+# The local part of an email ends at the "@" the scanner stops on; it is at most 64
+# characters, so searching back for it costs a bounded amount per address
+_EMAIL_LOCAL_PART = re.compile(r"(?<![\w.%+-])[\w.%+-]{1,64}\Z")
+
+# Field -> match kinds in order of preference; the first occurrence of the best kind wins
+_EXTRACTED_FIELDS = {
+    "last_employer": ("at", "former"),
+    "last_wage": ("dollars", "amount"),
+    "email": ("email",),
+    "phone": ("phone",)
+}
+_FIELD_BY_KIND = {kind: field for field, kinds in _EXTRACTED_FIELDS.items() for kind in kinds}
+
+
+def _match_value(post_text: str, match: re.Match, kind: str) -> Optional[str]:
+    if kind in ("at", "former"):
+        return match.group("employer").rstrip("'-")
+    if kind == "email":
+        local = _EMAIL_LOCAL_PART.search(post_text, max(match.start() - 64, 0), match.start())
+        return f"{local.group()}@{match.group('domain')}" if local else None
+    if kind == "phone":
+        return match.group("phone")
+    wage = match.group(kind).replace(',', '')
+    if kind == "dollars" and match.group("thousands"):
+        return str(int(float(wage) * 1000))
+    return wage.split('.')[0]
+
+
+@lru_cache(maxsize=4096)
+def _scan_post(post_text: str) -> Tuple[Tuple[str, str], ...]:
+    """Returns (field, value) pairs found in one pass over the post"""
+    best = {}
+    for match in _POST_SCANNER.finditer(post_text):
+        kind = match.lastgroup
+        if kind == "employer":
+            kind = "at" if match.group("at") is not None else "former"
+        elif kind == "thousands":
+            kind = "dollars"
+        elif kind == "domain":
+            kind = "email"
+        
+        field = _FIELD_BY_KIND[kind]
+        rank = _EXTRACTED_FIELDS[field].index(kind)
+        if field in best and best[field][0] <= rank:
+            continue
+        value = _match_value(post_text, match, kind)
+        if value:
+            best[field] = (rank, value)
+    return tuple((field, value) for field, (_, value) in best.items())
+
+
 def extract_info_from_post(post_text: str, linkedin_url: str) -> Dict[str, Any]:
     """
     Extracts information from LinkedIn post text using LLM-like pattern matching.
     In production, this would use Gemini to extract structured data.
+    
+    Employer, wage, email and phone come from a single linear-time scan;
+    results are cached per post text.
     """
     info = {
         "name": "Worker",  # Default, would extract from post
         "address": "123 Main St, City, ST 12345",  # Default
-        "last_employer": "Previous Employer",  # Would extract from post
-        "last_wage": "50000",  # Would extract from post
+        "last_employer": "Previous Employer",  # Default when the post names none
+        "last_wage": "50000",  # Default when the post names none
         "email": None,  # Would need to be provided or extracted
         "phone": None,
         "linkedin_url": linkedin_url
     }
+    info.update(_scan_post(post_text or ""))
+    return info
+
+
+def extract_info_from_posts(posts: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Extracts information from many posts.
     
-    # Simple extraction patterns (in production, use LLM)
-    # Extract employer name
-    employer_patterns = [
-        r"(?:worked at|employed by|at)\s+([A-Z][a-zA-Z\s&]+?)(?:\s|,|\.|$)",
-        r"(?:formerly|ex-)\s*([A-Z][a-zA-Z\s&]+)",
-    ]
-    
-    for pattern in employer_patterns:
-        match = re.search(pattern, post_text, re.IGNORECASE)
-        if match:
-            info["last_employer"] = match.group(1).strip()
-            break
-    
-    # Extract salary/wage hints
-    wage_patterns = [
-        r"\$(\d{1,3}(?:,\d{3})*(?:k|K)?)",
-        r"(\d{1,3}(?:,\d{3})*)\s*(?:per year|annually|salary)",
-    ]
-    
-    for pattern in wage_patterns:
-        match = re.search(pattern, post_text, re.IGNORECASE)
-        if match:
-            wage_str = match.group(1).replace(',', '')
-            if 'k' in wage_str.lower():
-                info["last_wage"] = str(int(float(wage_str.lower().replace('k', '')) * 1000))
-            else:
-                info["last_wage"] = wage_str
-            break
+    Args:
+        posts: List of (post_text, linkedin_url)
     
-    return info
+    Returns:
+        List of info dictionaries in the order of posts
+    """
+    return [extract_info_from_post(post_text, linkedin_url) for post_text, linkedin_url in posts]
+
+
+def _compact(writer: PdfWriter, flatten: bool) -> None:
+    """Shrinks a filled document: optionally drops the form, then compresses and deduplicates"""
+    if flatten:
+        writer.remove_annotations(subtypes="/Widget")
+        if "/AcroForm" in writer.root_object:
+            del writer.root_object["/AcroForm"]
+    
+    for page in writer.pages:
+        page.compress_content_streams(level=9)
+    # Shared fonts/images copied per page collapse into one object each
+    writer.compress_identical_objects()
+
+
+def fill_pdf_writer(
+    pdf_path: str,
+    form_data: Dict[str, Any],
+    output_mode: Optional[str] = None
+) -> PdfWriter:
+    """Returns a PdfWriter holding a filled copy of the template"""
+    output_mode = output_mode or PDF_OUTPUT_MODE
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output_mode}")
+    flatten = output_mode == "flattened"
+    
+    # Parsed once per template, with its field map precompiled
+    template = form_templates.get_template(pdf_path)
+    values = form_templates.map_form_data(template, form_data)
+    
+    with template["lock"]:
+        writer = PdfWriter(clone_from=template["reader"])
+    
+    # One pass over only the pages that show the fields being filled
+    by_page = form_templates.group_by_page(template, values)
+    if by_page:
+        writer.set_need_appearances_writer(True)
+    for page_number, page_values in sorted(by_page.items()):
+        writer.update_page_form_field_values(
+            writer.pages[page_number], page_values, auto_regenerate=None, flatten=flatten
+        )
+    
+    if output_mode != "interactive":
+        _compact(writer, flatten)
+    
+    return writer
 
 
 def fill_pdf_form(
     pdf_path: str,
     output_path: str,
-    form_data: Dict[str, Any]
+    form_data: Dict[str, Any],
+    output_mode: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Fills a PDF form with provided data.
@@ -68,6 +183,8 @@ def fill_pdf_form(
         pdf_path: Path to blank PDF form
         output_path: Path to save filled PDF
         form_data: Dictionary with form field names and values
+        output_mode: "interactive", "compressed" or "flattened"
+            (defaults to PDF_OUTPUT_MODE)
     
     Returns:
         Dictionary with status and output path
@@ -79,40 +196,7 @@ def fill_pdf_form(
                 "message": f"PDF file not found: {pdf_path}"
             }
         
-        # Read PDF
-        reader = PdfReader(pdf_path)
-        writer = PdfWriter()
-        
-        # Copy pages
-        for page in reader.pages:
-            writer.add_page(page)
-        
-        # Fill form fields if PDF has form fields
-        if reader.metadata:
-            # Try to update form fields
-            if hasattr(reader, 'get_form_text_fields'):
-                form_fields = reader.get_form_text_fields()
-                if form_fields:
-                    for field_name, value in form_data.items():
-                        # Map common field names
-                        field_mapping = {
-                            "name": ["name", "full_name", "applicant_name"],
-                            "address": ["address", "street_address", "mailing_address"],
-                            "employer": ["employer", "last_employer", "previous_employer"],
-                            "wage": ["wage", "salary", "last_wage", "annual_wage"],
-                            "email": ["email", "email_address"],
-                            "phone": ["phone", "phone_number", "telephone"]
-                        }
-                        
-                        # Find matching field
-                        for key, aliases in field_mapping.items():
-                            if key in field_name.lower():
-                                for alias in aliases:
-                                    if alias in form_fields:
-                                        writer.update_page_form_field_values(
-                                            reader.pages[0], {alias: str(value)}
-                                        )
-                                        break
+        writer = fill_pdf_writer(pdf_path, form_data, output_mode)
         
         # Save filled PDF
         os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else '.', exist_ok=True)
@@ -132,6 +216,71 @@ def fill_pdf_form(
         }
 
 
+def _fill_chunk(
+    pdf_path: str,
+    jobs: List[Tuple[Dict[str, Any], Optional[str]]],
+    output_mode: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Fills a chunk of records in one worker; the template is parsed once per process"""
+    results = []
+    for form_data, output_path in jobs:
+        if output_path:
+            results.append(fill_pdf_form(pdf_path, output_path, form_data, output_mode))
+            continue
+        try:
+            buffer = io.BytesIO()
+            fill_pdf_writer(pdf_path, form_data, output_mode).write(buffer)
+            results.append({"status": "success", "data": buffer.getvalue()})
+        except Exception as e:
+            results.append({"status": "error", "message": f"Error filling PDF: {str(e)}"})
+    return results
+
+
+def fill_batch(
+    pdf_path: str,
+    records: List[Dict[str, Any]],
+    output_paths: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    output_mode: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Fills one template with many records across a process pool.
+    
+    For bulk filling (e.g. re-issuing one form to a list of workers) and
+    benchmarks/bench_form_filler.py. The caseworker does not use it, since
+    each case fills several different templates once each.
+    
+    Args:
+        pdf_path: Path to blank PDF form
+        records: List of form_data dictionaries, one per filled copy
+        output_paths: Where to save each copy; if omitted, copies are
+            returned in memory as bytes under "data"
+        max_workers: Worker processes (defaults to the available cores)
+        output_mode: "interactive", "compressed" or "flattened"
+    
+    Returns:
+        List of fill results, in the order of records
+    """
+    if not os.path.exists(pdf_path):
+        return [{"status": "error", "message": f"PDF file not found: {pdf_path}"} for _ in records]
+    
+    jobs = list(zip(records, output_paths or [None] * len(records)))
+    if not jobs:
+        return []
+    
+    max_workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    if max_workers <= 1 or len(jobs) < FILL_BATCH_MIN_PARALLEL:
+        return _fill_chunk(pdf_path, jobs, output_mode)
+    
+    # A few chunks per worker keeps the pool balanced without per-record IPC
+    chunk_size = max(1, len(jobs) // (max_workers * 4))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_fill_chunk, pdf_path, chunk, output_mode) for chunk in chunks]
+        return [result for future in futures for result in future.result()]
+
+
 def form_filler_tool(
     pdf_path: str,
     output_path: str,
@@ -140,7 +289,8 @@ def form_filler_tool(
     employer: str,
     wage: str,
     email: Optional[str] = None,
-    phone: Optional[str] = None
+    phone: Optional[str] = None,
+    output_mode: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     ADK Tool wrapper for filling PDF forms.
@@ -154,6 +304,7 @@ def form_filler_tool(
         wage: Last annual wage
         email: Email address (optional)
         phone: Phone number (optional)
+        output_mode: "interactive", "compressed" or "flattened" (optional)
     
     Returns:
         Dictionary with status and output path
@@ -170,10 +321,13 @@ def form_filler_tool(
     if phone:
         form_data["phone"] = phone
     
-    return fill_pdf_form(pdf_path, output_path, form_data)
+    return fill_pdf_form(pdf_path, output_path, form_data, output_mode)
+
 
+# Writes output files, so it always runs
+cached_form_filler_tool = memoize_tool("never")(form_filler_tool)
 
-# Create ADK Tool wrapper
+# ADK Tool wrapper, built on first access (importing google.adk is slow)
 # FunctionTool automatically extracts name and description from the function docstring and signature
-form_filler_adk_tool = FunctionTool(form_filler_tool)
+__getattr__ = lazy_adk_tools(__name__, {"form_filler_adk_tool": cached_form_filler_tool})
 
@@ -3,111 +3,347 @@ Gmail Tool - Creates draft emails with benefit forms attached
 """
 import os
 import base64
+import hashlib
+import uuid
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
-from typing import Dict, Any
-from google.adk.tools import FunctionTool
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from typing import Dict, Any, BinaryIO, List, Optional
+from tools.tool_cache import lazy_adk_tools, memoize_tool
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
+from utils import google_clients, metrics
 import json
 
 
 # Gmail API scopes
 SCOPES = ['https://www.googleapis.com/auth/gmail.compose']
 
+# Draft creations per HTTP batch request (the Gmail API accepts at most 100)
+GMAIL_BATCH_SIZE = min(int(os.getenv("GMAIL_BATCH_SIZE", "50")), 100)
+
+# Attachments above this size are sent through the resumable media-upload endpoint
+GMAIL_STREAMING_THRESHOLD = int(os.getenv("GMAIL_STREAMING_THRESHOLD", str(1024 * 1024)))
+# Upload chunk size; the API requires a multiple of 256 KiB
+GMAIL_UPLOAD_CHUNK_SIZE = int(os.getenv("GMAIL_UPLOAD_CHUNK_SIZE", str(4 * 256 * 1024)))
+GMAIL_UPLOAD_RETRIES = int(os.getenv("GMAIL_UPLOAD_RETRIES", "3"))
+# Spooled messages and upload sessions, kept until the upload completes so it can resume
+GMAIL_UPLOAD_DIR = os.getenv("GMAIL_UPLOAD_DIR", ".cache/gmail_uploads")
+
+# 57 input bytes encode to exactly one 76-character base64 line
+_BASE64_READ_SIZE = 57 * 1024
+
+# Responses worth retrying later (quota exhaustion and server errors)
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# Responses meaning a resumable upload session no longer exists
+EXPIRED_SESSION_STATUSES = (404, 410)
+
 
 def authenticate_gmail():
     """Authenticate and return Gmail service"""
-    creds = None
+    return google_clients.get_service('gmail', 'v1', SCOPES, 'token.json')
+
+
+def _error_result(error: Exception) -> Dict[str, Any]:
+    """Turns a failed call into an error result, flagging failures worth retrying"""
+    if isinstance(error, HttpError):
+        result = {"status": "error", "message": f"Gmail API error: {error}"}
+        if error.resp.status in RETRYABLE_STATUSES:
+            result["retryable"] = True
+            retry_after = error.resp.get('retry-after', '')
+            if retry_after.isdigit():
+                result["retry_after"] = int(retry_after)
+        return result
+    
+    result = {"status": "error", "message": f"Error creating draft: {str(error)}"}
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        result["retryable"] = True
+    return result
+
+
+def build_raw_message(
+    to_email: str,
+    subject: str,
+    body: str,
+    attachment: Optional[BinaryIO] = None,
+    attachment_name: str = None,
+    from_email: str = None
+) -> str:
+    """
+    Builds the base64url-encoded MIME message the Gmail API expects in "raw".
     
-    # Check for existing token
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    Args:
+        to_email: Recipient email address
+        subject: Email subject line
+        body: Email body text
+        attachment: Readable zip file object to attach (optional)
+        attachment_name: File name shown for the attachment
+        from_email: Sender email (uses env var if not provided)
     
-    # If no valid credentials, request authorization
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists('credentials.json'):
-                print("Please download credentials.json from Google Cloud Console")
-                return None
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
+    Returns:
+        Encoded message
+    """
+    # Create message
+    message = MIMEMultipart()
+    message['to'] = to_email
+    message['subject'] = subject
+    
+    if from_email:
+        message['from'] = from_email
+    elif os.getenv('FROM_EMAIL'):
+        message['from'] = os.getenv('FROM_EMAIL')
+    
+    # Add body
+    message.attach(MIMEText(body, 'plain'))
+    
+    # Add attachment if provided
+    if attachment is not None:
+        part = MIMEBase('application', 'zip')
+        part.set_payload(attachment.read())
+        encoders.encode_base64(part)
+        part.add_header(
+            'Content-Disposition',
+            f'attachment; filename= {attachment_name or "benefits.zip"}'
+        )
+        message.attach(part)
+    
+    # Encode message
+    return base64.urlsafe_b64encode(
+        message.as_bytes()
+    ).decode('utf-8')
+
+
+def create_gmail_draft(
+    to_email: str,
+    subject: str,
+    body: str,
+    attachment: Optional[BinaryIO] = None,
+    attachment_name: str = None,
+    from_email: str = None
+) -> Dict[str, Any]:
+    """
+    Creates a Gmail draft from an in-memory attachment.
+    
+    Args:
+        to_email: Recipient email address
+        subject: Email subject line
+        body: Email body text
+        attachment: Readable zip file object to attach (optional)
+        attachment_name: File name shown for the attachment
+        from_email: Sender email (uses env var if not provided)
+    
+    Returns:
+        Dictionary with draft_id and status
+    """
+    try:
+        service = authenticate_gmail()
+        if not service:
+            return {"status": "error", "message": "Gmail authentication failed"}
+        
+        raw_message = build_raw_message(
+            to_email, subject, body, attachment, attachment_name, from_email
+        )
         
-        # Save credentials for next run
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
+        # Create draft
+        with metrics.api_call("gmail", "drafts.create"):
+            draft = service.users().drafts().create(
+                userId='me',
+                body={'message': {'raw': raw_message}}
+            ).execute()
+        
+        return {
+            "status": "success",
+            "draft_id": draft['id'],
+            "message": f"Draft created successfully. Draft ID: {draft['id']}"
+        }
     
-    return build('gmail', 'v1', credentials=creds)
+    except Exception as e:
+        return _error_result(e)
 
 
-def gmail_draft_tool(
+def write_mime_message(
+    fh: BinaryIO,
     to_email: str,
     subject: str,
     body: str,
-    zip_file_path: str = None,
+    attachment: Optional[BinaryIO] = None,
+    attachment_name: str = None,
     from_email: str = None
+) -> None:
+    """
+    Streams an RFC 822 message into fh, base64-encoding the attachment chunk
+    by chunk so memory use does not grow with the attachment size.
+    
+    Args:
+        fh: Binary file object to write the message to
+        to_email: Recipient email address
+        subject: Email subject line
+        body: Email body text
+        attachment: Readable zip file object to attach (optional)
+        attachment_name: File name shown for the attachment
+        from_email: Sender email (uses env var if not provided)
+    """
+    boundary = f"==============={uuid.uuid4().hex}=="
+    message = MIMEMultipart(boundary=boundary)
+    message['to'] = to_email
+    message['subject'] = subject
+    
+    if from_email:
+        message['from'] = from_email
+    elif os.getenv('FROM_EMAIL'):
+        message['from'] = os.getenv('FROM_EMAIL')
+    
+    message.attach(MIMEText(body, 'plain'))
+    
+    # Headers and body part come from the email package; the closing boundary is re-added below
+    head = message.as_bytes()
+    fh.write(head[:head.rindex(f"--{boundary}--".encode())])
+    
+    if attachment is not None:
+        fh.write(
+            f"--{boundary}\n"
+            f"Content-Type: application/zip\n"
+            f"MIME-Version: 1.0\n"
+            f"Content-Transfer-Encoding: base64\n"
+            f"Content-Disposition: attachment; filename= {attachment_name or 'benefits.zip'}\n\n".encode()
+        )
+        for chunk in iter(lambda: attachment.read(_BASE64_READ_SIZE), b''):
+            fh.write(base64.encodebytes(chunk))
+    
+    fh.write(f"--{boundary}--\n".encode())
+
+
+def _upload_progress(request, size: int):
+    """
+    Asks the server how much of a resumable upload it already has.
+    
+    Returns:
+        (bytes received, None), or (size, draft) if the upload had completed
+    """
+    resp, content = request.http.request(
+        request.resumable_uri, 'PUT', headers={"Content-Range": f"bytes */{size}", "Content-Length": "0"}
+    )
+    if resp.status in (200, 201):
+        return size, request.postproc(resp, content)
+    if resp.status != 308:
+        raise HttpError(resp, content, uri=request.resumable_uri)
+    received = resp.get('range')
+    return (int(received.rsplit('-', 1)[1]) + 1 if received else 0), None
+
+
+def create_gmail_draft_resumable(
+    to_email: str,
+    subject: str,
+    body: str,
+    zip_file_path: str = None,
+    attachment_name: str = None,
+    from_email: str = None,
+    service=None,
+    attachment: Optional[BinaryIO] = None
 ) -> Dict[str, Any]:
     """
-    Creates a Gmail draft email with optional attachment.
+    Creates a Gmail draft through the resumable media-upload endpoint.
+    
+    The message is spooled to disk with a streamed attachment and uploaded
+    as message/rfc822 in GMAIL_UPLOAD_CHUNK_SIZE chunks, so peak memory stays
+    constant. The upload session is persisted, and calling again with the
+    same arguments after an interruption resumes the upload. A session the
+    server no longer knows (404/410) is started over, and one that failed
+    for a reason not worth retrying is discarded.
     
     Args:
         to_email: Recipient email address
         subject: Email subject line
         body: Email body text
         zip_file_path: Path to zip file to attach (optional)
+        attachment_name: File name shown for the attachment
         from_email: Sender email (uses env var if not provided)
+        service: Gmail service to use (authenticates if not provided)
+        attachment: Readable zip file object to attach instead of zip_file_path
     
     Returns:
         Dictionary with draft_id and status
     """
     try:
-        service = authenticate_gmail()
+        service = service or authenticate_gmail()
         if not service:
             return {"status": "error", "message": "Gmail authentication failed"}
         
-        # Create message
-        message = MIMEMultipart()
-        message['to'] = to_email
-        message['subject'] = subject
+        attachment_name = attachment_name or (os.path.basename(zip_file_path) if zip_file_path else None)
+        fingerprint = [to_email, subject, body, attachment_name, from_email or os.getenv('FROM_EMAIL')]
+        if attachment is not None:
+            # In-memory attachments are identified by their content
+            digest = hashlib.sha256()
+            attachment.seek(0)
+            for chunk in iter(lambda: attachment.read(_BASE64_READ_SIZE), b''):
+                digest.update(chunk)
+            attachment.seek(0)
+            fingerprint.append(digest.hexdigest())
+        elif zip_file_path:
+            stat = os.stat(zip_file_path)
+            fingerprint += [os.path.abspath(zip_file_path), stat.st_size, stat.st_mtime_ns]
+        upload_key = hashlib.sha256(json.dumps(fingerprint).encode('utf-8')).hexdigest()[:32]
         
-        if from_email:
-            message['from'] = from_email
-        elif os.getenv('FROM_EMAIL'):
-            message['from'] = os.getenv('FROM_EMAIL')
+        os.makedirs(GMAIL_UPLOAD_DIR, exist_ok=True)
+        message_path = os.path.join(GMAIL_UPLOAD_DIR, f"{upload_key}.eml")
+        session_path = os.path.join(GMAIL_UPLOAD_DIR, f"{upload_key}.json")
         
-        # Add body
-        message.attach(MIMEText(body, 'plain'))
+        session = None
+        if os.path.exists(message_path) and os.path.exists(session_path):
+            with open(session_path, 'r') as f:
+                session = json.load(f)
+        else:
+            with open(message_path + ".tmp", 'wb') as fh:
+                if attachment is not None:
+                    write_mime_message(fh, to_email, subject, body, attachment, attachment_name, from_email)
+                elif zip_file_path:
+                    with open(zip_file_path, 'rb') as attachment:
+                        write_mime_message(fh, to_email, subject, body, attachment, attachment_name, from_email)
+                else:
+                    write_mime_message(fh, to_email, subject, body, from_email=from_email)
+            os.replace(message_path + ".tmp", message_path)
         
-        # Add attachment if provided
-        if zip_file_path and os.path.exists(zip_file_path):
-            with open(zip_file_path, 'rb') as f:
-                part = MIMEBase('application', 'zip')
-                part.set_payload(f.read())
-                encoders.encode_base64(part)
-                part.add_header(
-                    'Content-Disposition',
-                    f'attachment; filename= {os.path.basename(zip_file_path)}'
-                )
-                message.attach(part)
+        media = MediaFileUpload(
+            message_path, mimetype='message/rfc822', chunksize=GMAIL_UPLOAD_CHUNK_SIZE, resumable=True
+        )
+        request = service.users().drafts().create(userId='me', body={}, media_body=media)
         
-        # Encode message
-        raw_message = base64.urlsafe_b64encode(
-            message.as_bytes()
-        ).decode('utf-8')
+        try:
+            draft = None
+            if session:
+                # Ask the server how much it already has and send only the rest
+                request.resumable_uri = session["resumable_uri"]
+                try:
+                    with metrics.api_call("gmail", "drafts.upload_status"):
+                        request.resumable_progress, draft = _upload_progress(request, media.size())
+                except HttpError as error:
+                    if error.resp.status not in EXPIRED_SESSION_STATUSES:
+                        raise
+                    print(f"[Gmail] Upload session expired ({error.resp.status}), starting over")
+                    os.remove(session_path)
+                    session = None
+                    request.resumable_uri = None
+                    request.resumable_progress = 0
+            
+            while draft is None:
+                with metrics.api_call("gmail", "drafts.upload_chunk"):
+                    status, draft = request.next_chunk(num_retries=GMAIL_UPLOAD_RETRIES)
+                if request.resumable_uri and not session:
+                    session = {"resumable_uri": request.resumable_uri}
+                    with open(session_path, 'w') as f:
+                        json.dump(session, f)
+        except Exception as e:
+            # Keep the session only if a later call can resume it
+            if not _error_result(e).get("retryable") and os.path.exists(session_path):
+                os.remove(session_path)
+            raise
+        finally:
+            media.stream().close()
         
-        # Create draft
-        draft = service.users().drafts().create(
-            userId='me',
-            body={'message': {'raw': raw_message}}
-        ).execute()
+        for path in (message_path, session_path):
+            if os.path.exists(path):
+                os.remove(path)
         
         return {
             "status": "success",
@@ -115,19 +351,198 @@ def gmail_draft_tool(
             "message": f"Draft created successfully. Draft ID: {draft['id']}"
         }
     
-    except HttpError as error:
-        return {
-            "status": "error",
-            "message": f"Gmail API error: {error}"
-        }
     except Exception as e:
-        return {
-            "status": "error",
-            "message": f"Error creating draft: {str(e)}"
-        }
+        return _error_result(e)
+
+
+def create_gmail_draft_from_file(
+    to_email: str,
+    subject: str,
+    body: str,
+    zip_file_path: str = None,
+    attachment_name: str = None,
+    from_email: str = None
+) -> Dict[str, Any]:
+    """
+    Creates a Gmail draft for a zip on disk, streaming large attachments.
+    
+    Attachments above GMAIL_STREAMING_THRESHOLD go through the resumable
+    upload endpoint; smaller ones are sent inline.
+    
+    Args:
+        to_email: Recipient email address
+        subject: Email subject line
+        body: Email body text
+        zip_file_path: Path to zip file to attach (optional)
+        attachment_name: File name shown for the attachment
+        from_email: Sender email (uses env var if not provided)
+    
+    Returns:
+        Dictionary with draft_id and status
+    """
+    if zip_file_path and os.path.getsize(zip_file_path) > GMAIL_STREAMING_THRESHOLD:
+        return create_gmail_draft_resumable(
+            to_email, subject, body, zip_file_path, attachment_name, from_email
+        )
+    if zip_file_path:
+        with open(zip_file_path, 'rb') as f:
+            return create_gmail_draft(
+                to_email, subject, body,
+                attachment=f,
+                attachment_name=attachment_name or os.path.basename(zip_file_path),
+                from_email=from_email
+            )
+    return create_gmail_draft(to_email, subject, body, from_email=from_email)
+
+
+def _attachment_size(draft: Dict[str, Any]) -> int:
+    """Returns the size of a draft's attachment in bytes (0 if it has none or it cannot be read)"""
+    attachment = draft.get("attachment")
+    try:
+        if attachment is not None:
+            attachment.seek(0, os.SEEK_END)
+            size = attachment.tell()
+            attachment.seek(0)
+            return size
+        if draft.get("zip_file_path"):
+            return os.path.getsize(draft["zip_file_path"])
+    except OSError:
+        pass
+    return 0
+
+
+def create_gmail_drafts_batch(
+    drafts: List[Dict[str, Any]],
+    service=None
+) -> List[Dict[str, Any]]:
+    """
+    Creates many Gmail drafts using HTTP batch requests.
+    
+    Up to GMAIL_BATCH_SIZE drafts.create calls are sent in each batch
+    request, and each call's outcome is mapped back to its draft. Drafts
+    with attachments above GMAIL_STREAMING_THRESHOLD are not built in
+    memory; they go through the resumable upload endpoint one at a time.
+    
+    Args:
+        drafts: List of dictionaries with to_email, subject, body and
+            optionally zip_file_path (or an in-memory zip as attachment),
+            attachment_name and from_email
+        service: Gmail service to use (authenticates if not provided)
+    
+    Returns:
+        List of results in the order of drafts, each with status and
+        draft_id or message
+    """
+    if not drafts:
+        return []
+    
+    service = service or authenticate_gmail()
+    if not service:
+        return [{"status": "error", "message": "Gmail authentication failed"} for _ in drafts]
+    
+    results: List[Optional[Dict[str, Any]]] = [None] * len(drafts)
+    batched = []
+    for index, draft in enumerate(drafts):
+        if _attachment_size(draft) <= GMAIL_STREAMING_THRESHOLD:
+            batched.append(index)
+            continue
+        results[index] = create_gmail_draft_resumable(
+            draft["to_email"], draft["subject"], draft["body"],
+            zip_file_path=draft.get("zip_file_path"),
+            attachment_name=draft.get("attachment_name"),
+            from_email=draft.get("from_email"),
+            service=service,
+            attachment=draft.get("attachment")
+        )
+    
+    def on_response(request_id, response, exception):
+        index = int(request_id)
+        if exception is not None:
+            results[index] = _error_result(exception)
+        else:
+            results[index] = {
+                "status": "success",
+                "draft_id": response['id'],
+                "message": f"Draft created successfully. Draft ID: {response['id']}"
+            }
+    
+    for start in range(0, len(batched), GMAIL_BATCH_SIZE):
+        batch_indexes = batched[start:start + GMAIL_BATCH_SIZE]
+        batch = service.new_batch_http_request(callback=on_response)
+        for index in batch_indexes:
+            draft = drafts[index]
+            try:
+                zip_file_path = draft.get("zip_file_path")
+                attachment = draft.get("attachment")
+                if attachment is not None:
+                    attachment.seek(0)
+                opened = open(zip_file_path, 'rb') if zip_file_path and attachment is None else None
+                try:
+                    raw_message = build_raw_message(
+                        draft["to_email"], draft["subject"], draft["body"],
+                        attachment=opened or attachment,
+                        attachment_name=draft.get("attachment_name")
+                        or (os.path.basename(zip_file_path) if zip_file_path else None),
+                        from_email=draft.get("from_email")
+                    )
+                finally:
+                    if opened:
+                        opened.close()
+            except Exception as e:
+                results[index] = {"status": "error", "message": f"Error creating draft: {str(e)}"}
+                continue
+            batch.add(
+                service.users().drafts().create(userId='me', body={'message': {'raw': raw_message}}),
+                request_id=str(index)
+            )
+        
+        try:
+            with metrics.api_call("gmail", "batch"):
+                batch.execute()
+        except Exception as e:
+            for index in batch_indexes:
+                if results[index] is None:
+                    results[index] = {
+                        "status": "error",
+                        "message": f"Gmail batch error: {str(e)}",
+                        "retryable": True
+                    }
+    
+    return [
+        result or {"status": "error", "message": "No response for draft in batch", "retryable": True}
+        for result in results
+    ]
+
+
+def gmail_draft_tool(
+    to_email: str,
+    subject: str,
+    body: str,
+    zip_file_path: str = None,
+    from_email: str = None
+) -> Dict[str, Any]:
+    """
+    Creates a Gmail draft email with optional attachment.
+    
+    Args:
+        to_email: Recipient email address
+        subject: Email subject line
+        body: Email body text
+        zip_file_path: Path to zip file to attach (optional)
+        from_email: Sender email (uses env var if not provided)
+    
+    Returns:
+        Dictionary with draft_id and status
+    """
+    if zip_file_path and not os.path.exists(zip_file_path):
+        zip_file_path = None
+    return create_gmail_draft_from_file(to_email, subject, body, zip_file_path, from_email=from_email)
+
 
+# Creates a draft on every call, so it is never cached
+cached_gmail_draft_tool = memoize_tool("never")(gmail_draft_tool)
 
-# Create ADK Tool wrapper
+# ADK Tool wrapper, built on first access (importing google.adk is slow)
 # FunctionTool automatically extracts name and description from the function docstring and signature
-gmail_draft_adk_tool = FunctionTool(gmail_draft_tool)
+__getattr__ = lazy_adk_tools(__name__, {"gmail_draft_adk_tool": cached_gmail_draft_tool})
 
@@ -0,0 +1,227 @@
+"""
+LLM Extraction - Batched Gemini extraction of worker details from posts
+
+Many posts are packed into each generateContent request, and the model is
+asked for a JSON array (via responseSchema) with one object per post.
+Responses are cached on disk per post, keyed by a hash of the prompt, model
+and post text, so re-running a case or a batch costs no model calls while
+the entry is younger than LLM_CACHE_TTL. Posts the model cannot answer for
+keep the values from the regex extractor.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from tools.form_filler import extract_info_from_posts
+from utils import metrics
+
+
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MODEL = os.getenv("GEMINI_EXTRACTION_MODEL", "gemini-1.5-flash")
+# "gemini" or "regex"; defaults to gemini when an API key is configured
+EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND", "")
+
+LLM_BATCH_SIZE = int(os.getenv("LLM_EXTRACTION_BATCH_SIZE", "20"))
+LLM_WORKERS = int(os.getenv("LLM_EXTRACTION_WORKERS", "4"))
+LLM_TIMEOUT = float(os.getenv("LLM_EXTRACTION_TIMEOUT", "60"))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".cache/llm_extraction")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Fields the model fills; anything it leaves null keeps the regex value
+LLM_FIELDS = ("name", "last_employer", "last_wage", "email", "phone")
+
+EXTRACTION_PROMPT = """You extract details about laid-off workers from their LinkedIn posts.
+For every post below, return one object with its "index" and these fields, using null
+when the post does not state them:
+- name: the author's full name
+- last_employer: the company the author was laid off from
+- last_wage: annual salary in US dollars as digits only (e.g. "85000")
+- email: the author's email address
+- phone: the author's phone number
+Return exactly one object per post, in the same order."""
+
+RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": dict(
+            {"index": {"type": "INTEGER"}},
+            **{field: {"type": "STRING", "nullable": True} for field in LLM_FIELDS}
+        ),
+        "required": ["index"]
+    }
+}
+
+_lock = threading.Lock()
+_session = requests.Session()
+_stats = {"cache_hits": 0, "cache_misses": 0, "requests": 0, "failed_requests": 0}
+
+
+def _use_llm() -> bool:
+    backend = EXTRACTION_BACKEND or ("gemini" if os.getenv("GOOGLE_API_KEY") else "regex")
+    return backend == "gemini"
+
+
+def cache_key(post_text: str) -> str:
+    """Returns the response cache key for a post under the current prompt and model"""
+    payload = json.dumps([EXTRACTION_PROMPT, RESPONSE_SCHEMA, GEMINI_MODEL, post_text], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(LLM_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _load_cached(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_cache_path(key), 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - cached["cached_at"] > LLM_CACHE_TTL:
+        return None
+    return cached["fields"]
+
+
+def _save_cached(key: str, fields: Dict[str, Any]) -> None:
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"cached_at": time.time(), "fields": fields}, f)
+    os.replace(tmp_path, path)
+
+
+def _request_batch(post_texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Asks the model for the fields of several posts in one request.
+
+    Returns:
+        Fields per post, in order; None for posts missing from the response
+    """
+    prompt = EXTRACTION_PROMPT + "\n\nPosts:\n" + json.dumps(
+        [{"index": index, "text": text} for index, text in enumerate(post_texts)]
+    )
+    with metrics.api_call("gemini", "generateContent"):
+        response = _session.post(
+            f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:generateContent",
+            headers={"x-goog-api-key": os.getenv("GOOGLE_API_KEY", "")},
+            json={
+                "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                "generationConfig": {
+                    "temperature": 0,
+                    "responseMimeType": "application/json",
+                    "responseSchema": RESPONSE_SCHEMA
+                }
+            },
+            timeout=LLM_TIMEOUT
+        )
+        response.raise_for_status()
+    text = response.json()["candidates"][0]["content"]["parts"][0]["text"]
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(post_texts)
+    for item in json.loads(text):
+        index = item.get("index")
+        if isinstance(index, int) and 0 <= index < len(post_texts):
+            results[index] = {field: item.get(field) for field in LLM_FIELDS}
+    return results
+
+
+def _fetch(post_texts: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Runs one batch request; returns cache key -> fields and caches them"""
+    with _lock:
+        _stats["requests"] += 1
+    try:
+        results = _request_batch(post_texts)
+    except Exception as e:
+        with _lock:
+            _stats["failed_requests"] += 1
+        print(f"[LLMExtraction] Batch of {len(post_texts)} failed, using regex extraction: {e}")
+        return {}
+
+    fetched = {}
+    for post_text, fields in zip(post_texts, results):
+        if fields is not None:
+            key = cache_key(post_text)
+            _save_cached(key, fields)
+            fetched[key] = fields
+    return fetched
+
+
+def extract_info_batch(posts: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Extracts information from many posts, with Gemini when it is configured.
+
+    Uncached posts are sent LLM_BATCH_SIZE at a time, up to LLM_WORKERS
+    requests in parallel. The regex extractor supplies every field the model
+    does not, and all fields when the model is disabled or fails.
+
+    Args:
+        posts: List of (post_text, linkedin_url)
+
+    Returns:
+        List of info dictionaries (as from extract_info_from_post), in order
+    """
+    infos = extract_info_from_posts(posts)
+    if not posts or not _use_llm():
+        return infos
+
+    keys = [cache_key(post_text or "") for post_text, _ in posts]
+    found: Dict[str, Dict[str, Any]] = {}
+    missing: Dict[str, str] = {}
+    for key, (post_text, _) in zip(keys, posts):
+        if key in found or key in missing:
+            continue
+        cached = _load_cached(key)
+        if cached is not None:
+            found[key] = cached
+        else:
+            missing[key] = post_text or ""
+
+    with _lock:
+        _stats["cache_hits"] += len(found)
+        _stats["cache_misses"] += len(missing)
+
+    texts = list(missing.values())
+    batches = [texts[start:start + LLM_BATCH_SIZE] for start in range(0, len(texts), LLM_BATCH_SIZE)]
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(LLM_WORKERS, len(batches)))) as pool:
+            for fetched in pool.map(_fetch, batches):
+                found.update(fetched)
+
+    for info, key in zip(infos, keys):
+        for field, value in (found.get(key) or {}).items():
+            if value not in (None, ""):
+                info[field] = str(value)
+    return infos
+
+
+def extract_info(post_text: str, linkedin_url: str) -> Dict[str, Any]:
+    """Extracts information from a single post (see extract_info_batch)"""
+    return extract_info_batch([(post_text, linkedin_url)])[0]
+
+
+HIT_RATIO = metrics.gauge(
+    "llm_extraction_cache_hit_ratio", "Share of posts whose model extraction came from the disk cache",
+    function=lambda: get_extraction_stats()["hit_ratio"]
+)
+
+
+def get_extraction_stats() -> Dict[str, Any]:
+    """
+    Returns LLM extraction statistics for this process.
+
+    Returns:
+        Dictionary with cache_hits, cache_misses, requests, failed_requests and hit_ratio
+    """
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["cache_hits"] + stats["cache_misses"]
+    stats["hit_ratio"] = round(stats["cache_hits"] / lookups, 4) if lookups else 0.0
+    return stats
@@ -0,0 +1,197 @@
+"""
+Packet Builder - Fills a case's PDF forms and zips them in memory
+
+Filled PDFs are written straight into a spooled zip buffer instead of
+round-tripping through forms/ and output/. The buffer is handed to the Gmail
+tool as-is and only persisted to disk when asked.
+
+Members are compressed according to PACKET_COMPRESSION. For deflate and
+bzip2, multi-form packets are compressed on a thread pool (zlib and bz2
+release the GIL) and the finished streams are appended to the zip. zipfile
+has no public API for adding a pre-compressed member, so the append uses
+its internals; on Python versions it has not been checked against, members
+are compressed one by one through writestr() instead.
+"""
+import bz2
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools.form_filler import fill_pdf_writer
+
+
+# Packets larger than this spill from memory to a temporary file
+PACKET_SPOOL_MAX_BYTES = int(os.getenv("PACKET_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# "stored", "deflate", "bzip2" or "lzma" (bzip2/lzma need a recipient unzip that supports them)
+PACKET_COMPRESSION = os.getenv("PACKET_COMPRESSION", "deflate")
+PACKET_COMPRESSLEVEL = int(os.getenv("PACKET_COMPRESSLEVEL", "6"))
+PACKET_COMPRESSION_WORKERS = int(os.getenv("PACKET_COMPRESSION_WORKERS", "4"))
+
+COMPRESSION_METHODS = {
+    "stored": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA
+}
+
+# CPython versions whose zipfile internals _append_compressed was checked against
+RAW_APPEND_VERSIONS = ((3, 8), (3, 13))
+_ZIPFILE_INTERNALS = ("fp", "filelist", "NameToInfo", "start_dir", "_writing", "_didModify")
+
+
+def filled_member_name(pdf_path: str) -> str:
+    """Returns the zip member name for a filled copy of a blank form"""
+    return os.path.basename(pdf_path).replace(".pdf", "_filled.pdf")
+
+
+def _compress_member(data: bytes, compression: str, level: int) -> Tuple[int, bytes]:
+    """Returns (crc32, compressed bytes) in the stream format zip expects for the method"""
+    if compression == "deflate":
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+    else:
+        compressed = bz2.compress(data, max(level, 1))
+    return zlib.crc32(data), compressed
+
+
+def _can_append_raw(zipf: zipfile.ZipFile) -> bool:
+    """Returns True if pre-compressed members can be appended to this zip"""
+    low, high = RAW_APPEND_VERSIONS
+    return (
+        sys.implementation.name == "cpython"
+        and low <= sys.version_info[:2] <= high
+        and all(hasattr(zipf, attr) for attr in _ZIPFILE_INTERNALS)
+        and zipf.mode == "w"
+        and not zipf._writing
+        and zipf.fp.seekable()
+    )
+
+
+def _append_compressed(
+    zipf: zipfile.ZipFile,
+    name: str,
+    data: bytes,
+    crc: int,
+    compressed: bytes,
+    compression: str
+) -> None:
+    """Appends an already-compressed member to a zip opened for writing"""
+    zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = COMPRESSION_METHODS[compression]
+    zinfo.external_attr = 0o600 << 16
+    zinfo.file_size = len(data)
+    zinfo.compress_size = len(compressed)
+    zinfo.CRC = crc
+    zinfo.header_offset = zipf.fp.tell()
+
+    zipf.fp.write(zinfo.FileHeader())
+    zipf.fp.write(compressed)
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[name] = zinfo
+    # The central directory is written at start_dir when the zip is closed
+    zipf.start_dir = zipf.fp.tell()
+    zipf._didModify = True
+
+
+def write_members(
+    zipf: zipfile.ZipFile,
+    members: List[Tuple[str, bytes]],
+    compression: str = None,
+    compresslevel: int = None
+) -> None:
+    """
+    Writes (name, data) members into a zip using the packet compression settings.
+
+    Args:
+        zipf: Zip opened with mode 'w'
+        members: List of (member name, uncompressed bytes)
+        compression: "stored", "deflate", "bzip2" or "lzma" (defaults to PACKET_COMPRESSION)
+        compresslevel: Compression level (defaults to PACKET_COMPRESSLEVEL)
+    """
+    compression = compression or PACKET_COMPRESSION
+    level = PACKET_COMPRESSLEVEL if compresslevel is None else compresslevel
+    if compression not in COMPRESSION_METHODS:
+        raise ValueError(f"Unknown packet compression: {compression}")
+
+    workers = min(PACKET_COMPRESSION_WORKERS, len(members))
+    if compression in ("deflate", "bzip2") and workers > 1 and _can_append_raw(zipf):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            compressed = list(pool.map(
+                lambda member: _compress_member(member[1], compression, level), members
+            ))
+        for (name, data), (crc, stream) in zip(members, compressed):
+            _append_compressed(zipf, name, data, crc, stream, compression)
+        return
+
+    for name, data in members:
+        zipf.writestr(
+            name, data,
+            compress_type=COMPRESSION_METHODS[compression],
+            compresslevel=level if compression != "lzma" else None
+        )
+
+
+def build_packet(
+    pdf_paths: List[str],
+    form_data: Dict[str, Any],
+    persist_path: Optional[str] = None,
+    compression: Optional[str] = None,
+    compresslevel: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Fills each blank form and streams the results into a zip buffer.
+
+    Args:
+        pdf_paths: Paths to the blank PDF forms
+        form_data: Dictionary with form field names and values
+        persist_path: Also write the zip here (optional)
+        compression: Zip compression method (defaults to PACKET_COMPRESSION)
+        compresslevel: Compression level (defaults to PACKET_COMPRESSLEVEL)
+
+    Returns:
+        Dictionary with status, the zip "buffer" (positioned at 0), its
+        "size", the "filled" member names, "errors" and "zip_path"
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=PACKET_SPOOL_MAX_BYTES)
+    members, errors = [], []
+
+    for pdf_path in pdf_paths:
+        try:
+            # pypdf needs a seekable stream, so each PDF is rendered to its own small buffer
+            pdf_buffer = io.BytesIO()
+            fill_pdf_writer(pdf_path, form_data).write(pdf_buffer)
+            members.append((filled_member_name(pdf_path), pdf_buffer.getvalue()))
+        except Exception as e:
+            errors.append(f"{pdf_path}: {str(e)}")
+
+    with zipfile.ZipFile(buffer, 'w') as zipf:
+        write_members(zipf, members, compression, compresslevel)
+    filled = [name for name, _ in members]
+
+    size = buffer.tell()
+    buffer.seek(0)
+
+    zip_path = None
+    if persist_path:
+        os.makedirs(os.path.dirname(persist_path) or '.', exist_ok=True)
+        with open(persist_path, 'wb') as f:
+            shutil.copyfileobj(buffer, f)
+        buffer.seek(0)
+        zip_path = persist_path
+
+    return {
+        "status": "success" if filled or not pdf_paths else "error",
+        "buffer": buffer,
+        "size": size,
+        "filled": filled,
+        "errors": errors,
+        "zip_path": zip_path
+    }
@@ -0,0 +1,213 @@
+"""
+Tool Cache - Memoizing wrapper for ADK FunctionTools
+
+Each tool gets a caching policy:
+- "pure":  results depend only on the arguments and are cached until evicted
+- "ttl":   results come from I/O and are reused for a limited time
+- "never": the tool has side effects and always runs (calls are still counted)
+
+Caches are in-memory LRUs bounded by entry count and by the JSON size of the
+stored results. Error results ({"status": "error"}) are never cached.
+
+google.adk is only imported when a FunctionTool is actually built, so code
+that calls the memoized functions directly does not pay for it.
+"""
+import copy
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from utils import metrics
+
+
+POLICIES = ("pure", "ttl", "never")
+
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "256"))
+TOOL_CACHE_MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+TOOL_CACHE_TTL = int(os.getenv("TOOL_CACHE_TTL", "300"))
+
+_registry_lock = threading.Lock()
+_caches: Dict[str, "ToolCache"] = {}
+
+
+class ToolCache:
+    """LRU cache of one tool's results, bounded by entries and bytes"""
+
+    def __init__(self, policy: str, ttl: Optional[float], max_entries: int, max_bytes: int):
+        self.policy = policy
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0, "expirations": 0}
+        self.lock = threading.Lock()
+
+    def get(self, key: str, validate: Optional[Callable[[Any], bool]] = None) -> tuple:
+        """Returns (True, result) on a hit, (False, None) on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                result, size, stored_at = entry
+                expired = self.ttl is not None and time.monotonic() - stored_at > self.ttl
+                if expired or (validate is not None and not validate(result)):
+                    self._remove(key)
+                    self.stats["expirations"] += 1
+                else:
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return True, copy.deepcopy(result)
+            self.stats["misses"] += 1
+            return False, None
+
+    def put(self, key: str, result: Any) -> None:
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (copy.deepcopy(result), size, time.monotonic())
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats, policy=self.policy, entries=len(self.entries), bytes=self.bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+def memoize_tool(
+    policy: str,
+    ttl: Optional[float] = None,
+    max_entries: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    validate: Optional[Callable[[Any], bool]] = None
+) -> Callable:
+    """
+    Decorator that caches a tool function's results according to a policy.
+
+    The wrapper keeps the function's name, docstring and signature, so
+    FunctionTool builds the same declaration for it. It also gains
+    cache_stats() and cache_clear().
+
+    Args:
+        policy: "pure", "ttl" or "never"
+        ttl: Seconds a "ttl" result stays fresh (defaults to TOOL_CACHE_TTL)
+        max_entries: Most results kept (defaults to TOOL_CACHE_MAX_ENTRIES)
+        max_bytes: Most JSON bytes of results kept (defaults to TOOL_CACHE_MAX_BYTES)
+        validate: Optional check that a cached result is still usable
+            (e.g. the files it lists still exist)
+
+    Returns:
+        Decorator for the tool function
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown tool cache policy: {policy}")
+
+    def decorator(func: Callable) -> Callable:
+        cache = ToolCache(
+            policy,
+            (TOOL_CACHE_TTL if ttl is None else ttl) if policy == "ttl" else None,
+            max_entries or TOOL_CACHE_MAX_ENTRIES,
+            max_bytes or TOOL_CACHE_MAX_BYTES
+        )
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if policy == "never":
+                with cache.lock:
+                    cache.stats["bypassed"] += 1
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {name: value for name, value in bound.arguments.items() if name != "tool_context"}
+            key = json.dumps(arguments, sort_keys=True, default=str)
+
+            hit, result = cache.get(key, validate)
+            if hit:
+                return result
+            result = func(*args, **kwargs)
+            if not (isinstance(result, dict) and result.get("status") == "error"):
+                cache.put(key, result)
+            return result
+
+        wrapper.cache_stats = cache.snapshot
+        wrapper.cache_clear = cache.clear
+        with _registry_lock:
+            _caches[func.__name__] = cache
+        return wrapper
+
+    return decorator
+
+
+def lazy_adk_tools(module_name: str, tools: Dict[str, Callable]) -> Callable[[str], Any]:
+    """
+    Returns a module __getattr__ that builds ADK FunctionTools on first access.
+
+    Usage, at the bottom of a tool module:
+        __getattr__ = lazy_adk_tools(__name__, {"my_adk_tool": cached_my_tool})
+
+    Args:
+        module_name: The module's __name__
+        tools: Dictionary of attribute name -> (already memoized) tool function
+
+    Returns:
+        Function to assign to the module's __getattr__
+    """
+    lock = threading.Lock()
+
+    def __getattr__(name: str) -> Any:
+        if name not in tools:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        from google.adk.tools import FunctionTool
+        module = sys.modules[module_name]
+        with lock:
+            # Stored on the module, so later lookups no longer reach __getattr__
+            if name not in module.__dict__:
+                setattr(module, name, FunctionTool(tools[name]))
+        return module.__dict__[name]
+
+    return __getattr__
+
+
+HIT_RATIO = metrics.gauge(
+    "tool_cache_hit_ratio", "Share of cached tool lookups served from the cache", ["tool"],
+    function=lambda: {
+        name: stats["hit_ratio"] for name, stats in get_tool_cache_stats().items() if stats["policy"] != "never"
+    }
+)
+
+
+def get_tool_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns cache statistics for every wrapped tool.
+
+    Returns:
+        Dictionary of tool name -> policy, hits, misses, hit_ratio, bypassed,
+        entries, bytes, evictions and expirations
+    """
+    with _registry_lock:
+        caches = dict(_caches)
+    return {name: cache.snapshot() for name, cache in caches.items()}
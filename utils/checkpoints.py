@@ -0,0 +1,118 @@
+"""
+Case Checkpoints - Per-case stage results so interrupted cases resume where they stopped
+
+Each case (keyed by its LinkedIn URL) gets one JSON file holding the result
+of every completed stage together with an idempotency key derived from the
+stage's inputs. A rerun reuses a stage's stored result when its inputs are
+unchanged and its outputs are still valid, so only the remaining stages run.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "checkpoints")
+
+_lock = threading.Lock()
+
+
+def case_key(linkedin_url: str) -> str:
+    """Returns the stable checkpoint key for a case"""
+    return hashlib.sha256(linkedin_url.encode('utf-8')).hexdigest()[:24]
+
+
+def idempotency_key(key: str, stage: str, inputs: Any) -> str:
+    """Derives a stage's idempotency key from the case and the stage inputs"""
+    payload = json.dumps([key, stage, inputs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(CHECKPOINT_DIR, f"{key}.json")
+
+
+def load_checkpoints(key: str) -> Dict[str, Any]:
+    """
+    Reads all stage checkpoints for a case.
+
+    Args:
+        key: Case key from case_key()
+
+    Returns:
+        Dictionary of stage -> {"key", "result", "completed_at"}
+    """
+    try:
+        with open(_path(key), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_checkpoint(key: str, stage: str, stage_key: str, result: Any) -> None:
+    """Records a completed stage, atomically replacing the case's checkpoint file"""
+    with _lock:
+        checkpoints = load_checkpoints(key)
+        checkpoints[stage] = {
+            "key": stage_key,
+            "result": result,
+            "completed_at": datetime.utcnow().isoformat()
+        }
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        tmp_path = f"{_path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoints, f, default=str)
+        os.replace(tmp_path, _path(key))
+
+
+def lookup_stage(key: str, stage: str, inputs: Any) -> Optional[Dict[str, Any]]:
+    """Returns a stage's checkpoint if it was recorded for these inputs, else None"""
+    checkpoint = load_checkpoints(key).get(stage)
+    if checkpoint and checkpoint["key"] == idempotency_key(key, stage, inputs):
+        return checkpoint
+    return None
+
+
+def record_stage(key: str, stage: str, inputs: Any, result: Any) -> None:
+    """Records a stage result computed outside run_stage (e.g. in a batch)"""
+    save_checkpoint(key, stage, idempotency_key(key, stage, inputs), result)
+
+
+def run_stage(
+    key: str,
+    stage: str,
+    inputs: Any,
+    func: Callable[[], Any],
+    is_valid: Optional[Callable[[Any], bool]] = None
+) -> Any:
+    """
+    Runs a stage once per set of inputs, resuming from its checkpoint if present.
+
+    Args:
+        key: Case key from case_key()
+        stage: Stage name, e.g. "eligibility"
+        inputs: JSON-serializable inputs the stage result depends on
+        func: Computes the stage result (must be JSON-serializable)
+        is_valid: Optional check that a stored result is still usable
+            (e.g. its output files still exist)
+
+    Returns:
+        The stage result, stored or freshly computed
+    """
+    checkpoint = lookup_stage(key, stage, inputs)
+    if checkpoint and (is_valid is None or is_valid(checkpoint["result"])):
+        print(f"[Checkpoint] Resuming {stage} from checkpoint")
+        return checkpoint["result"]
+
+    result = func()
+    record_stage(key, stage, inputs, result)
+    return result
+
+
+def clear_checkpoints(key: str) -> None:
+    """Removes a case's checkpoints once the case is fully recorded"""
+    with _lock:
+        if os.path.exists(_path(key)):
+            os.remove(_path(key))
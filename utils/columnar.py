@@ -0,0 +1,383 @@
+"""
+Columnar Export - shared_state.jsonl as typed, dictionary-encoded columns
+
+Each export appends one part holding the rows written since the previous
+export (tracked by byte offset, like the rollups), so re-exporting a large
+log only parses the new lines. Parts are written as one .npy file per
+column, or as Parquet files when EXPORT_FORMAT is "parquet" (or "auto" and
+pyarrow is installed). A replaced or truncated log is exported again from
+the start, and parts are compacted into one when there are too many.
+
+Two tables are written:
+- cases: one row per log line, with columns day (days since 1970-01-01,
+  -1 if undated), state, status (dictionary codes), amount (NaN if absent)
+  and worker (64-bit hash of the canonical LinkedIn identity)
+- programs: one row per (case, program), with columns row (index into
+  cases), program (dictionary code) and amount
+
+Dictionaries are append-only and kept in meta.json, so codes stay the same
+across parts. load_export() memory-maps .npy columns, and totals_by_state()
+shows a vectorized aggregation over them.
+
+numpy is required (and pyarrow for Parquet); both are optional dependencies
+of the project.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from utils.hyperloglog import canonical_worker_id
+
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports/shared_state")
+# "npy", "parquet" or "auto" (parquet when pyarrow is installed)
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "auto")
+EXPORT_MAX_PARTS = int(os.getenv("EXPORT_MAX_PARTS", "64"))
+EXPORT_VERSION = 1
+
+# Table -> column -> numpy dtype
+TABLES = {
+    "cases": {"day": "int32", "state": "int16", "status": "int8", "amount": "float64", "worker": "uint64"},
+    "programs": {"row": "int64", "program": "int16", "amount": "float64"}
+}
+# (table, column) -> dictionary in meta.json
+DICTIONARY_COLUMNS = {("cases", "state"): "state", ("cases", "status"): "status", ("programs", "program"): "program"}
+
+_EPOCH = date(1970, 1, 1)
+_lock = threading.Lock()
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("numpy is required for the columnar export (pip install numpy)")
+
+
+def resolve_format(fmt: Optional[str] = None) -> str:
+    """Returns the concrete export format ("npy" or "parquet") for a requested one"""
+    fmt = fmt or EXPORT_FORMAT
+    if fmt == "auto":
+        return "parquet" if pq is not None else "npy"
+    if fmt == "parquet" and pq is None:
+        raise RuntimeError("pyarrow is required for Parquet export (pip install pyarrow)")
+    if fmt not in ("npy", "parquet"):
+        raise ValueError(f"Unknown export format: {fmt}")
+    return fmt
+
+
+def _empty_meta(fmt: str) -> Dict[str, Any]:
+    return {
+        "version": EXPORT_VERSION,
+        "format": fmt,
+        "offset": 0,
+        "inode": None,
+        "rows": 0,
+        "parts": [],
+        "next_part": 0,
+        "dictionaries": {"state": [], "status": [], "program": []}
+    }
+
+
+def _load_meta(export_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(export_dir, "meta.json"), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_meta(export_dir: str, meta: Dict[str, Any]) -> None:
+    path = os.path.join(export_dir, "meta.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path)
+
+
+def _day_number(value: Any) -> int:
+    try:
+        return (date.fromisoformat(str(value)[:10]) - _EPOCH).days
+    except ValueError:
+        return -1
+
+
+def _worker_hash(linkedin_url: str) -> int:
+    worker = canonical_worker_id(linkedin_url or "")
+    return int.from_bytes(hashlib.blake2b(worker.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _code(dictionaries: Dict[str, List[str]], codes: Dict[str, Dict[str, int]], name: str, value: str) -> int:
+    """Returns the dictionary code of a value, adding it to the dictionary if new"""
+    lookup = codes[name]
+    if value not in lookup:
+        lookup[value] = len(dictionaries[name])
+        dictionaries[name].append(value)
+    return lookup[value]
+
+
+def _encode(entries: List[Dict[str, Any]], first_row: int, dictionaries: Dict[str, List[str]]) -> Dict[str, Dict[str, Any]]:
+    """Turns log entries into the columns of both tables"""
+    codes = {name: {value: code for code, value in enumerate(values)} for name, values in dictionaries.items()}
+    cases = {column: [] for column in TABLES["cases"]}
+    programs = {column: [] for column in TABLES["programs"]}
+
+    for row, entry in enumerate(entries, start=first_row):
+        amount = entry.get("amount_unlocked")
+        cases["day"].append(_day_number(entry.get("processed_at") or entry.get("timestamp") or ""))
+        cases["state"].append(_code(dictionaries, codes, "state", entry.get("state") or "unknown"))
+        cases["status"].append(_code(dictionaries, codes, "status", entry.get("status") or "unknown"))
+        cases["amount"].append(float(amount) if isinstance(amount, (int, float)) else float("nan"))
+        cases["worker"].append(_worker_hash(entry.get("linkedin_url")))
+
+        program_amounts = entry.get("program_amounts") or {}
+        for program in entry.get("programs") or []:
+            programs["row"].append(row)
+            programs["program"].append(_code(dictionaries, codes, "program", program))
+            programs["amount"].append(float(program_amounts.get(program, 0)))
+
+    return {
+        table: {column: np.asarray(values, dtype=TABLES[table][column]) for column, values in columns.items()}
+        for table, columns in (("cases", cases), ("programs", programs))
+    }
+
+
+def _write_part(export_dir: str, part: str, fmt: str, tables: Dict[str, Dict[str, Any]],
+                dictionaries: Dict[str, List[str]]) -> None:
+    """Writes one part; it only becomes visible once meta.json lists it"""
+    part_dir = os.path.join(export_dir, part)
+    tmp_dir = f"{part_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    for table, columns in tables.items():
+        if fmt == "npy":
+            for column, values in columns.items():
+                np.save(os.path.join(tmp_dir, f"{table}.{column}.npy"), values)
+            continue
+
+        arrays = {}
+        for column, values in columns.items():
+            dictionary = DICTIONARY_COLUMNS.get((table, column))
+            if dictionary:
+                arrays[column] = pa.DictionaryArray.from_arrays(
+                    pa.array(values), pa.array(dictionaries[dictionary], type=pa.string())
+                )
+            else:
+                arrays[column] = pa.array(values)
+        pq.write_table(pa.table(arrays), os.path.join(tmp_dir, f"{table}.parquet"))
+
+    shutil.rmtree(part_dir, ignore_errors=True)
+    os.replace(tmp_dir, part_dir)
+
+
+def _read_part(export_dir: str, part: str, fmt: str, mmap: bool) -> Dict[str, Dict[str, Any]]:
+    part_dir = os.path.join(export_dir, part)
+    tables = {}
+    for table, columns in TABLES.items():
+        if fmt == "npy":
+            tables[table] = {
+                column: np.load(os.path.join(part_dir, f"{table}.{column}.npy"), mmap_mode="r" if mmap else None)
+                for column in columns
+            }
+            continue
+
+        parquet = pq.read_table(os.path.join(part_dir, f"{table}.parquet"), memory_map=mmap)
+        tables[table] = {}
+        for column, dtype in columns.items():
+            chunked = parquet.column(column)
+            if (table, column) in DICTIONARY_COLUMNS:
+                # Dictionaries only grow, so every part's indices are global codes
+                chunks = [chunk.indices.to_numpy(zero_copy_only=False) for chunk in chunked.chunks]
+                tables[table][column] = np.concatenate(chunks).astype(dtype) if chunks else np.empty(0, dtype)
+            else:
+                tables[table][column] = chunked.to_numpy().astype(dtype, copy=False)
+    return tables
+
+
+def _concat(parts: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    if len(parts) == 1:
+        return parts[0]
+    return {
+        table: {column: np.concatenate([part[table][column] for part in parts]) for column in columns}
+        for table, columns in TABLES.items()
+    }
+
+
+def _compact(export_dir: str, meta: Dict[str, Any]) -> None:
+    """Merges all parts into one"""
+    tables = _concat([_read_part(export_dir, part, meta["format"], mmap=False) for part in meta["parts"]])
+    part = f"part-{meta['next_part']:05d}"
+    _write_part(export_dir, part, meta["format"], tables, meta["dictionaries"])
+    old_parts, meta["parts"] = meta["parts"], [part]
+    meta["next_part"] += 1
+    _save_meta(export_dir, meta)
+    for old_part in old_parts:
+        shutil.rmtree(os.path.join(export_dir, old_part), ignore_errors=True)
+
+
+def export_shared_state(
+    state_file: Optional[str] = None,
+    export_dir: Optional[str] = None,
+    fmt: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Exports the rows appended to shared_state.jsonl since the last export.
+
+    Args:
+        state_file: Path of shared_state.jsonl (defaults to SHARED_STATE_FILE)
+        export_dir: Export directory (defaults to EXPORT_DIR)
+        fmt: "npy", "parquet" or "auto" (defaults to EXPORT_FORMAT); changing
+            the format of an existing export rewrites it
+
+    Returns:
+        Dictionary with status, rows_added, rows, parts, format and export_dir
+    """
+    from utils import shared_state
+
+    state_file = state_file or shared_state.SHARED_STATE_FILE
+    export_dir = export_dir or EXPORT_DIR
+    try:
+        _require_numpy()
+        fmt = resolve_format(fmt)
+    except (RuntimeError, ValueError) as e:
+        return {"status": "error", "message": str(e)}
+
+    if not os.path.exists(state_file):
+        return {"status": "error", "message": f"{state_file} not found"}
+
+    with _lock:
+        os.makedirs(export_dir, exist_ok=True)
+        meta = _load_meta(export_dir)
+        stat = os.stat(state_file)
+        if (
+            not meta
+            or meta.get("version") != EXPORT_VERSION
+            or meta["format"] != fmt
+            or meta["inode"] != stat.st_ino
+            or stat.st_size < meta["offset"]
+        ):
+            # New, replaced or truncated log (or a different format): start over
+            for part in (meta or {}).get("parts", []):
+                shutil.rmtree(os.path.join(export_dir, part), ignore_errors=True)
+            meta = _empty_meta(fmt)
+            meta["inode"] = stat.st_ino
+
+        with open(state_file, 'rb') as f:
+            f.seek(meta["offset"])
+            data = f.read()
+        # A line still being written is exported next time
+        complete = data[:data.rfind(b'\n') + 1]
+        entries = []
+        for line in complete.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict):
+                entries.append(entry)
+
+        if entries:
+            tables = _encode(entries, meta["rows"], meta["dictionaries"])
+            part = f"part-{meta['next_part']:05d}"
+            _write_part(export_dir, part, fmt, tables, meta["dictionaries"])
+            meta["parts"].append(part)
+            meta["next_part"] += 1
+            meta["rows"] += len(entries)
+        meta["offset"] += len(complete)
+        _save_meta(export_dir, meta)
+
+        if len(meta["parts"]) > EXPORT_MAX_PARTS:
+            _compact(export_dir, meta)
+
+    return {
+        "status": "success",
+        "message": f"Exported {len(entries)} new rows ({meta['rows']} total) to {export_dir}",
+        "rows_added": len(entries),
+        "rows": meta["rows"],
+        "parts": len(meta["parts"]),
+        "format": fmt,
+        "export_dir": export_dir
+    }
+
+
+def load_export(export_dir: Optional[str] = None, mmap: bool = True) -> Dict[str, Any]:
+    """
+    Loads an export's columns.
+
+    Args:
+        export_dir: Export directory (defaults to EXPORT_DIR)
+        mmap: Memory-map the files instead of reading them (a single .npy
+            part stays memory-mapped; several parts are concatenated)
+
+    Returns:
+        Dictionary with "cases" and "programs" (column -> numpy array),
+        "dictionaries" (name -> list of values, indexed by code) and "rows"
+    """
+    _require_numpy()
+    export_dir = export_dir or EXPORT_DIR
+    meta = _load_meta(export_dir)
+    if not meta:
+        raise FileNotFoundError(f"No export found in {export_dir}")
+
+    parts = [_read_part(export_dir, part, meta["format"], mmap) for part in meta["parts"]]
+    tables = _concat(parts) if parts else {
+        table: {column: np.empty(0, dtype=dtype) for column, dtype in columns.items()}
+        for table, columns in TABLES.items()
+    }
+    return dict(tables, dictionaries=meta["dictionaries"], rows=meta["rows"])
+
+
+def totals_by_state(
+    export: Dict[str, Any],
+    start_date: date,
+    end_date: date,
+    status: Optional[str] = "processed"
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Sums cases, amounts and distinct workers per state over a date range.
+
+    Args:
+        export: Result of load_export
+        start_date: First day (inclusive)
+        end_date: Last day (inclusive)
+        status: Only rows with this status (None for all rows)
+
+    Returns:
+        Dictionary of state -> {"cases", "amount", "workers"} for states with rows
+    """
+    cases = export["cases"]
+    states = export["dictionaries"]["state"]
+    mask = (cases["day"] >= (start_date - _EPOCH).days) & (cases["day"] <= (end_date - _EPOCH).days)
+    if status is not None:
+        if status not in export["dictionaries"]["status"]:
+            return {}
+        mask &= cases["status"] == export["dictionaries"]["status"].index(status)
+    if not mask.any():
+        return {}
+
+    state_codes = cases["state"][mask].astype(np.int64)
+    amounts = np.nan_to_num(cases["amount"][mask])
+    counts = np.bincount(state_codes, minlength=len(states))
+    sums = np.bincount(state_codes, weights=amounts, minlength=len(states))
+    # Distinct (state, worker) pairs, then pairs per state
+    pairs = np.unique(np.stack([state_codes.astype(np.uint64), cases["worker"][mask]]), axis=1)
+    workers = np.bincount(pairs[0].astype(np.int64), minlength=len(states))
+
+    return {
+        states[code]: {"cases": int(counts[code]), "amount": round(float(sums[code]), 2), "workers": int(workers[code])}
+        for code in np.flatnonzero(counts)
+    }
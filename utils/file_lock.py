@@ -0,0 +1,51 @@
+"""
+File Lock - Exclusive locks around read-modify-write of files shared by agents
+
+The scout, caseworker and watchdog processes update the same files on disk.
+locked(path) holds a threading.Lock for the threads of this process and an
+fcntl lock on "<path>.lock" for other processes (fcntl locks belong to the
+process, so they do not exclude its own threads). Where fcntl is not
+available (Windows) only the thread lock is taken.
+"""
+import contextlib
+import os
+import threading
+from typing import Dict, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+_guard = threading.Lock()
+_thread_locks: Dict[str, threading.Lock] = {}
+
+
+def _thread_lock(lock_path: str) -> threading.Lock:
+    with _guard:
+        return _thread_locks.setdefault(os.path.abspath(lock_path), threading.Lock())
+
+
+@contextlib.contextmanager
+def locked(path: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock for path across threads and processes (not reentrant).
+
+    Args:
+        path: File being updated; the lock itself is taken on "<path>.lock"
+    """
+    lock_path = f"{path}.lock"
+    with _thread_lock(lock_path):
+        if fcntl is None:
+            yield
+            return
+        directory = os.path.dirname(lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
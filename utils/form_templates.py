@@ -0,0 +1,234 @@
+"""
+Form Template Registry - Parses each blank PDF form once and compiles its field map
+
+A template is parsed the first time it is used. Its AcroForm field names are
+matched against the aliases of our logical fields (name, address, employer,
+wage, email, phone), and every field is indexed to the pages that display
+it, so filling only visits those pages. The mapping and index are kept in
+memory and cached on disk keyed by the template's content hash.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from pypdf import PdfReader
+
+from utils.template_cache import file_md5
+
+
+FORM_FIELD_CACHE_DIR = os.getenv("FORM_FIELD_CACHE_DIR", ".cache/form_fields")
+
+# Logical field -> field names commonly used for it on state forms, in order of preference
+FIELD_ALIASES = {
+    "name": ["name", "full_name", "applicant_name"],
+    "address": ["address", "street_address", "mailing_address"],
+    "employer": ["employer", "last_employer", "previous_employer"],
+    "wage": ["wage", "salary", "last_wage", "annual_wage"],
+    "email": ["email", "email_address"],
+    "phone": ["phone", "phone_number", "telephone"]
+}
+
+_lock = threading.Lock()
+_templates: Dict[str, Dict[str, Any]] = {}
+
+
+def compile_field_map(field_names: List[str]) -> Dict[str, str]:
+    """
+    Maps each logical field to the template's real field name.
+
+    An alias matches a field when it equals the full field name, or, ignoring
+    case, the full name or its last dotted component.
+
+    Args:
+        field_names: Fully qualified AcroForm field names of the template
+
+    Returns:
+        Dictionary of logical field -> real field name
+    """
+    by_lower = {}
+    for field_name in field_names:
+        by_lower.setdefault(field_name.lower(), field_name)
+        by_lower.setdefault(field_name.rsplit('.', 1)[-1].lower(), field_name)
+
+    field_map = {}
+    for key, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            if alias in field_names:
+                field_map[key] = alias
+                break
+            if alias in by_lower:
+                field_map[key] = by_lower[alias]
+                break
+    return field_map
+
+
+def _qualified_name(field) -> str:
+    parts = []
+    while field is not None:
+        if "/T" in field:
+            parts.append(str(field["/T"]))
+        field = field.get("/Parent")
+        field = field.get_object() if field is not None else None
+    return ".".join(reversed(parts))
+
+
+def index_field_pages(reader: PdfReader) -> Dict[str, List[int]]:
+    """
+    Indexes each form field to the pages whose widgets display it.
+
+    Args:
+        reader: Parsed template
+
+    Returns:
+        Dictionary of qualified field name -> sorted page numbers
+    """
+    field_pages = {}
+    for page_number, page in enumerate(reader.pages):
+        for annot in page.get("/Annots") or []:
+            annot = annot.get_object()
+            if annot.get("/Subtype") != "/Widget":
+                continue
+            field = annot if "/T" in annot else annot.get("/Parent")
+            if field is None:
+                continue
+            pages = field_pages.setdefault(_qualified_name(field.get_object()), [])
+            if page_number not in pages:
+                pages.append(page_number)
+    return field_pages
+
+
+def _load_cached_fields(md5: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(FORM_FIELD_CACHE_DIR, f"{md5}.json"), 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    field_pages = cached.get("field_pages")
+    # Entries written before the index held plain page numbers are rebuilt
+    if not isinstance(field_pages, dict) or any(
+        not isinstance(page, int) for pages in field_pages.values() for page in pages
+    ):
+        return None
+    # Recompile if the alias table changed since the mapping was cached
+    if cached.get("aliases") != FIELD_ALIASES:
+        cached["field_map"] = compile_field_map(cached["fields"])
+    return cached
+
+
+def _save_cached_fields(
+    md5: str,
+    fields: List[str],
+    field_map: Dict[str, str],
+    field_pages: Dict[str, List[int]]
+) -> None:
+    os.makedirs(FORM_FIELD_CACHE_DIR, exist_ok=True)
+    path = os.path.join(FORM_FIELD_CACHE_DIR, f"{md5}.json")
+    with open(path + ".tmp", 'w') as f:
+        json.dump({
+            "fields": fields,
+            "field_map": field_map,
+            "field_pages": field_pages,
+            "aliases": FIELD_ALIASES
+        }, f)
+    os.replace(path + ".tmp", path)
+
+
+def get_template(pdf_path: str) -> Dict[str, Any]:
+    """
+    Returns the parsed template for a blank PDF form, parsing it on first use.
+
+    Args:
+        pdf_path: Path to the blank PDF form
+
+    Returns:
+        Dictionary with the PdfReader ("reader"), its field names ("fields"),
+        the compiled logical -> real field mapping ("field_map"), the field ->
+        page numbers index ("field_pages") and a lock that serializes reads
+        from the shared reader ("lock")
+    """
+    stat = os.stat(pdf_path)
+    key = os.path.abspath(pdf_path)
+
+    with _lock:
+        template = _templates.get(key)
+        if template and template["stat"] == (stat.st_mtime_ns, stat.st_size):
+            return template
+
+    md5 = file_md5(pdf_path)
+    reader = PdfReader(pdf_path)
+    cached = _load_cached_fields(md5)
+    if cached:
+        fields, field_map, field_pages = cached["fields"], cached["field_map"], cached["field_pages"]
+    else:
+        fields = list((reader.get_fields() or {}).keys())
+        field_map = compile_field_map(fields)
+        field_pages = index_field_pages(reader)
+        _save_cached_fields(md5, fields, field_map, field_pages)
+
+    template = {
+        "path": pdf_path,
+        "md5": md5,
+        "stat": (stat.st_mtime_ns, stat.st_size),
+        "reader": reader,
+        "fields": fields,
+        "field_map": field_map,
+        "field_pages": field_pages,
+        "lock": threading.Lock()
+    }
+    with _lock:
+        _templates[key] = template
+    return template
+
+
+def _logical_field(key: str) -> str:
+    lowered = key.lower()
+    for logical, aliases in FIELD_ALIASES.items():
+        if lowered == logical or lowered in aliases:
+            return logical
+    return next((logical for logical in FIELD_ALIASES if logical in lowered), key)
+
+
+def map_form_data(template: Dict[str, Any], form_data: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Translates logical form data into the template's real field names.
+
+    Keys are matched exactly against every alias in FIELD_ALIASES first
+    (e.g. "email_address" -> "email"); keys matching no alias go to the
+    first logical field they contain (e.g. "current_employer" -> "employer").
+
+    Args:
+        template: Template returned by get_template
+        form_data: Dictionary of logical field -> value
+
+    Returns:
+        Dictionary of real field name -> string value, for fields the template has
+    """
+    field_map = template["field_map"]
+    values = {}
+    for key, value in form_data.items():
+        if value is None:
+            continue
+        key = _logical_field(key)
+        if key in field_map:
+            values[field_map[key]] = str(value)
+    return values
+
+
+def group_by_page(template: Dict[str, Any], values: Dict[str, str]) -> Dict[int, Dict[str, str]]:
+    """
+    Splits real-field values by the pages that display them.
+
+    Args:
+        template: Template returned by get_template
+        values: Dictionary of real field name -> value
+
+    Returns:
+        Dictionary of page number -> values for the fields on that page
+    """
+    by_page = {}
+    field_pages = template["field_pages"]
+    for field_name, value in values.items():
+        for page_number in field_pages.get(field_name, []):
+            by_page.setdefault(page_number, {})[field_name] = value
+    return by_page
@@ -0,0 +1,265 @@
+"""
+Google API Client Manager - Shared credentials and service clients for all Google tools
+
+Credentials are loaded once per token file and kept in memory, with a
+background timer refreshing them shortly before they expire. Discovery
+documents are parsed once and cached on disk so build() works offline.
+
+Each service client is built once per process and shared by every thread.
+httplib2 transports are not thread-safe, so the client's HTTP object is a
+PooledHttp: every request borrows an idle keep-alive transport (or opens
+one) and returns it afterwards, so connections outlive the short-lived
+worker threads that use them.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import build_http
+
+
+DISCOVERY_CACHE_DIR = os.getenv("DISCOVERY_CACHE_DIR", ".cache/discovery")
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+CLIENT_SECRETS_FILE = os.getenv("GOOGLE_CLIENT_SECRETS_FILE", "credentials.json")
+
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+# Idle keep-alive transports kept per set of credentials
+GOOGLE_HTTP_POOL_SIZE = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", "8"))
+
+_lock = threading.RLock()
+_credentials: Dict[str, Credentials] = {}
+_refresh_timers: Dict[str, threading.Timer] = {}
+_discovery_docs: Dict[str, Dict[str, Any]] = {}
+# (api, version, token file) -> (credentials, service, its PooledHttp)
+_services: Dict[Tuple[str, str, str], Tuple[Credentials, Any, "PooledHttp"]] = {}
+
+
+def _save_token(token_file: str, creds: Credentials) -> None:
+    tmp_path = f"{token_file}.tmp"
+    with open(tmp_path, 'w') as token:
+        token.write(creds.to_json())
+    os.replace(tmp_path, token_file)
+
+
+def _refresh(token_file: str, creds: Credentials) -> None:
+    creds.refresh(Request())
+    _save_token(token_file, creds)
+
+
+def _schedule_refresh(token_file: str, creds: Credentials) -> None:
+    """Arms a daemon timer that refreshes the credentials before they expire"""
+    timer = _refresh_timers.pop(token_file, None)
+    if timer:
+        timer.cancel()
+    if not creds.expiry or not creds.refresh_token:
+        return
+
+    delay = (creds.expiry - datetime.utcnow()).total_seconds() - TOKEN_REFRESH_MARGIN
+
+    def refresh_job():
+        try:
+            with _lock:
+                _refresh(token_file, creds)
+                _schedule_refresh(token_file, creds)
+        except Exception as e:
+            print(f"[GoogleClients] Background token refresh failed for {token_file}: {e}")
+
+    timer = threading.Timer(max(delay, 0), refresh_job)
+    timer.daemon = True
+    timer.start()
+    _refresh_timers[token_file] = timer
+
+
+def get_credentials(token_file: str, scopes: List[str]) -> Optional[Credentials]:
+    """
+    Returns cached OAuth credentials for a token file, authorizing on first use.
+
+    Args:
+        token_file: Path of the authorized-user token JSON
+        scopes: OAuth scopes required by the caller
+
+    Returns:
+        Valid credentials, or None if no client secrets are available
+
+    Raises:
+        PermissionError: If the token lacks some scopes and there are no
+            client secrets to re-authorize with
+    """
+    with _lock:
+        creds = _credentials.get(token_file)
+        if creds and creds.valid and creds.has_scopes(scopes):
+            return creds
+
+        if not creds and os.path.exists(token_file):
+            # Scopes are read from the token file, so has_scopes reflects what was granted
+            creds = Credentials.from_authorized_user_file(token_file)
+
+        if creds and not creds.has_scopes(scopes):
+            missing = sorted(set(scopes) - set(creds.scopes or []))
+            if not os.path.exists(CLIENT_SECRETS_FILE):
+                raise PermissionError(
+                    f"{token_file} is not authorized for {missing}; "
+                    f"add credentials.json to re-authorize or delete the token file"
+                )
+            print(f"[GoogleClients] {token_file} lacks {missing}, re-authorizing")
+            # Ask for the new scopes along with the ones already granted
+            scopes = sorted(set(scopes) | set(creds.scopes or []))
+            creds = None
+
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
+                _refresh(token_file, creds)
+            else:
+                if not os.path.exists(CLIENT_SECRETS_FILE):
+                    print("Please download credentials.json from Google Cloud Console")
+                    return None
+                flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRETS_FILE, scopes)
+                creds = flow.run_local_server(port=0)
+                _save_token(token_file, creds)
+
+        _credentials[token_file] = creds
+        _schedule_refresh(token_file, creds)
+        return creds
+
+
+def get_discovery_doc(api: str, version: str) -> Dict[str, Any]:
+    """
+    Returns the parsed discovery document for an API.
+
+    Looks in memory, then the on-disk cache, then the documents bundled with
+    googleapiclient, and only fetches over the network as a last resort.
+
+    Args:
+        api: API name, e.g. "drive"
+        version: API version, e.g. "v3"
+
+    Returns:
+        Discovery document as a dictionary
+    """
+    key = f"{api}.{version}"
+    with _lock:
+        doc = _discovery_docs.get(key)
+        if doc:
+            return doc
+
+        path = os.path.join(DISCOVERY_CACHE_DIR, f"{key}.json")
+        content = None
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                content = f.read()
+        if content is None:
+            content = discovery_cache.get_static_doc(api, version)
+        if content is None:
+            response, body = build_http().request(DISCOVERY_URL.format(api=api, version=version))
+            if response.status >= 400:
+                raise RuntimeError(f"Could not fetch discovery document for {key}: {response.status}")
+            content = body.decode('utf-8')
+        if not os.path.exists(path):
+            os.makedirs(DISCOVERY_CACHE_DIR, exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+
+        doc = _discovery_docs[key] = json.loads(content)
+        return doc
+
+
+def new_http(credentials: Optional[Credentials] = None) -> httplib2.Http:
+    """Returns a fresh keep-alive HTTP transport, authorized when credentials are given"""
+    http = build_http()
+    return AuthorizedHttp(credentials, http=http) if credentials else http
+
+
+class PooledHttp:
+    """
+    Thread-safe stand-in for an httplib2.Http: each request runs on a
+    keep-alive transport borrowed from a pool for its duration.
+    """
+
+    def __init__(self, credentials: Optional[Credentials] = None, size: Optional[int] = None):
+        self.credentials = credentials
+        self.size = GOOGLE_HTTP_POOL_SIZE if size is None else size
+        self._idle: List[httplib2.Http] = []
+        self._pool_lock = threading.Lock()
+        self.created = 0
+
+    def acquire(self) -> httplib2.Http:
+        """Takes an idle transport, or opens one; give it back with release()"""
+        with self._pool_lock:
+            if self._idle:
+                return self._idle.pop()
+            self.created += 1
+        return new_http(self.credentials)
+
+    def release(self, http: httplib2.Http) -> None:
+        with self._pool_lock:
+            if len(self._idle) < self.size:
+                self._idle.append(http)
+                return
+        http.close()
+
+    def request(self, *args, **kwargs):
+        http = self.acquire()
+        try:
+            return http.request(*args, **kwargs)
+        finally:
+            self.release(http)
+
+    def close(self) -> None:
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for http in idle:
+            http.close()
+
+
+def get_service(api: str, version: str, scopes: List[str], token_file: str):
+    """
+    Returns the process-wide service client for an API.
+
+    Credentials, discovery documents and clients are shared by all threads;
+    requests run on pooled keep-alive transports (see PooledHttp).
+
+    Args:
+        api: API name, e.g. "gmail"
+        version: API version, e.g. "v1"
+        scopes: OAuth scopes required by the caller
+        token_file: Path of the authorized-user token JSON
+
+    Returns:
+        googleapiclient Resource, or None if authentication is not possible
+    """
+    creds = get_credentials(token_file, scopes)
+    if not creds:
+        return None
+
+    key = (api, version, token_file)
+    with _lock:
+        cached = _services.get(key)
+        if cached and cached[0] is creds:
+            return cached[1]
+        if cached:
+            # Re-authorized: drop the transports of the old credentials
+            cached[2].close()
+
+        http = PooledHttp(creds)
+        service = build_from_document(get_discovery_doc(api, version), http=http)
+        _services[key] = (creds, service, http)
+        return service
+
+
+def get_http(service) -> Optional[PooledHttp]:
+    """Returns the transport pool of a client built by get_service (None for other clients)"""
+    with _lock:
+        for _, cached_service, http in _services.values():
+            if cached_service is service:
+                return http
+    return None
@@ -0,0 +1,130 @@
+"""
+HyperLogLog - Mergeable, fixed-size sketches for counting distinct items
+
+A sketch with precision p keeps m = 2**p one-byte registers and estimates the
+number of distinct items added with a relative standard error of about
+1.04 / sqrt(m); at the default p = 12 that is 4 KB of registers and ~1.6%
+(so ~95% of estimates land within 3.3% of the true count). Small counts use
+linear counting and are close to exact. Merging two sketches (register-wise
+max) gives the sketch of the union, so counts over any set of days or states
+come from merging their sketches.
+
+Serialized sketches are zlib-compressed: the mostly-empty registers of a
+day's worth of workers take a few hundred bytes.
+"""
+import base64
+import functools
+import hashlib
+import math
+import zlib
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+
+HLL_PRECISION = 12
+
+
+@functools.lru_cache(maxsize=None)
+def _high_bits(size: int) -> int:
+    return int.from_bytes(b'\x80' * size, 'big')
+
+
+def _hash64(item: str) -> int:
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """Distinct-count sketch with 2**precision registers"""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[bytes] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"HyperLogLog precision must be between 4 and 16, got {precision}")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError(f"Expected {self.m} registers, got {len(self.registers)}")
+
+    def add(self, item: str) -> None:
+        value = _hash64(item)
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        # Position of the first 1 bit in the remaining 64 - p bits
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """Folds another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        # Byte-wise max of all registers at once: registers stay below 0x80,
+        # so (a | 0x80) - b keeps the 0x80 bit of a byte exactly when a >= b
+        a = int.from_bytes(self.registers, 'big')
+        b = int.from_bytes(other.registers, 'big')
+        high_bits = _high_bits(self.m)
+        a_wins = ((((a | high_bits) - b) & high_bits) >> 7) * 0xFF
+        merged = (a & a_wins) | (b & ~a_wins)
+        self.registers = bytearray(merged.to_bytes(self.m, 'big'))
+
+    def count(self) -> int:
+        """Returns the estimated number of distinct items added"""
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        histogram = [self.registers.count(rank) for rank in range(max(self.registers) + 1)]
+        estimate = alpha * m * m / sum(n * 2.0 ** -rank for rank, n in enumerate(histogram))
+        zeros = histogram[0]
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_string(self) -> str:
+        """Serializes the sketch as <precision>:<base64 of the zlib-compressed registers>"""
+        packed = base64.b64encode(zlib.compress(bytes(self.registers), 9)).decode('ascii')
+        return f"{self.precision}:{packed}"
+
+    @classmethod
+    def from_string(cls, data: str) -> "HyperLogLog":
+        precision, packed = data.split(":", 1)
+        return cls(int(precision), zlib.decompress(base64.b64decode(packed)))
+
+
+def standard_error(precision: int = HLL_PRECISION) -> float:
+    """Returns the relative standard error of a sketch with this precision"""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def canonical_worker_id(linkedin_url: str) -> str:
+    """
+    Returns a stable identity for the worker behind a LinkedIn URL.
+
+    Profile URLs (/in/<slug>) and post URLs (/posts/<slug>_<title>-activity-...)
+    both map to "in/<slug>", so a worker's profile, pending and processed rows
+    and reposts all count once. Other URLs are normalized (lowercase host
+    without "www.", no query, fragment or trailing slash).
+
+    Args:
+        linkedin_url: URL from a shared state entry
+
+    Returns:
+        Canonical identifier string
+    """
+    parsed = urlparse((linkedin_url or "").strip())
+    host = parsed.netloc.lower().rsplit("@", 1)[-1].split(":", 1)[0]
+    if host.startswith("www."):
+        host = host[4:]
+    parts = [part for part in parsed.path.split("/") if part]
+
+    if host == "linkedin.com" or host.endswith(".linkedin.com"):
+        if len(parts) >= 2 and parts[0] == "in":
+            return f"in/{parts[1].lower()}"
+        if len(parts) >= 2 and parts[0] == "posts" and "_" in parts[1]:
+            return f"in/{parts[1].split('_', 1)[0].lower()}"
+
+    if not host:
+        return (linkedin_url or "").strip().lower().rstrip("/")
+    return f"{host}/{'/'.join(parts)}".rstrip("/")
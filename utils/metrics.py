@@ -0,0 +1,383 @@
+"""
+Metrics - Counters, gauges and histograms with a Prometheus text exporter
+
+Metrics are created once at module level (metrics.counter(...) returns the
+same object for the same name) and updated in place: an update is a dict
+lookup and an addition under a per-metric lock. Gauges whose value lives
+elsewhere (queue depths, cache hit ratios) take a function that is only
+called when the metrics are rendered.
+
+Exposition (format 0.0.4) is off by default and started only by the
+long-lived agents (scout, watchdog, drive sync and the supervisor), never by
+the one-shot caseworker processes the scout spawns; run "main.py all" to
+export caseworker metrics from the process that handles the cases.
+- METRICS_PORT serves /metrics on METRICS_ADDR (127.0.0.1); if the port is
+  taken (e.g. by another agent) the error is logged and the agent carries on
+- METRICS_TEXTFILE names the file for node_exporter's textfile collector;
+  each agent writes its own copy (second_chance.prom -> second_chance.scout.prom)
+  with an agent label, every METRICS_TEXTFILE_INTERVAL seconds and at exit
+"""
+import atexit
+import bisect
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+
+METRICS_PREFIX = "second_chance_"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "")
+METRICS_TEXTFILE_INTERVAL = float(os.getenv("METRICS_TEXTFILE_INTERVAL", "15"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry_lock = threading.Lock()
+_registry: Dict[str, "Metric"] = {}
+_exporters: Dict[str, Any] = {}
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "", const: str = "") -> str:
+    pairs = [const] if const else []
+    pairs += [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Base class: a named family of samples keyed by label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> list:
+        """Returns [(suffix, label values, extra label, value)]"""
+        with self.lock:
+            return [("", key, "", value) for key, value in self.values.items()]
+
+    def render(self, const: str = "") -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            labels = _format_labels(self.labelnames, key, extra, const)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            # Unlabelled metrics are exported as 0 before their first update
+            self.values[()] = 0
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Value that goes up and down, set directly or read from a function at render time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], Any]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        if not self.labelnames:
+            self.values[()] = 0
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> list:
+        if self.function is None:
+            return super().samples()
+        try:
+            result = self.function()
+        except Exception as e:
+            print(f"[Metrics] Could not read {self.name}: {e}")
+            return []
+        if not isinstance(result, dict):
+            return [("", (), "", result)]
+        # {label value or tuple of label values: value}
+        return [
+            ("", key if isinstance(key, tuple) else (key,), "", value)
+            for key, value in result.items()
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values (e.g. seconds) over fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if not self.labelnames:
+            self.values[()] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket counts (made cumulative when rendered), then sum and count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> "_Timer":
+        """Context manager that observes the seconds its block takes"""
+        return _Timer(lambda elapsed, outcome: self.observe(elapsed, **labels))
+
+    def samples(self) -> list:
+        with self.lock:
+            states = [(key, list(state[0]), state[1], state[2]) for key, state in self.values.items()]
+        samples = []
+        for key, counts, total, count in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", key, f'le="{_format_value(bound)}"', cumulative))
+            samples.append(("_sum", key, "", total))
+            samples.append(("_count", key, "", count))
+        return samples
+
+
+class _Timer:
+    """Times a block; outcome is "error" if it raises, unless the block set it"""
+
+    def __init__(self, record: Callable[[float, str], None]):
+        self.record = record
+        self.outcome = None
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        outcome = self.outcome or ("error" if exc_type else "ok")
+        self.record(time.perf_counter() - self.started, outcome)
+        return False
+
+
+def _get_or_create(cls, name: str, *args, **kwargs) -> Any:
+    with _registry_lock:
+        metric = _registry.get(METRICS_PREFIX + name)
+        if metric is None:
+            metric = _registry[METRICS_PREFIX + name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"{name} is already registered as a {metric.kind}")
+        return metric
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    """Returns the counter with this name, creating it on first use"""
+    return _get_or_create(Counter, name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (),
+          function: Optional[Callable[[], Any]] = None) -> Gauge:
+    """
+    Returns the gauge with this name, creating it on first use.
+
+    Args:
+        name: Metric name (prefixed with METRICS_PREFIX)
+        documentation: HELP text
+        labelnames: Label names
+        function: Optional function read at render time; returns a number, or
+            a dict of label value (tuple of values for several labels) -> number.
+            A later call with a function replaces the earlier one.
+    """
+    metric = _get_or_create(Gauge, name, documentation, labelnames)
+    if function is not None:
+        metric.function = function
+    return metric
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Returns the histogram with this name, creating it on first use"""
+    return _get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+
+API_CALL_SECONDS = histogram(
+    "api_call_seconds", "Duration of calls to external APIs", ["api", "call", "outcome"]
+)
+
+
+def api_call(api: str, call: str) -> _Timer:
+    """
+    Times one external API call into api_call_seconds.
+
+    The outcome label is "error" when the block raises; set timer.outcome
+    for failures reported without an exception (e.g. an HTTP error status).
+
+    Usage:
+        with metrics.api_call("linkedin", "ugcPosts.create") as timer:
+            response = session.post(...)
+            if response.status_code != 201:
+                timer.outcome = "error"
+    """
+    return _Timer(lambda elapsed, outcome: API_CALL_SECONDS.observe(elapsed, api=api, call=call, outcome=outcome))
+
+
+def render(labels: Optional[Dict[str, str]] = None) -> str:
+    """
+    Returns every metric in the Prometheus text format.
+
+    Args:
+        labels: Constant labels added to every sample (optional)
+    """
+    const = _format_labels(list(labels), list(labels.values()))[1:-1] if labels else ""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+    return "\n".join(metric.render(const) for metric in metrics) + "\n"
+
+
+def textfile_path(agent: str, path: Optional[str] = None) -> str:
+    """Returns the agent's own textfile, e.g. second_chance.prom -> second_chance.scout.prom"""
+    root, ext = os.path.splitext(path or METRICS_TEXTFILE)
+    return f"{root}.{agent}{ext or '.prom'}"
+
+
+def write_textfile(path: Optional[str] = None, agent: Optional[str] = None) -> str:
+    """
+    Writes the metrics atomically to a .prom file for a textfile collector.
+
+    Args:
+        path: File to write (defaults to METRICS_TEXTFILE)
+        agent: Agent name; writes textfile_path(agent) instead, with an
+            agent label on every sample so files from different agents
+            never hold the same series
+
+    Returns:
+        The path written
+    """
+    path = path or METRICS_TEXTFILE
+    if agent:
+        path = textfile_path(agent, path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(render({"agent": agent} if agent else None))
+    os.replace(tmp_path, path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port: int, addr: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves /metrics on a daemon thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def _write_textfile_logged(path: str, agent: str) -> None:
+    try:
+        write_textfile(path, agent)
+    except OSError as e:
+        print(f"[Metrics] Could not write {textfile_path(agent, path)}: {e}")
+
+
+def _textfile_loop(path: str, agent: str, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        _write_textfile_logged(path, agent)
+
+
+def start_exporters(agent: str) -> None:
+    """
+    Starts the exporters configured by METRICS_PORT and METRICS_TEXTFILE (once per process).
+
+    Only long-lived agents call this. A port that is already in use is
+    logged rather than raised, so metrics never stop an agent from running.
+
+    Args:
+        agent: Name of the running agent, used for its textfile
+    """
+    with _registry_lock:
+        if METRICS_PORT and "http" not in _exporters:
+            try:
+                _exporters["http"] = start_http_server(METRICS_PORT, METRICS_ADDR)
+                print(f"[Metrics] Serving http://{METRICS_ADDR}:{METRICS_PORT}/metrics")
+            except OSError as e:
+                _exporters["http"] = None
+                print(f"[Metrics] Could not serve on {METRICS_ADDR}:{METRICS_PORT}, /metrics disabled: {e}")
+        if METRICS_TEXTFILE and "textfile" not in _exporters:
+            thread = threading.Thread(
+                target=_textfile_loop, args=(METRICS_TEXTFILE, agent, METRICS_TEXTFILE_INTERVAL),
+                name="metrics-textfile", daemon=True
+            )
+            thread.start()
+            _exporters["textfile"] = thread
+            atexit.register(_write_textfile_logged, METRICS_TEXTFILE, agent)
+            print(f"[Metrics] Writing {textfile_path(agent)} every {METRICS_TEXTFILE_INTERVAL:g}s")
@@ -0,0 +1,445 @@
+"""
+Outbox - Durable, rate-limited delivery for Gmail drafts and social posts
+
+Outgoing calls are written to disk as messages and sent by background
+workers, so callers never wait on an API. Each destination has a token
+bucket sized to its quota; failures that are worth retrying (429s, 5xx,
+dropped connections) are rescheduled with exponential backoff and full
+jitter, and anything that keeps failing or is rejected outright is moved to
+a dead-letter file.
+
+Message files live in OUTBOX_DIR/pending, named by their due time so the
+earliest message is found without reading the others. A worker claims a
+message by renaming it into OUTBOX_DIR/inflight; claims left behind by a
+process that died are returned to pending when workers start.
+
+Token buckets are kept in OUTBOX_DIR/buckets under a file lock
+(utils/file_lock.py), so every process sending to a destination draws
+from the same quota.
+"""
+import contextlib
+import glob
+import hashlib
+import importlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from utils import metrics
+from utils.file_lock import locked
+
+
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "outbox")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "900"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv("OUTBOX_DRAIN_TIMEOUT", "300"))
+
+# Destination -> sender, as "module:function" (imported on first send) or a callable.
+# A sender is called with the message payload as keyword arguments and returns the
+# usual {"status": ...} dict, with "retryable" (and optionally "retry_after" seconds)
+# set on failures that may succeed later.
+SENDERS: Dict[str, Union[str, Callable[..., Dict[str, Any]]]] = {
+    "gmail": "agents.caseworker:send_case_draft",
+    "twitter": "utils.publisher:post_to_twitter",
+    "linkedin": "utils.publisher:post_to_linkedin"
+}
+
+# Destination -> (requests, per seconds). Gmail allows 250 quota units per user per
+# second and drafts.create costs 10; X's free tier allows 17 posts per 24 hours;
+# LinkedIn allows 150 member posts per day. Override with e.g. OUTBOX_RATE_TWITTER=100/86400
+RATE_LIMITS = {
+    "gmail": (25, 1),
+    "twitter": (17, 86400),
+    "linkedin": (150, 86400)
+}
+
+_lock = threading.Lock()
+_stop = threading.Event()
+_workers: Dict[str, List[threading.Thread]] = {}
+# (outbox directory, destination) -> bucket
+_buckets: Dict[tuple, "TokenBucket"] = {}
+_stats = {"sent": 0, "retried": 0, "dead_lettered": 0}
+
+
+class TokenBucket:
+    """
+    Token bucket whose reserve() never blocks. With a path, its state lives
+    in that file and is shared by every process using it; without one it
+    is private to this process.
+    """
+
+    def __init__(self, rate: float, capacity: float, path: Optional[str] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.path = path
+        self.tokens = capacity
+        self.updated = time.time()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _state(self) -> Iterator[None]:
+        """Holds the bucket's lock with its state loaded, and saves the state afterwards"""
+        if not self.path:
+            with self._lock:
+                yield
+            return
+        with locked(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    state = json.load(f)
+                self.tokens, self.updated, self.paused_until = (
+                    state["tokens"], state["updated"], state["paused_until"]
+                )
+            except (OSError, ValueError, KeyError):
+                pass
+            yield
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"tokens": self.tokens, "updated": self.updated, "paused_until": self.paused_until}, f)
+            os.replace(tmp_path, self.path)
+
+    def reserve(self) -> float:
+        """Takes a token if one is available; otherwise returns seconds until one will be"""
+        with self._state():
+            now = time.time()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.tokens = min(self.capacity, self.tokens + max(now - self.updated, 0) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Holds back every sender of the destination, e.g. after a 429 with Retry-After"""
+        with self._state():
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+
+def _rate_limit(destination: str) -> tuple:
+    override = os.getenv(f"OUTBOX_RATE_{destination.upper()}")
+    if override:
+        count, period = override.split("/")
+        return float(count), float(period)
+    return RATE_LIMITS.get(destination, (1, 1))
+
+
+def get_bucket(destination: str) -> TokenBucket:
+    """Returns the token bucket for a destination, shared by every process using OUTBOX_DIR"""
+    with _lock:
+        bucket = _buckets.get((OUTBOX_DIR, destination))
+        if bucket is None:
+            count, period = _rate_limit(destination)
+            bucket = _buckets[(OUTBOX_DIR, destination)] = TokenBucket(
+                count / period, max(count, 1), os.path.join(_dir("buckets"), f"{destination}.json")
+            )
+        return bucket
+
+
+def _dir(name: str) -> str:
+    path = os.path.join(OUTBOX_DIR, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _message_path(message: Dict[str, Any]) -> str:
+    due_ms = int(message["next_attempt_at"] * 1000)
+    return os.path.join(_dir("pending"), f"{due_ms:015d}.{message['destination']}.{message['id']}.json")
+
+
+def _write_message(message: Dict[str, Any]) -> None:
+    path = _message_path(message)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(message, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def _list(name: str) -> List[str]:
+    """Lists a state directory without creating it (for read-only callers)"""
+    try:
+        return os.listdir(os.path.join(OUTBOX_DIR, name))
+    except FileNotFoundError:
+        return []
+
+
+def _find(destination: str, message_id: str) -> List[str]:
+    pattern = f"*{destination}.{message_id}.json"
+    return (glob.glob(os.path.join(OUTBOX_DIR, "pending", pattern))
+            + glob.glob(os.path.join(OUTBOX_DIR, "inflight", pattern)))
+
+
+def enqueue(destination: str, payload: Dict[str, Any], key: Optional[str] = None, delay: float = 0) -> str:
+    """
+    Adds a message to the outbox.
+
+    Args:
+        destination: Destination name, one of SENDERS
+        payload: JSON-serializable keyword arguments for the destination's sender
+        key: Idempotency key; a message with the same key that is still
+            queued is not queued again (optional)
+        delay: Seconds before the first attempt (optional)
+
+    Returns:
+        The message ID
+    """
+    if destination not in SENDERS:
+        raise ValueError(f"Unknown outbox destination: {destination}")
+
+    message_id = hashlib.sha256(key.encode('utf-8')).hexdigest()[:24] if key else uuid.uuid4().hex
+    with _lock:
+        if key and _find(destination, message_id):
+            return message_id
+        _write_message({
+            "id": message_id,
+            "destination": destination,
+            "payload": payload,
+            "attempts": 0,
+            "next_attempt_at": time.time() + delay,
+            "created_at": datetime.utcnow().isoformat(),
+            "last_error": None
+        })
+    return message_id
+
+
+def _claim(destination: str) -> Optional[tuple]:
+    """Moves the earliest due message for a destination into inflight, returns (path, message)"""
+    pending_dir = _dir("pending")
+    now_ms = int(time.time() * 1000)
+    for name in sorted(os.listdir(pending_dir)):
+        if not name.endswith(".json"):
+            continue
+        due_ms, message_destination, _ = name.split(".", 2)
+        if int(due_ms) > now_ms:
+            break
+        if message_destination != destination:
+            continue
+        inflight_path = os.path.join(_dir("inflight"), f"{os.getpid()}.{name}")
+        try:
+            os.rename(os.path.join(pending_dir, name), inflight_path)
+        except FileNotFoundError:
+            # Another worker claimed it first
+            continue
+        with open(inflight_path, 'r') as f:
+            return inflight_path, json.load(f)
+    return None
+
+
+def _recover_inflight() -> None:
+    """Returns messages claimed by processes that are no longer running to pending"""
+    inflight_dir = _dir("inflight")
+    for name in os.listdir(inflight_dir):
+        pid, original = name.split(".", 1)
+        if int(pid) == os.getpid():
+            continue
+        try:
+            os.kill(int(pid), 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue
+        try:
+            os.rename(os.path.join(inflight_dir, name), os.path.join(_dir("pending"), original))
+        except FileNotFoundError:
+            pass
+
+
+def _resolve_sender(destination: str) -> Callable[..., Dict[str, Any]]:
+    sender = SENDERS[destination]
+    if isinstance(sender, str):
+        module_name, function_name = sender.split(":")
+        sender = getattr(importlib.import_module(module_name), function_name)
+    return sender
+
+
+def backoff_delay(attempts: int) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(max, base * 2^(attempts - 1))]"""
+    return random.uniform(0, min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1)))
+
+
+def _dead_letter(message: Dict[str, Any]) -> None:
+    with _lock:
+        with open(os.path.join(OUTBOX_DIR, "dead_letter.jsonl"), 'a') as f:
+            f.write(json.dumps(dict(message, dead_at=datetime.utcnow().isoformat()), default=str) + '\n')
+        _stats["dead_lettered"] += 1
+
+
+def _deliver(destination: str, inflight_path: str, message: Dict[str, Any]) -> None:
+    try:
+        result = _resolve_sender(destination)(**message["payload"])
+    except Exception as e:
+        result = {"status": "error", "message": str(e), "retryable": True}
+
+    message["attempts"] += 1
+    if result.get("status") == "success":
+        with _lock:
+            _stats["sent"] += 1
+        os.remove(inflight_path)
+        print(f"[Outbox] Sent {destination} message {message['id']}")
+        return
+
+    message["last_error"] = result.get("message")
+    if result.get("retryable") and message["attempts"] < OUTBOX_MAX_ATTEMPTS:
+        retry_after = float(result.get("retry_after") or 0)
+        if retry_after:
+            get_bucket(destination).pause(retry_after)
+        delay = max(backoff_delay(message["attempts"]), retry_after)
+        message["next_attempt_at"] = time.time() + delay
+        _write_message(message)
+        os.remove(inflight_path)
+        with _lock:
+            _stats["retried"] += 1
+        print(f"[Outbox] {destination} message {message['id']} failed "
+              f"(attempt {message['attempts']}), retrying in {delay:.1f}s: {message['last_error']}")
+        return
+
+    _dead_letter(message)
+    os.remove(inflight_path)
+    print(f"[Outbox] {destination} message {message['id']} moved to dead letters: {message['last_error']}")
+
+
+def _worker(destination: str) -> None:
+    bucket = get_bucket(destination)
+    while not _stop.is_set():
+        try:
+            claimed = _claim(destination)
+        except OSError as e:
+            print(f"[Outbox] Error reading outbox: {e}")
+            claimed = None
+        if not claimed:
+            _stop.wait(OUTBOX_POLL_INTERVAL)
+            continue
+
+        inflight_path, message = claimed
+        wait = bucket.reserve()
+        if wait > 0:
+            # Out of quota: hand the message back, due when the next token is,
+            # so drain() sees how long it really has to wait
+            message["next_attempt_at"] = time.time() + wait
+            _write_message(message)
+            os.remove(inflight_path)
+            continue
+        _deliver(destination, inflight_path, message)
+
+
+def start_workers(destinations: Optional[List[str]] = None, workers: Optional[int] = None) -> None:
+    """
+    Starts background workers that drain the outbox (idempotent per destination).
+
+    Args:
+        destinations: Destinations to serve (defaults to all of SENDERS)
+        workers: Worker threads per destination (defaults to OUTBOX_WORKERS)
+    """
+    _stop.clear()
+    _recover_inflight()
+    for destination in destinations or list(SENDERS):
+        with _lock:
+            if any(thread.is_alive() for thread in _workers.get(destination, [])):
+                continue
+            threads = [
+                threading.Thread(target=_worker, args=(destination,), name=f"outbox-{destination}-{i}", daemon=True)
+                for i in range(workers or OUTBOX_WORKERS)
+            ]
+            _workers[destination] = threads
+        for thread in threads:
+            thread.start()
+
+
+def stop_workers(timeout: float = 10) -> None:
+    """Stops all outbox workers; messages they had not sent stay queued"""
+    _stop.set()
+    with _lock:
+        threads = [thread for threads in _workers.values() for thread in threads]
+        _workers.clear()
+    for thread in threads:
+        thread.join(timeout)
+
+
+def queued(destinations: Optional[List[str]] = None) -> int:
+    """Returns how many messages are pending or in flight"""
+    count = 0
+    for state in ("pending", "inflight"):
+        for name in _list(state):
+            if name.endswith(".json") and (
+                not destinations or name.rsplit(".", 3)[-3] in destinations
+            ):
+                count += 1
+    return count
+
+
+def _next_due(destinations: Optional[List[str]] = None) -> Optional[float]:
+    """Returns when the earliest queued message is due (now if one is in flight), or None"""
+    if any(
+        name.endswith(".json") and (not destinations or name.rsplit(".", 3)[-3] in destinations)
+        for name in _list("inflight")
+    ):
+        return time.time()
+    for name in sorted(_list("pending")):
+        if not name.endswith(".json"):
+            continue
+        due_ms, destination, _ = name.split(".", 2)
+        if not destinations or destination in destinations:
+            return int(due_ms) / 1000
+    return None
+
+
+def drain(destinations: Optional[List[str]] = None, timeout: Optional[float] = None) -> bool:
+    """
+    Waits for running workers to empty the outbox.
+
+    Returns as soon as every message left is backing off past the deadline,
+    rather than waiting out the timeout for messages that cannot be sent
+    before it.
+
+    Args:
+        destinations: Only wait for these destinations (optional)
+        timeout: Seconds to wait at most (defaults to OUTBOX_DRAIN_TIMEOUT)
+
+    Returns:
+        True if nothing is left queued; messages still waiting on a backoff
+        or quota stay in the outbox for the next run
+    """
+    deadline = time.time() + (OUTBOX_DRAIN_TIMEOUT if timeout is None else timeout)
+    while True:
+        due = _next_due(destinations)
+        if due is None:
+            return True
+        if due > deadline or time.time() >= deadline:
+            return False
+        time.sleep(min(0.1, OUTBOX_POLL_INTERVAL))
+
+
+QUEUE_DEPTH = metrics.gauge(
+    "outbox_queue_depth", "Messages waiting in the outbox", ["destination"],
+    function=lambda: {destination: queued([destination]) for destination in SENDERS}
+)
+
+
+def get_outbox_stats() -> Dict[str, Any]:
+    """
+    Returns outbox statistics.
+
+    Returns:
+        Dictionary with queued counts per destination, dead letters on disk
+        and this process's sent/retried/dead-lettered counters
+    """
+    stats = dict(_stats)
+    stats["queued"] = {destination: queued([destination]) for destination in SENDERS}
+    dead_letter_path = os.path.join(OUTBOX_DIR, "dead_letter.jsonl")
+    if os.path.exists(dead_letter_path):
+        with open(dead_letter_path, 'r') as f:
+            stats["dead_letters"] = sum(1 for line in f if line.strip())
+    else:
+        stats["dead_letters"] = 0
+    return stats
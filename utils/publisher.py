@@ -0,0 +1,303 @@
+"""
+Publisher - Long-lived social media clients and concurrent posting
+
+One Twitter client and one LinkedIn session are kept per process, each on a
+pooled requests.Session with explicit connect/read timeouts. Connection
+failures are retried a couple of times before anything is sent; responses
+are never retried in-line, so a post is not duplicated and a rate limit
+never blocks. publish() posts to every platform at once, and hands rate
+limited or failed-but-retryable posts to the outbox, which retries them
+within each platform's quota.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import metrics
+from utils.outbox import enqueue, get_bucket
+
+if TYPE_CHECKING:
+    import tweepy
+
+
+TWITTER_API_BASE = os.getenv("TWITTER_API_BASE", "https://api.twitter.com")
+LINKEDIN_API_BASE = os.getenv("LINKEDIN_API_BASE", "https://api.linkedin.com/v2")
+
+PUBLISH_CONNECT_TIMEOUT = float(os.getenv("PUBLISH_CONNECT_TIMEOUT", "5"))
+PUBLISH_READ_TIMEOUT = float(os.getenv("PUBLISH_READ_TIMEOUT", "30"))
+# Retries of failed connections only; nothing has been posted when they happen
+PUBLISH_CONNECT_RETRIES = int(os.getenv("PUBLISH_CONNECT_RETRIES", "2"))
+
+# Responses worth retrying later (rate limits and server errors)
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# tweepy sends every request to this host
+_TWITTER_HOST = "https://api.twitter.com"
+
+_lock = threading.Lock()
+_clients: Dict[str, Any] = {}
+
+
+class PublisherSession(requests.Session):
+    """requests.Session with default timeouts, connection retries and an optional base URL rewrite"""
+
+    def __init__(self, rewrite_from: Optional[str] = None, rewrite_to: Optional[str] = None):
+        super().__init__()
+        self.rewrite_from = rewrite_from
+        self.rewrite_to = rewrite_to
+        retries = Retry(
+            total=PUBLISH_CONNECT_RETRIES,
+            connect=PUBLISH_CONNECT_RETRIES,
+            read=0,
+            status=0,
+            redirect=0,
+            backoff_factor=0.5
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retries)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        if self.rewrite_from and self.rewrite_to and url.startswith(self.rewrite_from):
+            url = self.rewrite_to + url[len(self.rewrite_from):]
+        kwargs.setdefault("timeout", (PUBLISH_CONNECT_TIMEOUT, PUBLISH_READ_TIMEOUT))
+        return super().request(method, url, *args, **kwargs)
+
+
+def get_twitter_client() -> Optional["tweepy.Client"]:
+    """
+    Returns the shared Twitter API v2 client, or None if credentials are missing.
+
+    The client is rebuilt only when the credentials in the environment change.
+    """
+    import tweepy
+
+    credentials = tuple(os.getenv(name) for name in (
+        "TWITTER_BEARER_TOKEN", "TWITTER_API_KEY", "TWITTER_API_SECRET",
+        "TWITTER_ACCESS_TOKEN", "TWITTER_ACCESS_TOKEN_SECRET"
+    ))
+    if not all(credentials[1:]):
+        return None
+
+    with _lock:
+        cached = _clients.get("twitter")
+        if cached and cached[0] == (credentials, TWITTER_API_BASE):
+            return cached[1]
+
+        bearer_token, api_key, api_secret, access_token, access_token_secret = credentials
+        client = tweepy.Client(
+            bearer_token=bearer_token,
+            consumer_key=api_key,
+            consumer_secret=api_secret,
+            access_token=access_token,
+            access_token_secret=access_token_secret,
+            # Rate limits are handled by the outbox instead of sleeping in this call
+            wait_on_rate_limit=False
+        )
+        client.session = PublisherSession(_TWITTER_HOST, TWITTER_API_BASE.rstrip("/"))
+        _clients["twitter"] = ((credentials, TWITTER_API_BASE), client)
+        return client
+
+
+def get_linkedin_session() -> requests.Session:
+    """Returns the shared LinkedIn API session"""
+    with _lock:
+        if "linkedin" not in _clients:
+            _clients["linkedin"] = PublisherSession()
+        return _clients["linkedin"]
+
+
+def reset_clients() -> None:
+    """Closes and forgets the shared clients (they are rebuilt on next use)"""
+    with _lock:
+        for client in _clients.values():
+            session = client[1].session if isinstance(client, tuple) else client
+            session.close()
+        _clients.clear()
+
+
+def post_to_twitter(message: str) -> dict:
+    """
+    Posts a message to Twitter/X using API v2.
+
+    Args:
+        message: Tweet text (max 280 characters)
+
+    Returns:
+        Dictionary with status and tweet ID
+    """
+    import tweepy
+
+    try:
+        client = get_twitter_client()
+        if client is None:
+            return {
+                "status": "error",
+                "message": "Twitter API credentials not configured"
+            }
+
+        # Post tweet
+        with metrics.api_call("twitter", "create_tweet"):
+            response = client.create_tweet(text=message)
+
+        return {
+            "status": "success",
+            "tweet_id": response.data['id'],
+            "message": f"Tweet posted successfully: {response.data['id']}"
+        }
+
+    except tweepy.TooManyRequests as e:
+        reset = e.response.headers.get("x-rate-limit-reset")
+        return {
+            "status": "error",
+            "message": f"Twitter rate limit reached: {str(e)}",
+            "retryable": True,
+            "retry_after": max(int(reset) - time.time(), 0) if reset else None
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error posting to Twitter: {str(e)}",
+            "retryable": isinstance(e, (tweepy.TwitterServerError, requests.ConnectionError, requests.Timeout))
+        }
+
+
+def post_to_linkedin(message: str) -> dict:
+    """
+    Posts a message to LinkedIn using API v2.
+
+    Note: LinkedIn API requires Partner Program approval and OAuth 2.0 authentication.
+    This is more complex than Twitter but reaches the target audience directly.
+
+    Args:
+        message: Post text (max 3000 characters)
+
+    Returns:
+        Dictionary with status and post ID
+    """
+    try:
+        # LinkedIn API credentials
+        access_token = os.getenv("LINKEDIN_ACCESS_TOKEN")
+        person_urn = os.getenv("LINKEDIN_PERSON_URN")  # Format: "urn:li:person:xxxxx"
+
+        if not access_token or not person_urn:
+            return {
+                "status": "error",
+                "message": "LinkedIn API credentials not configured. LinkedIn API requires Partner Program approval."
+            }
+
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+            "X-Restli-Protocol-Version": "2.0.0"
+        }
+
+        # LinkedIn post structure
+        post_data = {
+            "author": person_urn,
+            "lifecycleState": "PUBLISHED",
+            "specificContent": {
+                "com.linkedin.ugc.ShareContent": {
+                    "shareCommentary": {
+                        "text": message
+                    },
+                    "shareMediaCategory": "NONE"
+                }
+            },
+            "visibility": {
+                "com.linkedin.ugc.MemberNetworkVisibility": "PUBLIC"
+            }
+        }
+
+        with metrics.api_call("linkedin", "ugcPosts.create") as timer:
+            response = get_linkedin_session().post(f"{LINKEDIN_API_BASE}/ugcPosts", headers=headers, json=post_data)
+            if response.status_code != 201:
+                timer.outcome = "error"
+
+        if response.status_code == 201:
+            post_id = response.headers.get("X-LinkedIn-Id", "unknown")
+            return {
+                "status": "success",
+                "post_id": post_id,
+                "message": f"LinkedIn post created successfully: {post_id}"
+            }
+        else:
+            retry_after = response.headers.get("Retry-After", "")
+            return {
+                "status": "error",
+                "message": f"LinkedIn API error: {response.status_code} - {response.text}",
+                "retryable": response.status_code in RETRYABLE_STATUSES,
+                "retry_after": int(retry_after) if retry_after.isdigit() else None
+            }
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error posting to LinkedIn: {str(e)}",
+            "retryable": isinstance(e, (requests.ConnectionError, requests.Timeout))
+        }
+
+
+POSTS = metrics.counter("social_posts_total", "Daily stats posts by platform and result", ["platform", "status"])
+
+POSTERS = {
+    "twitter": post_to_twitter,
+    "linkedin": post_to_linkedin
+}
+
+
+def _publish_one(platform: str, message: str, key: Optional[str]) -> Dict[str, Any]:
+    wait = get_bucket(platform).reserve()
+    if wait > 0:
+        # Out of quota: the outbox posts it once the platform's bucket has a token again
+        result = {
+            "status": "queued",
+            "message": f"{platform} quota exhausted, posting in {wait:.0f}s",
+            "queued_as": enqueue(platform, {"message": message}, key=key, delay=wait)
+        }
+        POSTS.inc(platform=platform, status=result["status"])
+        return result
+    started = time.perf_counter()
+    result = POSTERS[platform](message)
+    result["elapsed"] = round(time.perf_counter() - started, 3)
+    if result.get("status") == "error" and result.get("retryable"):
+        # Rate limited or temporarily failing: the outbox retries it later
+        result["queued_as"] = enqueue(platform, {"message": message}, key=key)
+        result["status"] = "queued"
+    POSTS.inc(platform=platform, status=result["status"])
+    return result
+
+
+def publish(messages: Dict[str, str], key_prefix: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Posts messages to their platforms concurrently.
+
+    Args:
+        messages: Dictionary of platform ("twitter" / "linkedin") -> message text
+        key_prefix: Outbox dedup key prefix for posts that have to be retried
+            (the key is "<platform>:<key_prefix>")
+
+    Returns:
+        Dictionary of platform -> result; status is "success", "queued"
+        (handed to the outbox, with queued_as) or "error"
+    """
+    unknown = [platform for platform in messages if platform not in POSTERS]
+    if unknown:
+        raise ValueError(f"Unknown platforms: {unknown}")
+    if not messages:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=len(messages)) as pool:
+        futures = {
+            platform: pool.submit(
+                _publish_one, platform, message, f"{platform}:{key_prefix}" if key_prefix else None
+            )
+            for platform, message in messages.items()
+        }
+        return {platform: future.result() for platform, future in futures.items()}
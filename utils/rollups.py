@@ -0,0 +1,359 @@
+"""
+Rollups - Daily per-state, per-program totals maintained alongside shared_state.jsonl
+
+Processed cases are summed into buckets keyed by (date, state, program), with
+program "*" holding per-case totals. The rollups remember how far into
+shared_state.jsonl they have read, so each refresh only parses lines appended
+since the last one, and queries read a handful of buckets instead of the
+whole history.
+
+Unique workers are counted with HyperLogLog sketches of canonical LinkedIn
+identities, one pair per (date, state): "seen" covers every row and "helped"
+only processed cases. Counts for a window merge the window's sketches, so
+they take a few KB of sketch data however long the history is, with a
+relative standard error of ~1.6% (see utils/hyperloglog.py).
+
+Each day's buckets and sketches live in their own file under <stem>_rollups/,
+decoded on first use and cached until the file changes. A refresh rewrites
+only the days its new lines touch and a query reads only the days it
+covers, so the cost of an append does not grow with the history.
+<stem>_rollups.json just records the read offset.
+
+Refreshes hold a file lock (utils/file_lock.py), so processes take turns.
+Every day file records the offset of the last line applied to it, and a
+line is applied to a day only once: if a refresh is interrupted after
+writing some days, the next one reads from the old offset and skips what
+those days already have.
+"""
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+from utils.file_lock import locked
+from utils.hyperloglog import HLL_PRECISION, HyperLogLog, canonical_worker_id
+
+ALL_PROGRAMS = "*"
+# Bumped when the file layout changes; older files are rolled up again
+ROLLUP_VERSION = 3
+
+_lock = threading.Lock()
+# Rollup path -> (file signature, rollups)
+_loaded: Dict[str, tuple] = {}
+# Day file path -> (file signature, day with decoded sketches)
+_days: Dict[str, tuple] = {}
+
+
+def rollup_path(state_file: str) -> str:
+    """Returns the rollup file kept next to a shared state file"""
+    return f"{os.path.splitext(state_file)[0]}_rollups.json"
+
+
+def rollup_dir(state_file: str) -> str:
+    """Returns the directory of per-day rollups kept next to a shared state file"""
+    return f"{os.path.splitext(state_file)[0]}_rollups"
+
+
+def _day_path(state_file: str, day: str) -> str:
+    return os.path.join(rollup_dir(state_file), f"{day.replace('/', '-') or 'undated'}.json")
+
+
+def _empty_rollups() -> Dict[str, Any]:
+    return {"version": ROLLUP_VERSION, "offset": 0, "inode": None}
+
+
+def _empty_day() -> Dict[str, Any]:
+    return {"offset": 0, "totals": {}, "workers": {}}
+
+
+def _signature(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _load(state_file: str) -> Dict[str, Any]:
+    path = rollup_path(state_file)
+    signature = _signature(path)
+    cached = _loaded.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    try:
+        with open(path, 'r') as f:
+            rollups = json.load(f)
+    except (OSError, ValueError):
+        return _empty_rollups()
+    if rollups.get("version") != ROLLUP_VERSION:
+        return _empty_rollups()
+    _loaded[path] = (signature, rollups)
+    return rollups
+
+
+def _write_json(path: str, data: Any) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _save(state_file: str, rollups: Dict[str, Any]) -> None:
+    path = rollup_path(state_file)
+    _write_json(path, rollups)
+    _loaded[path] = (_signature(path), rollups)
+
+
+def load_day(state_file: str, day: str) -> Dict[str, Any]:
+    """
+    Returns one day's rollup, decoded once per version of its file.
+
+    Args:
+        state_file: Path of shared_state.jsonl
+        day: ISO date
+
+    Returns:
+        Dictionary with offset, totals (state -> program -> {"cases",
+        "amount"}) and workers (state -> {"seen", "helped"} sketches)
+    """
+    path = _day_path(state_file, day)
+    signature = _signature(path)
+    cached = _days.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    rollup = _empty_day()
+    if signature:
+        try:
+            with open(path, 'r') as f:
+                rollup = json.load(f)
+            rollup["workers"] = {
+                state: {kind: HyperLogLog.from_string(data) for kind, data in sketches.items()}
+                for state, sketches in rollup["workers"].items()
+            }
+        except (OSError, ValueError, KeyError):
+            rollup = _empty_day()
+    _days[path] = (signature, rollup)
+    return rollup
+
+
+def _save_day(state_file: str, day: str, rollup: Dict[str, Any]) -> None:
+    path = _day_path(state_file, day)
+    _write_json(path, dict(rollup, workers={
+        state: {kind: sketch.to_string() for kind, sketch in sketches.items()}
+        for state, sketches in rollup["workers"].items()
+    }))
+    _days[path] = (_signature(path), rollup)
+
+
+def _clear_days(state_file: str) -> None:
+    directory = rollup_dir(state_file)
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        _days.pop(path, None)
+        os.remove(path)
+
+
+def _add(bucket: Dict[str, Any], amount: float) -> None:
+    bucket["cases"] = bucket.get("cases", 0) + 1
+    bucket["amount"] = round(bucket.get("amount", 0) + amount, 2)
+
+
+def _sketch(rollup: Dict[str, Any], state: str, kind: str) -> HyperLogLog:
+    sketches = rollup["workers"].setdefault(state, {})
+    if kind not in sketches:
+        sketches[kind] = HyperLogLog(HLL_PRECISION)
+    return sketches[kind]
+
+
+def entry_day(entry: Dict[str, Any]) -> str:
+    """Returns the ISO date an entry is rolled up under"""
+    return str(entry.get("processed_at") or entry.get("timestamp") or "")[:10]
+
+
+def apply_entry(rollup: Dict[str, Any], entry: Dict[str, Any]) -> None:
+    """Adds one shared state entry to its day's rollup (only processed cases add amounts)"""
+    state = entry.get("state") or "unknown"
+    worker = canonical_worker_id(entry.get("linkedin_url") or "")
+    if worker:
+        _sketch(rollup, state, "seen").add(worker)
+
+    if entry.get("status") != "processed":
+        return
+    amount = entry.get("amount_unlocked")
+    if not isinstance(amount, (int, float)):
+        return
+
+    if worker:
+        _sketch(rollup, state, "helped").add(worker)
+    programs = rollup["totals"].setdefault(state, {})
+
+    _add(programs.setdefault(ALL_PROGRAMS, {}), amount)
+    program_amounts = entry.get("program_amounts") or {}
+    for program in entry.get("programs") or []:
+        _add(programs.setdefault(program, {}), program_amounts.get(program, 0))
+
+
+def refresh_rollups(state_file: str) -> Dict[str, Any]:
+    """
+    Brings the rollups up to date with the shared state file.
+
+    Only complete lines past the stored offset are read; a replaced or
+    truncated file is rolled up again from the start.
+
+    Args:
+        state_file: Path of shared_state.jsonl
+
+    Returns:
+        The rollups' offset and inode
+    """
+    with _lock, locked(rollup_path(state_file)):
+        rollups = _load(state_file)
+        if not os.path.exists(state_file):
+            return rollups
+
+        stat = os.stat(state_file)
+        if rollups["inode"] != stat.st_ino or stat.st_size < rollups["offset"]:
+            rollups = _empty_rollups()
+            rollups["inode"] = stat.st_ino
+            _clear_days(state_file)
+        if stat.st_size == rollups["offset"]:
+            return rollups
+
+        with open(state_file, 'rb') as f:
+            f.seek(rollups["offset"])
+            data = f.read()
+        # A line still being written is picked up on the next refresh
+        complete = data[:data.rfind(b'\n') + 1]
+        touched: Dict[str, Dict[str, Any]] = {}
+        try:
+            position = rollups["offset"]
+            for line in complete.splitlines(keepends=True):
+                position += len(line)
+                try:
+                    entry = json.loads(line)
+                    day = entry_day(entry)
+                except (ValueError, AttributeError):
+                    continue
+                if day not in touched:
+                    touched[day] = load_day(state_file, day)
+                rollup = touched[day]
+                # Already applied by a refresh that stopped before recording its offset
+                if position <= rollup["offset"]:
+                    continue
+                try:
+                    apply_entry(rollup, entry)
+                except AttributeError:
+                    pass
+                rollup["offset"] = position
+
+            for day, rollup in touched.items():
+                _save_day(state_file, day, rollup)
+            rollups["offset"] = position
+            _save(state_file, rollups)
+        except Exception:
+            # The decoded copies may be half-updated; reload from disk next time
+            _loaded.pop(rollup_path(state_file), None)
+            for day in touched:
+                _days.pop(_day_path(state_file, day), None)
+            raise
+        return rollups
+
+
+def query_rollups(
+    state_file: str,
+    start: date,
+    end: date,
+    state: Optional[str] = None,
+    program: str = ALL_PROGRAMS
+) -> Dict[str, Any]:
+    """
+    Sums buckets over a date range.
+
+    Args:
+        state_file: Path of shared_state.jsonl
+        start: First day (inclusive)
+        end: Last day (inclusive)
+        state: Only this state (optional)
+        program: Program to sum, or "*" for per-case totals
+
+    Returns:
+        Dictionary with cases, amount, by_state, by_program, and the
+        estimated unique_workers (processed), unique_workers_seen (any row)
+        and unique_workers_by_state (processed)
+    """
+    refresh_rollups(state_file)
+    totals = {"cases": 0, "amount": 0.0, "by_state": {}, "by_program": {}}
+    helped = HyperLogLog(HLL_PRECISION)
+    seen = HyperLogLog(HLL_PRECISION)
+    helped_by_state: Dict[str, HyperLogLog] = {}
+
+    day = start
+    while day <= end:
+        rollup = load_day(state_file, day.isoformat())
+        for bucket_state, programs in rollup["totals"].items():
+            if state and bucket_state != state:
+                continue
+            for bucket_program, bucket in programs.items():
+                if bucket_program == program:
+                    totals["cases"] += bucket["cases"]
+                    totals["amount"] += bucket["amount"]
+                    by_state = totals["by_state"].setdefault(bucket_state, {"cases": 0, "amount": 0.0})
+                    by_state["cases"] += bucket["cases"]
+                    by_state["amount"] = round(by_state["amount"] + bucket["amount"], 2)
+                if bucket_program != ALL_PROGRAMS:
+                    by_program = totals["by_program"].setdefault(bucket_program, {"cases": 0, "amount": 0.0})
+                    by_program["cases"] += bucket["cases"]
+                    by_program["amount"] = round(by_program["amount"] + bucket["amount"], 2)
+        for bucket_state, sketches in rollup["workers"].items():
+            if state and bucket_state != state:
+                continue
+            seen.merge(sketches["seen"])
+            if "helped" in sketches:
+                helped.merge(sketches["helped"])
+                helped_by_state.setdefault(bucket_state, HyperLogLog(HLL_PRECISION)).merge(sketches["helped"])
+        day += timedelta(days=1)
+
+    totals["amount"] = round(totals["amount"], 2)
+    totals["unique_workers"] = helped.count()
+    totals["unique_workers_seen"] = seen.count()
+    totals["unique_workers_by_state"] = {
+        bucket_state: sketch.count() for bucket_state, sketch in helped_by_state.items()
+    }
+    return totals
+
+
+def query_all_time_workers(state_file: str) -> Dict[str, int]:
+    """
+    Estimates unique workers over the whole history by merging every day's sketches.
+
+    Args:
+        state_file: Path of shared_state.jsonl
+
+    Returns:
+        Dictionary with unique_workers (processed) and unique_workers_seen (any row)
+    """
+    refresh_rollups(state_file)
+    helped = HyperLogLog(HLL_PRECISION)
+    seen = HyperLogLog(HLL_PRECISION)
+    directory = rollup_dir(state_file)
+    names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        day = name[:-len(".json")]
+        for sketches in load_day(state_file, "" if day == "undated" else day)["workers"].values():
+            seen.merge(sketches["seen"])
+            if "helped" in sketches:
+                helped.merge(sketches["helped"])
+    return {"unique_workers": helped.count(), "unique_workers_seen": seen.count()}
+
+
+def yesterday() -> date:
+    """Returns yesterday's date in UTC"""
+    return datetime.utcnow().date() - timedelta(days=1)
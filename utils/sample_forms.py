@@ -0,0 +1,29 @@
+"""
+Sample Forms - Generates fillable PDFs for tests and benchmarks
+
+Stand-ins for the state forms kept in Google Drive, so form filling and
+packet building can be exercised without credentials.
+"""
+
+
+def make_sample_form(path: str, page_fields: list) -> str:
+    """
+    Writes a fillable PDF with one text field per name.
+
+    Args:
+        path: Output path
+        page_fields: One list of text field names per page
+
+    Returns:
+        The output path
+    """
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(path)
+    for fields in page_fields:
+        for i, field_name in enumerate(fields):
+            c.drawString(50, 750 - i * 40, field_name)
+            c.acroForm.textfield(name=field_name, x=200, y=740 - i * 40, width=250, height=20)
+        c.showPage()
+    c.save()
+    return path
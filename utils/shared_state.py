@@ -4,7 +4,8 @@ Shared State Management - Handles shared_state.jsonl file operations
 import json
 import os
 from typing import List, Dict, Any, Optional
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from utils.rollups import query_all_time_workers, query_rollups, refresh_rollups, yesterday
 
 
 SHARED_STATE_FILE = "shared_state.jsonl"
@@ -29,6 +30,12 @@ def append_to_shared_state(data: Dict[str, Any]) -> bool:
         with open(SHARED_STATE_FILE, 'a') as f:
             f.write(json.dumps(data) + '\n')
         
+        # Keep the daily rollups current (reads only the line just written)
+        try:
+            refresh_rollups(SHARED_STATE_FILE)
+        except Exception as e:
+            print(f"Error updating rollups: {e}")
+        
         return True
     except Exception as e:
         print(f"Error appending to shared state: {e}")
@@ -68,6 +75,9 @@ def get_statistics() -> Dict[str, Any]:
     
     Returns:
         Dictionary with total_amount_unlocked, total_rows, etc.
+        total_rows counts every row; unique_workers (processed) and
+        unique_workers_seen (any row) are HyperLogLog estimates that count
+        each worker once, within ~1.6%.
     """
     entries = read_shared_state()
     
@@ -80,10 +90,37 @@ def get_statistics() -> Dict[str, Any]:
     return {
         "total_amount_unlocked": round(total_amount, 2),
         "total_rows": len(entries),
+        **query_all_time_workers(SHARED_STATE_FILE),
         "entries": entries
     }
 
 
+def get_period_statistics(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    state: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Returns processed-case totals for a date range from the daily rollups.
+    
+    Args:
+        start_date: First UTC day (defaults to yesterday)
+        end_date: Last UTC day, inclusive (defaults to start_date)
+        state: Only count this state (optional)
+    
+    Returns:
+        Dictionary with cases, amount, by_state and by_program
+    """
+    start_date = start_date or yesterday()
+    return query_rollups(SHARED_STATE_FILE, start_date, end_date or start_date, state=state)
+
+
+def get_last_days_statistics(days: int = 7) -> Dict[str, Any]:
+    """Returns processed-case totals for the last `days` full UTC days"""
+    end_date = yesterday()
+    return get_period_statistics(end_date - timedelta(days=days - 1), end_date)
+
+
 def mark_as_processed(linkedin_url: str) -> bool:
     """
     Marks an entry as processed (optional - could add status field)
@@ -0,0 +1,105 @@
+"""
+Step Graph - Runs a small dependency graph of steps on a thread pool
+
+Each step names the steps it depends on. A step is started as soon as all of
+its dependencies have finished, so independent steps (network waits in
+particular) overlap and the graph takes roughly as long as its critical path.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+Step = Tuple[List[str], Callable[[Dict[str, Any]], Any]]
+
+
+def _timed(func: Callable[[Dict[str, Any]], Any], inputs: Dict[str, Any]) -> Tuple[Any, float, float]:
+    start = time.perf_counter()
+    result = func(inputs)
+    return result, start, time.perf_counter()
+
+
+def critical_path(steps: Dict[str, Step], timings: Dict[str, Dict[str, float]]) -> List[str]:
+    """Returns the chain of steps that determined when the graph finished"""
+    if not timings:
+        return []
+    path = [max(timings, key=lambda name: timings[name]["end"])]
+    while steps[path[-1]][0]:
+        path.append(max(steps[path[-1]][0], key=lambda name: timings[name]["end"]))
+    return list(reversed(path))
+
+
+def run_step_graph(steps: Dict[str, Step], max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Runs steps concurrently, each once its dependencies are done.
+
+    Args:
+        steps: Dictionary of step name -> (dependency names, func); func is
+            called with a dictionary of dependency name -> result
+        max_workers: Thread pool size (defaults to one thread per step)
+
+    Returns:
+        Dictionary with "results" (step -> result), "timings" (step ->
+        start/end/duration in seconds from the graph start), "elapsed" and
+        "critical_path"
+
+    Raises:
+        ValueError: If a dependency is unknown or the steps form a cycle
+        Exception: The first exception raised by a step; steps that depend
+            on it are not started
+    """
+    for name, (deps, _) in steps.items():
+        unknown = [dep for dep in deps if dep not in steps]
+        if unknown:
+            raise ValueError(f"Step {name} depends on unknown steps: {unknown}")
+
+    waiting = dict(steps)
+    results: Dict[str, Any] = {}
+    timings: Dict[str, Dict[str, float]] = {}
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(steps), 1)) as pool:
+        running = {}
+
+        def submit_ready():
+            for name, (deps, func) in list(waiting.items()):
+                if all(dep in results for dep in deps):
+                    del waiting[name]
+                    future = pool.submit(_timed, func, {dep: results[dep] for dep in deps})
+                    running[future] = name
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                result, start, end = future.result()
+                results[name] = result
+                timings[name] = {
+                    "start": start - started,
+                    "end": end - started,
+                    "duration": end - start
+                }
+            submit_ready()
+
+    if waiting:
+        raise ValueError(f"Steps form a cycle: {sorted(waiting)}")
+
+    return {
+        "results": results,
+        "timings": timings,
+        "elapsed": time.perf_counter() - started,
+        "critical_path": critical_path(steps, timings)
+    }
+
+
+def format_timings(report: Dict[str, Any]) -> str:
+    """Formats a run_step_graph report as one line of per-step timings"""
+    timings = report["timings"]
+    steps = ", ".join(
+        f"{name} {timing['duration']:.2f}s"
+        for name, timing in sorted(timings.items(), key=lambda item: item[1]["start"])
+    )
+    serial = sum(timing["duration"] for timing in timings.values())
+    return (f"{steps} | total {report['elapsed']:.2f}s (serial {serial:.2f}s), "
+            f"critical path: {' -> '.join(report['critical_path'])}")
@@ -0,0 +1,284 @@
+"""
+Template Cache - Content-addressed local cache for blank PDF form templates
+
+Blank state forms rarely change, so instead of re-downloading them for every
+case we keep one copy per file content on disk (keyed by the Drive
+md5Checksum) and an index that maps Drive file IDs to those blobs. A folder
+listing is only revalidated against Drive once per TTL window.
+
+Updates to the index hold a file lock (utils/file_lock.py), so agents in
+different processes do not overwrite each other's entries.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils import metrics
+from utils.file_lock import locked
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", ".cache/templates")
+TEMPLATE_CACHE_TTL = int(os.getenv("TEMPLATE_CACHE_TTL", "3600"))
+
+# ioctl that clones a file's extents on copy-on-write filesystems (Btrfs, XFS)
+FICLONE = 0x40049409
+
+
+def _index_path() -> str:
+    return os.path.join(TEMPLATE_CACHE_DIR, "index.json")
+
+
+def _empty_index() -> Dict[str, Any]:
+    return {
+        "files": {},
+        "listings": {},
+        "stats": {
+            "hits": 0,
+            "misses": 0,
+            "bytes_saved": 0,
+            "bytes_downloaded": 0,
+            "revalidations": 0
+        }
+    }
+
+
+def _load_index() -> Dict[str, Any]:
+    index = _empty_index()
+    try:
+        with open(_index_path(), 'r') as f:
+            stored = json.load(f)
+        for key in index:
+            index[key].update(stored.get(key, {}))
+    except (OSError, ValueError):
+        pass
+    return index
+
+
+def _save_index(index: Dict[str, Any]) -> None:
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{_index_path()}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, _index_path())
+
+
+def _listing_key(folder_id: str, state: str) -> str:
+    return f"{folder_id}|{state.upper()}"
+
+
+def blob_path(md5: str) -> str:
+    """Returns the content-addressed path for a blob with the given md5"""
+    return os.path.join(TEMPLATE_CACHE_DIR, "objects", md5[:2], f"{md5}.pdf")
+
+
+def staging_dir() -> str:
+    """Returns the directory downloads are staged in before store() (same filesystem as the blobs)"""
+    path = os.path.join(TEMPLATE_CACHE_DIR, "staging")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_md5(path: str) -> str:
+    """Computes the md5 hex digest of a file, matching Drive's md5Checksum"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_fresh_listing(folder_id: str, state: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Returns the cached file records for a folder/state listing if it was
+    revalidated within the TTL window and all its blobs are still on disk.
+
+    Args:
+        folder_id: Google Drive folder ID
+        state: Two-letter state abbreviation
+
+    Returns:
+        List of file records, or None if the listing must be revalidated
+    """
+    index = _load_index()
+    listing = index["listings"].get(_listing_key(folder_id, state))
+    if not listing or time.time() - listing["checked_at"] > TEMPLATE_CACHE_TTL:
+        return None
+
+    records = []
+    for file_id in listing["file_ids"]:
+        record = index["files"].get(file_id)
+        if not record or not os.path.exists(blob_path(record["md5"])):
+            return None
+        records.append(dict(record, id=file_id))
+    return records
+
+
+def lookup_many(file_metas: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Finds cached records that are still current for a listing of Drive
+    files, reading the index once.
+
+    A record is current when its md5Checksum matches, or, for files Drive
+    does not checksum, when its modifiedTime matches.
+
+    Args:
+        file_metas: Drive file resources with id, md5Checksum and modifiedTime
+
+    Returns:
+        Cached file records by file ID; misses are left out
+    """
+    files = _load_index()["files"]
+    records = {}
+    for file_meta in file_metas:
+        record = files.get(file_meta["id"])
+        if not record or not os.path.exists(blob_path(record["md5"])):
+            continue
+        if file_meta.get("md5Checksum"):
+            current = record["md5"] == file_meta["md5Checksum"]
+        else:
+            current = record.get("modified_time") == file_meta.get("modifiedTime")
+        if current:
+            records[file_meta["id"]] = dict(record, id=file_meta["id"])
+    return records
+
+
+def lookup(file_meta: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Finds a cached record that is still current for Drive file metadata.
+
+    Args:
+        file_meta: Drive file resource with id, md5Checksum and modifiedTime
+
+    Returns:
+        Cached file record, or None on a miss
+    """
+    return lookup_many([file_meta]).get(file_meta["id"])
+
+
+def store(file_meta: Dict[str, Any], downloaded_path: str) -> Dict[str, Any]:
+    """
+    Moves a freshly downloaded file into the content-addressed store.
+
+    Args:
+        file_meta: Drive file resource the download came from
+        downloaded_path: Path of the downloaded file (consumed)
+
+    Returns:
+        The new cache record for the file
+    """
+    md5 = file_md5(downloaded_path)
+    target = blob_path(md5)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        os.remove(downloaded_path)
+    else:
+        os.replace(downloaded_path, target)
+
+    record = {
+        "name": file_meta["name"],
+        "md5": md5,
+        "modified_time": file_meta.get("modifiedTime"),
+        "size": os.path.getsize(target)
+    }
+    with locked(_index_path()):
+        index = _load_index()
+        index["files"][file_meta["id"]] = record
+        _save_index(index)
+    return dict(record, id=file_meta["id"])
+
+
+def record_listing(folder_id: str, state: str, file_ids: List[str]) -> None:
+    """Marks a folder/state listing as revalidated now"""
+    with locked(_index_path()):
+        index = _load_index()
+        index["listings"][_listing_key(folder_id, state)] = {
+            "checked_at": time.time(),
+            "file_ids": file_ids
+        }
+        index["stats"]["revalidations"] += 1
+        _save_index(index)
+
+
+def record_usage(hits: List[Dict[str, Any]], misses: List[Dict[str, Any]]) -> None:
+    """Updates hit/miss and byte counters for one cache lookup round"""
+    if not hits and not misses:
+        return
+    with locked(_index_path()):
+        index = _load_index()
+        stats = index["stats"]
+        stats["hits"] += len(hits)
+        stats["misses"] += len(misses)
+        stats["bytes_saved"] += sum(r.get("size", 0) for r in hits)
+        stats["bytes_downloaded"] += sum(r.get("size", 0) for r in misses)
+        _save_index(index)
+
+
+def _clone_file(source: str, target: str) -> None:
+    """Copies source to target, sharing its blocks where the filesystem supports reflinks"""
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def materialize(record: Dict[str, Any], output_dir: str) -> str:
+    """
+    Places a copy of a cached template at output_dir/<name>, reflinked
+    where the filesystem supports it. The copy is independent of the blob,
+    so writing to it cannot corrupt the cache.
+
+    Args:
+        record: Cache record returned by lookup/store/get_fresh_listing
+        output_dir: Directory the caller expects the form in
+
+    Returns:
+        Local path of the template
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    target = os.path.join(output_dir, record["name"])
+    if os.path.exists(target) and os.path.getsize(target) == record.get("size") \
+            and file_md5(target) == record["md5"]:
+        return target
+
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        _clone_file(blob_path(record["md5"]), tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return target
+
+
+HIT_RATIO = metrics.gauge(
+    "template_cache_hit_ratio", "Share of form template lookups served from the local cache",
+    function=lambda: get_cache_stats()["hit_ratio"]
+)
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Returns template cache statistics.
+
+    Returns:
+        Dictionary with hits, misses, hit_ratio, bytes_saved, etc.
+    """
+    index = _load_index()
+    stats = dict(index["stats"])
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["cached_files"] = len(index["files"])
+    return stats